@@ -42,7 +42,7 @@ public class MainActivity extends AppCompatActivity {
     }
     
     private void setupRetrofit() {
-        apiService = ApiClient.getClient().create(ApiService.class);
+        apiService = ApiClient.getClient(getApplicationContext()).create(ApiService.class);
     }
     
     private void checkIfLoggedIn() {
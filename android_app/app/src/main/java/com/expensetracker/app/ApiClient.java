@@ -1,5 +1,10 @@
 package com.expensetracker.app;
 
+import android.content.Context;
+
+import java.io.File;
+
+import okhttp3.Cache;
 import okhttp3.OkHttpClient;
 import okhttp3.logging.HttpLoggingInterceptor;
 import retrofit2.Retrofit;
@@ -9,18 +14,28 @@ public class ApiClient {
     
     // Replace with your Django server URL
     private static final String BASE_URL = "http://10.0.2.2:8000/"; // Emulator localhost
+    private static final long HTTP_CACHE_SIZE = 10L * 1024 * 1024;
     private static Retrofit retrofit = null;
     
     public static Retrofit getClient() {
+        return getClient(null);
+    }
+    
+    // With a context, responses are kept in an HTTP cache and revalidated with
+    // If-None-Match, so unchanged data comes back as a bodiless 304.
+    public static Retrofit getClient(Context context) {
         if (retrofit == null) {
             
             // Add logging interceptor for debugging
             HttpLoggingInterceptor logging = new HttpLoggingInterceptor();
             logging.setLevel(HttpLoggingInterceptor.Level.BODY);
             
-            OkHttpClient client = new OkHttpClient.Builder()
-                    .addInterceptor(logging)
-                    .build();
+            OkHttpClient.Builder builder = new OkHttpClient.Builder()
+                    .addInterceptor(logging);
+            if (context != null) {
+                builder.cache(new Cache(new File(context.getCacheDir(), "http"), HTTP_CACHE_SIZE));
+            }
+            OkHttpClient client = builder.build();
             
             retrofit = new Retrofit.Builder()
                     .baseUrl(BASE_URL)
@@ -9,6 +9,7 @@ import retrofit2.http.Header;
 import retrofit2.http.POST;
 import retrofit2.http.PUT;
 import retrofit2.http.Path;
+import retrofit2.http.Query;
 
 public interface ApiService {
     
@@ -25,5 +26,17 @@ public interface ApiService {
     
     // Expenses
     @GET("api/expenses/")
-    Call<List<Expense>> getExpenses(@Header("Authorization") String token);
+    Call<ExpensePage> getExpenses(@Header("Authorization") String token,
+                                  @Query("cursor") String cursor,
+                                  @Query("limit") Integer limit);
+    
+    // Filtered and trimmed, e.g. fields = "id,description,amount,date"
+    @GET("api/expenses/")
+    Call<ExpensePage> getExpenses(@Header("Authorization") String token,
+                                  @Query("cursor") String cursor,
+                                  @Query("limit") Integer limit,
+                                  @Query("start_date") String startDate,
+                                  @Query("end_date") String endDate,
+                                  @Query("category") Integer category,
+                                  @Query("fields") String fields);
 }
\ No newline at end of file
@@ -56,7 +56,7 @@ public class DashboardActivity extends AppCompatActivity {
         fabAddExpense = findViewById(R.id.fab_add_expense);
         
         sharedPreferences = getSharedPreferences("ExpenseTracker", MODE_PRIVATE);
-        apiService = ApiClient.getClient().create(ApiService.class);
+        apiService = ApiClient.getClient(getApplicationContext()).create(ApiService.class);
         
         // Set username
         String username = sharedPreferences.getString("username", "User");
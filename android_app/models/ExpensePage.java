@@ -0,0 +1,18 @@
+package com.expensetracker.app;
+
+import com.google.gson.annotations.SerializedName;
+
+import java.util.List;
+
+// One page of GET api/expenses/; pass nextCursor back as `cursor` for the next page
+public class ExpensePage {
+    private String next;
+    @SerializedName("next_cursor")
+    private String nextCursor;
+    private List<Expense> results;
+    
+    public String getNext() { return next; }
+    public String getNextCursor() { return nextCursor; }
+    public List<Expense> getResults() { return results; }
+    public boolean hasMore() { return nextCursor != null; }
+}
@@ -1,8 +1,27 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.contrib import messages
+from django.utils import timezone
+from expenses import dashboard_cache
+from users.models import DataVersion
 from .models import Budget, MonthlyBudget
 
+
+def set_active(queryset, active):
+    """Activate or deactivate budgets in one UPDATE; return how many were changed.
+
+    update() skips auto_now and the model signals, so updated_at is stamped for
+    delta sync and the cached dashboards and data versions are invalidated here.
+    """
+    months_by_user = {}
+    for user_id, month in queryset.values_list('user_id', 'month'):
+        months_by_user.setdefault(user_id, set()).add(month)
+    updated = queryset.update(active=active, updated_at=timezone.now())
+    for user_id, months in months_by_user.items():
+        dashboard_cache.invalidate_months(user_id, months)
+    DataVersion.bump(months_by_user)
+    return updated
+
 class MonthlyBudgetInline(admin.TabularInline):
     model = MonthlyBudget
     extra = 1
@@ -55,12 +74,12 @@ class BudgetAdmin(admin.ModelAdmin):
     duplicate_budget.short_description = "Duplicate selected budgets"
 
     def activate_budgets(self, request, queryset):
-        updated = queryset.update(active=True)
+        updated = set_active(queryset, True)
         messages.success(request, f'{updated} budgets have been activated.')
     activate_budgets.short_description = "Activate selected budgets"
 
     def deactivate_budgets(self, request, queryset):
-        updated = queryset.update(active=False)
+        updated = set_active(queryset, False)
         messages.success(request, f'{updated} budgets have been deactivated.')
     deactivate_budgets.short_description = "Deactivate selected budgets"
 
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0004_monthlybudget_budget'),
+        ('expenses', '0009_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['user', 'month'], name='budget_user_month_idx'),
+        ),
+    ]
@@ -20,22 +20,19 @@ class Budget(models.Model):
     notifications = models.BooleanField(default=False)
     recurrence = models.CharField(max_length=10, choices=RECURRENCE_CHOICES, default='one-time')
     active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'month'], name='budget_user_month_idx'),
+            models.Index(fields=['user', 'updated_at'], name='budget_user_updated_idx'),
+        ]
 
     def get_total_expenses(self):
         # Import here to avoid circular import
-        from expenses.models import Expense
-        month_start = self.month.replace(day=1)
-        if self.month.month == 12:
-            next_month = self.month.replace(year=self.month.year + 1, month=1, day=1)
-        else:
-            next_month = self.month.replace(month=self.month.month + 1, day=1)
-        
-        return Expense.objects.filter(
-            user=self.user,
-            category=self.category,
-            date__gte=month_start,
-            date__lt=next_month
-        ).aggregate(models.Sum('amount'))['amount__sum'] or 0
+        from expenses.rollups import month_total
+        return month_total(self.user, self.month, category=self.category)
 
     def __str__(self):
         return f"{self.user.username} - {self.category.name} - {self.month}"
@@ -49,18 +46,8 @@ class MonthlyBudget(models.Model):
 
     def get_monthly_expenses(self):
         # Import here to avoid circular import
-        from expenses.models import Expense
-        month_start = self.month.replace(day=1)
-        if self.month.month == 12:
-            next_month = self.month.replace(year=self.month.year + 1, month=1, day=1)
-        else:
-            next_month = self.month.replace(month=self.month.month + 1, day=1)
-        
-        return Expense.objects.filter(
-            user=self.user,
-            date__gte=month_start,
-            date__lt=next_month
-        ).aggregate(models.Sum('amount'))['amount__sum'] or 0
+        from expenses.rollups import month_total
+        return month_total(self.user, self.month)
 
     def __str__(self):
         return f"{self.category} - {self.month.strftime('%B %Y')}"
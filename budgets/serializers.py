@@ -0,0 +1,7 @@
+from rest_framework import serializers
+from .models import Budget
+
+class BudgetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Budget
+        fields = ['id', 'category', 'limit', 'month', 'description', 'color', 'notifications', 'recurrence', 'active']
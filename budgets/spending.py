@@ -0,0 +1,65 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from expenses.models import MonthlyCategoryRollup
+from expenses.timeseries import add_months
+from .models import Budget
+
+
+class BudgetSpending:
+    """Budget limits and actual spending per (category, month) for one user.
+
+    Built by `budget_vs_actual`; every lookup is answered from memory. Monthly
+    spending across all categories comes from expenses.timeseries.series.
+    """
+
+    def __init__(self, limits, spending):
+        # {(category_id, month): Decimal}
+        self.limits = limits
+        # {(category_id, month): (total, count)}
+        self.spending = spending
+
+        self._limit_by_month = defaultdict(Decimal)
+        for (_, month), limit in limits.items():
+            self._limit_by_month[month] += limit
+
+    def spent(self, month, category_id):
+        return self.spending.get((category_id, month), (0, 0))[0]
+
+    def limit(self, month, category_id=None):
+        if category_id is None:
+            return self._limit_by_month.get(month, 0)
+        return self.limits.get((category_id, month), 0)
+
+    def has_budget(self, month, category_id):
+        return (category_id, month) in self.limits
+
+
+def budget_vs_actual(user, first_month, last_month):
+    """Resolve budgeted and spent amounts for every (category, month) in a range.
+
+    Uses one grouped query over budgets and one over the monthly spending
+    rollup, however many budgets, categories or months are involved.
+    """
+    first_month = first_month.replace(day=1)
+    last_month = last_month.replace(day=1)
+
+    # Filter on the raw column so the (user, month) index applies
+    budget_rows = (
+        Budget.objects.filter(user=user, month__gte=first_month, month__lt=add_months(last_month, 1))
+        .annotate(budget_month=TruncMonth('month'))
+        .values('category_id', 'budget_month')
+        .annotate(total_limit=Sum('limit'))
+        .order_by()
+    )
+    limits = {(row['category_id'], row['budget_month']): row['total_limit'] for row in budget_rows}
+
+    rollup_rows = MonthlyCategoryRollup.objects.filter(
+        user=user, month__gte=first_month, month__lte=last_month
+    ).values_list('category_id', 'month', 'total', 'count')
+    spending = {(category_id, month): (total, count) for category_id, month, total, count in rollup_rows}
+
+    return BudgetSpending(limits, spending)
@@ -1,3 +1,78 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from expenses.models import Category, Expense
+from users.models import DataVersion
+from .models import Budget
+from .spending import budget_vs_actual
+
+
+class BudgetVsActualTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('carol', password='secret')
+
+    def seed(self, count, month=date(2024, 5, 1)):
+        for i in range(count):
+            category = Category.objects.create(user=self.user, name=f'Category {i}')
+            for offset in range(4):
+                budget_month = date(month.year, month.month - offset, 1)
+                Budget.objects.create(user=self.user, category=category, limit=Decimal('100.00'), month=budget_month)
+                Expense.objects.create(user=self.user, category=category, amount=Decimal('80.00'),
+                                       description='Test expense', date=budget_month.replace(day=12))
+
+    def test_resolves_spent_and_limit_per_category_and_month(self):
+        food = Category.objects.create(user=self.user, name='Food')
+        Budget.objects.create(user=self.user, category=food, limit=Decimal('200.00'), month=date(2024, 4, 15))
+        Expense.objects.create(user=self.user, category=food, amount=Decimal('50.00'),
+                               description='Groceries', date=date(2024, 4, 2))
+        Expense.objects.create(user=self.user, category=None, amount=Decimal('5.00'),
+                               description='Misc', date=date(2024, 4, 3))
+
+        with self.assertNumQueries(2):
+            spending = budget_vs_actual(self.user, date(2024, 1, 1), date(2024, 6, 1))
+
+        april = date(2024, 4, 1)
+        self.assertEqual(spending.limit(april, food.id), Decimal('200.00'))
+        self.assertEqual(spending.spent(april, food.id), Decimal('50.00'))
+        self.assertTrue(spending.has_budget(april, food.id))
+        self.assertFalse(spending.has_budget(date(2024, 5, 1), food.id))
+
+    def test_budget_list_query_count_does_not_grow_with_budgets(self):
+        self.client.force_login(self.user)
+        url = reverse('budget_list') + '?month=2024-05'
+
+        self.seed(2)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.seed(30)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class BudgetAdminActionTests(TestCase):
+    def test_deactivating_stamps_budgets_and_bumps_the_data_version(self):
+        user = User.objects.create_user('dan', password='secret')
+        food = Category.objects.create(user=user, name='Food')
+        budget = Budget.objects.create(user=user, category=food, limit=Decimal('100.00'), month=date(2024, 5, 1))
+        Budget.objects.filter(pk=budget.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        budget.refresh_from_db()
+        version = DataVersion.for_user(user).version
+
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'secret'))
+        self.client.post(reverse('admin:budgets_budget_changelist'),
+                         {'action': 'deactivate_budgets', '_selected_action': [budget.pk]})
 
-# Create your tests here.
+        changed = Budget.objects.get(pk=budget.pk)
+        self.assertFalse(changed.active)
+        self.assertGreater(changed.updated_at, budget.updated_at)
+        self.assertGreater(DataVersion.for_user(user).version, version)
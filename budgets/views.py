@@ -3,11 +3,13 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import BudgetForm
 from .models import Budget
-from expenses.models import Expense, Category
-from django.db.models import Sum, Count, Avg, F, ExpressionWrapper, DecimalField, Q
+from .spending import budget_vs_actual
+from expenses.models import Category
+from expenses import timeseries
+from expenses.timeseries import add_months
+from users.models import ExpenseAnomaly
 from django.utils import timezone
-from datetime import datetime, timedelta
-import calendar
+from datetime import datetime
 import json
 import random
 from decimal import Decimal
@@ -38,41 +40,33 @@ def budget_list(request):
         selected_month = current_month
     
     # Get active budgets for the selected month
-    budgets = Budget.objects.filter(
+    budgets = list(Budget.objects.filter(
         user=request.user,
         month__year=selected_month.year,
         month__month=selected_month.month,
         active=True
-    ).select_related('category')
+    ).select_related('category'))
+    
+    # Monthly spending for the trend window, and budgeted and spent amounts per category, in a few grouped queries
+    trend = timeseries.series(request.user, selected_month, 6)
+    spending = budget_vs_actual(request.user, trend['starts'][0], selected_month)
     
     # Calculate spending for each budget
     for budget in budgets:
-        month_start = datetime(budget.month.year, budget.month.month, 1).date()
-        month_end = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-        
-        spent = Expense.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        spent = spending.spent(selected_month, budget.category_id)
         
         budget.spent = spent
         budget.remaining = budget.limit - spent
         budget.spent_percentage = min(round((spent / budget.limit) * 100, 1), 100) if budget.limit else 0
     
     # FEATURE 1: Budget Overview Summary
-    total_budget = budgets.aggregate(total=Sum('limit'))['total'] or 0
+    total_budget = sum(budget.limit for budget in budgets)
     total_spent = sum(budget.spent for budget in budgets)
     total_remaining = total_budget - total_spent
     budget_usage_percent = round((total_spent / total_budget) * 100) if total_budget else 0
     
     # Get previous month data for comparison
-    prev_month = (selected_month.replace(day=1) - timedelta(days=1)).replace(day=1)
-    prev_month_spent = Expense.objects.filter(
-        user=request.user,
-        date__year=prev_month.year,
-        date__month=prev_month.month
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    prev_month_spent = trend['expenses'][-2]
     
     # Calculate month-over-month change
     mom_change = round(((total_spent - prev_month_spent) / prev_month_spent) * 100) if prev_month_spent else 0
@@ -85,62 +79,30 @@ def budget_list(request):
         'actual': []
     }
     
-    for i in range(5, -1, -1):
-        month_date = selected_month.replace(day=1) - timedelta(days=30*i)
-        month_start = month_date
-        month_end = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-        
-        month_budget = Budget.objects.filter(
-            user=request.user,
-            month__year=month_date.year,
-            month__month=month_date.month
-        ).aggregate(total=Sum('limit'))['total'] or 0
-        
-        month_spent = Expense.objects.filter(
-            user=request.user,
-            date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        trend_data['months'].append(month_date.strftime('%b'))
-        trend_data['budget'].append(float(month_budget))
+    for month_date, month_label, month_spent in zip(trend['starts'], trend['labels'], trend['expenses']):
+        trend_data['months'].append(month_label)
+        trend_data['budget'].append(float(spending.limit(month_date)))
         trend_data['actual'].append(float(month_spent))
     
     # FEATURE 3: Category Budget Distribution
-    categories = Category.objects.filter(user=request.user)
+    categories = list(Category.objects.filter(user=request.user))
     category_data = {
         'labels': [],
         'budget_values': [],
         'spent_values': [],
-        'colors': []  # Initialize as empty array
+        'colors': []
     }
     
-    if not categories.exists():
-        # If no categories exist, provide default empty data
-        category_data['labels'] = []
-        category_data['budget_values'] = []
-        category_data['spent_values'] = []
-        category_data['colors'] = []
-    else:
-        for category in categories:
-            cat_budget = Budget.objects.filter(
-                user=request.user,
-                category=category,
-                month__year=selected_month.year,
-                month__month=selected_month.month
-            ).aggregate(total=Sum('limit'))['total'] or 0
+    for category in categories:
+        cat_budget = spending.limit(selected_month, category.id)
+        
+        if cat_budget > 0:
+            cat_spent = spending.spent(selected_month, category.id)
             
-            if cat_budget > 0:
-                cat_spent = Expense.objects.filter(
-                    user=request.user,
-                    category=category,
-                    date__year=selected_month.year,
-                    date__month=selected_month.month
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                
-                category_data['labels'].append(category.name)
-                category_data['budget_values'].append(float(cat_budget))
-                category_data['spent_values'].append(float(cat_spent))
-                category_data['colors'].append(category.color or '#' + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)]))
+            category_data['labels'].append(category.name)
+            category_data['budget_values'].append(float(cat_budget))
+            category_data['spent_values'].append(float(cat_spent))
+            category_data['colors'].append(category.color or '#' + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)]))
     
     # FEATURE 4: Spending Alerts
     spending_alerts = []
@@ -163,60 +125,22 @@ def budget_list(request):
                 'message': f"{budget.category.name} is at {percent_used}% of budget"
             })
     
-    # Check for unusual spending patterns
-    categories_with_expenses = Expense.objects.filter(
-        user=request.user,
-        date__year=selected_month.year,
-        date__month=selected_month.month
-    ).values('category').annotate(count=Count('id'), total=Sum('amount'))
-    
-    for category_data in categories_with_expenses:
-        try:
-            category = Category.objects.get(pk=category_data['category'])
-            
-            # Get average spending for this category in previous 3 months
-            prev_3_months_start = (selected_month.replace(day=1) - timedelta(days=90))
-            avg_spending = Expense.objects.filter(
-                user=request.user,
-                category=category,
-                date__gte=prev_3_months_start,
-                date__lt=selected_month
-            ).values('date__year', 'date__month').annotate(
-                monthly_total=Sum('amount')
-            ).aggregate(avg=Avg('monthly_total'))['avg'] or 0
-            
-            # If current spending is 50% more than average
-            if avg_spending > 0 and category_data['total'] > (avg_spending * Decimal('1.5')):
-                spending_alerts.append({
-                    'type': 'info',
-                    'icon': 'fa-info-circle',
-                    'message': f"Unusual spending in {category.name}: UGX {category_data['total']:,.0f} (avg: UGX {avg_spending:,.0f})"
-                })
-        except Category.DoesNotExist:
-            continue
+    # Unusual spending, flagged nightly by detect_anomalies
+    for anomaly in ExpenseAnomaly.objects.filter(user=request.user, month=selected_month, is_acknowledged=False):
+        spending_alerts.append({
+            'type': 'info',
+            'icon': 'fa-info-circle',
+            'message': f"Unusual spending in {anomaly.category}: UGX {anomaly.amount:,.0f} (usually UGX {anomaly.usual_amount:,.0f})"
+        })
     
     # FEATURE 5: Smart Budget Recommendations
     budget_recommendations = []
     
-    # Categories without budgets
-    categories_without_budget = Category.objects.filter(
-        user=request.user
-    ).exclude(
-        id__in=Budget.objects.filter(
-            user=request.user,
-            month__year=selected_month.year,
-            month__month=selected_month.month
-        ).values('category_id')
-    )
-    
     # For categories with expenses but no budget
-    for category in categories_without_budget:
-        category_expenses = Expense.objects.filter(
-            user=request.user,
-            category=category,
-            date__year=selected_month.year,
-            date__month=selected_month.month
-        ).aggregate(total=Sum('amount'))['total'] or 0
+    for category in categories:
+        if spending.has_budget(selected_month, category.id):
+            continue
+        category_expenses = spending.spent(selected_month, category.id)
         
         if category_expenses > 0:
             budget_recommendations.append({
@@ -228,24 +152,13 @@ def budget_list(request):
             })
     
     # Adjustments for budgets that are consistently over or under
+    previous_3_months = [add_months(selected_month, -i) for i in range(1, 4)]
     for budget in budgets:
         # Check last 3 months
         prev_3_months_spending = []
-        for i in range(1, 4):
-            check_month = (selected_month.replace(day=1) - timedelta(days=30*i))
-            month_spent = Expense.objects.filter(
-                user=request.user,
-                category=budget.category,
-                date__year=check_month.year,
-                date__month=check_month.month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            month_budget = Budget.objects.filter(
-                user=request.user,
-                category=budget.category,
-                month__year=check_month.year,
-                month__month=check_month.month
-            ).aggregate(total=Sum('limit'))['total'] or 0
+        for check_month in previous_3_months:
+            month_spent = spending.spent(check_month, budget.category_id)
+            month_budget = spending.limit(check_month, budget.category_id)
             
             if month_budget > 0:
                 prev_3_months_spending.append({
@@ -4,7 +4,9 @@ from django.urls import reverse
 from django.db.models import Sum
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from .models import Category, Expense, Receipt, SharedExpense, CategoryRule, RecurringExpense
+from .exports import COLUMNS, export_response
+from .merging import MergeError, merge_categories
+from .models import Category, Expense, Receipt, SharedExpense, CategoryRule, RecurringExpense, ReceiptOCRJob, ImportJob
 
 class CategoryInline(admin.TabularInline):
     model = CategoryRule
@@ -47,24 +49,16 @@ class CategoryAdmin(admin.ModelAdmin):
             return
         
         primary_category = queryset.first()
-        other_categories = queryset[1:]
+        other_categories = list(queryset[1:])
         
         try:
-            for category in other_categories:
-                # Move all expenses to primary category
-                for expense in category.expense_set.all():
-                    expense.category = primary_category
-                    expense.save()
-                # Move all rules to primary category
-                for rule in category.categoryrule_set.all():
-                    rule.category = primary_category
-                    rule.save()
-                category.delete()
-            
-            self.message_user(request, f"Successfully merged {queryset.count()} categories")
-        except Exception as exc:
-            self.message_user(request, f"Error merging categories: {str(exc)}", level=messages.ERROR)
-            raise ValidationError("Failed to merge categories") from exc
+            moved = merge_categories(primary_category, other_categories)
+        except MergeError as exc:
+            self.message_user(request, f"Error merging categories: {exc}", level=messages.ERROR)
+            return
+        self.message_user(
+            request, f"Successfully merged {len(other_categories) + 1} categories ({moved} expenses moved)"
+        )
     
     merge_categories.short_description = "Merge selected categories"
 
@@ -117,25 +111,7 @@ class ExpenseAdmin(admin.ModelAdmin):
     mark_as_recurring.short_description = "Mark selected expenses as recurring"
 
     def export_as_csv(self, _, queryset):
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Description', 'Amount', 'Category', 'Date', 'Is Recurring'])
-        
-        for expense in queryset:
-            writer.writerow([
-                expense.description,
-                expense.amount,
-                expense.category.name if expense.category else '',
-                expense.date,
-                expense.is_recurring
-            ])
-        
-        return response
+        return export_response(queryset, 'csv', list(COLUMNS))
     export_as_csv.short_description = "Export selected expenses as CSV"
 
 @admin.register(Receipt)
@@ -152,6 +128,20 @@ class ReceiptAdmin(admin.ModelAdmin):
         return '-'
     expense_link.short_description = 'Related Expense'
 
+@admin.register(ReceiptOCRJob)
+class ReceiptOCRJobAdmin(admin.ModelAdmin):
+    list_display = ('receipt', 'status', 'attempts', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'expense')
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'format', 'status', 'processed_rows', 'created_count', 'duplicate_count', 'error_count', 'created_at')
+    list_filter = ('status', 'format', 'created_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('processed_rows', 'created_count', 'duplicate_count', 'error_count', 'errors',
+                       'created_at', 'started_at', 'finished_at')
+
 @admin.register(RecurringExpense)
 class RecurringExpenseAdmin(admin.ModelAdmin):
     list_display = ('user', 'description', 'amount', 'frequency', 'status', 'next_date')
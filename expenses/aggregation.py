@@ -0,0 +1,61 @@
+import random
+from datetime import date
+
+from . import rollups, timeseries
+from .models import Category, Tag
+
+
+def random_color():
+    return '#' + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
+
+
+def user_tags(user):
+    """Return the sorted names of the tags on any of the user's expenses"""
+    return list(
+        Tag.objects.filter(user=user, expense_tags__isnull=False)
+        .order_by('name')
+        .values_list('name', flat=True)
+        .distinct()
+    )
+
+
+def dashboard_summary(user, today, months=6):
+    """Compute the spending figures shown on the expense dashboard.
+
+    The monthly trend, this month's and last month's totals come from
+    timeseries.series and the category breakdown from the category rollups.
+    Each is one grouped query, as are categories and tags, so the number of
+    queries does not grow with the number of categories or expenses.
+    """
+    current_month = date(today.year, today.month, 1)
+    trend = timeseries.series(user, current_month, max(months, 2))
+
+    categories = list(Category.objects.filter(user=user))
+    categories_by_id = {category.id: category for category in categories}
+
+    # Calculate spending by category for charts
+    category_spending = []
+    for row in rollups.category_totals(user, current_month):
+        category = categories_by_id.get(row['category_id'])
+        if category is None or row['category_total'] <= 0:
+            continue
+        category_spending.append({
+            'id': category.id,
+            'name': category.name,
+            'amount': float(row['category_total']),
+            'color': category.color or random_color(),
+        })
+    category_spending.sort(key=lambda x: x['amount'], reverse=True)
+
+    top_category = categories_by_id[category_spending[0]['id']] if category_spending else None
+
+    return {
+        'categories': categories,
+        'total_spent': trend['expenses'][-1],
+        'prev_month_spent': trend['expenses'][-2],
+        'category_spending': category_spending,
+        'top_category': top_category,
+        'months': trend['labels'][-months:],
+        'spending_trend': [float(total) for total in trend['expenses'][-months:]],
+        'all_tags': user_tags(user),
+    }
@@ -1,21 +1,228 @@
 from rest_framework import generics, permissions
 from .models import Expense, Category
+from .filters import MAX_PAGE_SIZE, PAGE_SIZE, filter_expenses, paginate
+from .forms import ExpenseFilterForm
 from .serializers import ExpenseSerializer, CategorySerializer
-from django.db.models import Sum
+from . import dashboard_cache, rollups, sync
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from datetime import datetime, timedelta
+from datetime import datetime, time
+import hashlib
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from users.models import DataVersion
 
+
+def _data_version(request):
+    # Looked up once per request for both the ETag and Last-Modified checks
+    if not hasattr(request, '_data_version'):
+        request._data_version = DataVersion.for_user(request.user)
+    return request._data_version
+
+
+def _etag(request, *args, **kwargs):
+    # Strong ETag: the user's data version plus everything else the body depends on:
+    # the user, the exact resource, the negotiated format and the user's current month
+    resource = '|'.join([
+        str(request.user.pk), request.get_full_path(), request.META.get('HTTP_ACCEPT', ''),
+        request.user.profile.local_today().strftime('%Y-%m'),
+    ])
+    return f'{_data_version(request).version}-{hashlib.md5(resource.encode()).hexdigest()[:16]}'
+
+
+def _last_modified(request, *args, **kwargs):
+    # Like the ETag, responses also change when the user's month rolls over
+    profile = request.user.profile
+    month_start = datetime.combine(profile.local_today().replace(day=1), time.min, tzinfo=profile.local_zone())
+    return max(_data_version(request).updated_at, month_start)
+
+
+# Answers If-None-Match / If-Modified-Since with 304 before the view serializes anything.
+# no-cache makes clients revalidate on every request instead of guessing a freshness lifetime.
+conditional_get = method_decorator([
+    cache_control(private=True, no_cache=True),
+    condition(etag_func=_etag, last_modified_func=_last_modified),
+], name='get')
+
+
+class ExpenseCursorPagination(BasePagination):
+    """Keyset pages on (date, id) descending, sharing expense_list's cursor format"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            limit = min(int(request.query_params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            limit = PAGE_SIZE
+        self.request = request
+        page, self.next_cursor = paginate(queryset, request.query_params.get('cursor'), max(limit, 1))
+        return page
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'cursor', self.next_cursor)
+        return Response({'next': next_url, 'next_cursor': self.next_cursor, 'results': data})
+
+
+@conditional_get
 class ExpenseListCreateView(generics.ListCreateAPIView):
+    """GET filters with the expense_list parameters (q, start_date, end_date, category,
+    min_amount, max_amount, tag), pages with cursor/limit and trims each row to fields=a,b."""
     serializer_class = ExpenseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ExpenseCursorPagination
     
     def get_queryset(self):
-        return Expense.objects.filter(user=self.request.user).order_by('-date')
+        return Expense.objects.filter(user=self.request.user)
+
+    def requested_fields(self):
+        raw = self.request.query_params.get('fields')
+        if self.request.method != 'GET' or not raw:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = set(fields) - set(ExpenseSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': [f"Unknown field(s): {', '.join(sorted(unknown))}"]})
+        return fields
+
+    def filter_queryset(self, queryset):
+        form = ExpenseFilterForm(self.request.user, self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        fields = self.requested_fields()
+        if fields is None or 'category_details' in fields:
+            queryset = queryset.select_related('category')
+        return filter_expenses(queryset, form.cleaned_data)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class ExpenseBatchView(APIView):
+    """Apply many expense operations in one request and one transaction.
+
+    POST a list of {"op": "create", "data": {...}}, {"op": "update", "id": 1, "data": {...}}
+    or {"op": "delete", "id": 1}; an optional "client_id" is echoed back in the result.
+    Nothing is written unless every operation is valid.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_OPERATIONS = 500
+
+    @staticmethod
+    def is_id(value):
+        # JSON true/false arrive as bools, which are ints to Python
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def post(self, request):
+        operations = request.data
+        if not isinstance(operations, list) or not operations:
+            return Response({'error': 'Expected a non-empty list of operations'}, status=400)
+        if len(operations) > self.MAX_OPERATIONS:
+            return Response({'error': f'At most {self.MAX_OPERATIONS} operations per batch'}, status=400)
+
+        user = request.user
+        results = []
+        for operation in operations:
+            if not isinstance(operation, dict):
+                operation = {}
+            result = {'op': operation.get('op')}
+            if 'client_id' in operation:
+                result['client_id'] = operation['client_id']
+            results.append(result)
+
+        target_ids = [op.get('id') for op in operations if isinstance(op, dict) and op.get('op') in ('update', 'delete')]
+        existing = Expense.objects.select_related('category').in_bulk(
+            [pk for pk in target_ids if self.is_id(pk)]
+        )
+        existing = {pk: expense for pk, expense in existing.items() if expense.user_id == user.pk}
+
+        creates, updates, deletes = [], [], []
+        seen_ids = set()
+        for index, (operation, result) in enumerate(zip(operations, results)):
+            op = result['op']
+            if op == 'create':
+                creates.append(index)
+            elif op in ('update', 'delete'):
+                pk = operation.get('id')
+                if not self.is_id(pk) or pk not in existing:
+                    result['errors'] = {'id': ['Expense not found']}
+                elif pk in seen_ids:
+                    result['errors'] = {'id': ['Expense appears in more than one operation']}
+                else:
+                    seen_ids.add(pk)
+                    (updates if op == 'update' else deletes).append(index)
+            else:
+                result['errors'] = {'op': ['Expected create, update or delete']}
+
+        # Creates are validated together; updates against their stored expense
+        validated = {}
+        context = {'request': request}
+        create_serializer = ExpenseSerializer(data=[operations[i].get('data') for i in creates], many=True,
+                                              context=context)
+        if create_serializer.is_valid():
+            validated.update(zip(creates, create_serializer.validated_data))
+        else:
+            errors = create_serializer.errors
+            if isinstance(errors, dict):
+                # Keyed by position; list-level errors (e.g. non_field_errors) apply to every create
+                by_position = {key: value for key, value in errors.items() if isinstance(key, int)}
+                shared = {key: value for key, value in errors.items() if not isinstance(key, int)}
+            else:
+                by_position, shared = dict(enumerate(errors)), {}
+            for position, index in enumerate(creates):
+                item_errors = {**shared, **by_position.get(position, {})}
+                if item_errors:
+                    results[index]['errors'] = item_errors
+
+        for index in updates:
+            serializer = ExpenseSerializer(existing[operations[index]['id']], data=operations[index].get('data'),
+                                           partial=True, context=context)
+            if serializer.is_valid():
+                validated[index] = serializer.validated_data
+            else:
+                results[index]['errors'] = serializer.errors
+
+        if any('errors' in result for result in results):
+            for result in results:
+                result['status'] = 'error' if 'errors' in result else 'skipped'
+            return Response({'results': results}, status=400)
+
+        with transaction.atomic():
+            new_expenses = Expense.objects.bulk_create(
+                [Expense(user=user, **validated[index]) for index in creates]
+            )
+            changed = []
+            fields = set()
+            for index in updates:
+                expense = existing[operations[index]['id']]
+                for field, value in validated[index].items():
+                    setattr(expense, field, value)
+                    fields.add(field)
+                changed.append(expense)
+            if changed and fields:
+                Expense.objects.bulk_update(changed, list(fields))
+            if deletes:
+                # One DELETE; the per-row receivers still run, so each expense gets its sync tombstone
+                Expense.objects.filter(user=user, id__in=[operations[i]['id'] for i in deletes]).delete()
+
+        for index, expense in zip(creates, new_expenses):
+            results[index].update(status='created', id=expense.pk, data=ExpenseSerializer(expense).data)
+        for index, expense in zip(updates, changed):
+            results[index].update(status='updated', id=expense.pk, data=ExpenseSerializer(expense).data)
+        for index in deletes:
+            results[index].update(status='deleted', id=operations[index]['id'])
+        return Response({'results': results})
+
+@conditional_get
 class RecentExpenseListView(generics.ListAPIView):
     serializer_class = ExpenseSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -23,6 +230,7 @@ class RecentExpenseListView(generics.ListAPIView):
     def get_queryset(self):
         return Expense.objects.filter(user=self.request.user).order_by('-date')[:5]
 
+@conditional_get
 class CategoryListCreateView(generics.ListCreateAPIView):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -33,19 +241,27 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+@conditional_get
 class FinancialDataView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
-        today = datetime.now()
+        # The month window follows the user's time zone, not the server's
+        today = user.profile.local_today()
         month_start = datetime(today.year, today.month, 1)
+        payload = dashboard_cache.get_payload(
+            'mobile_dashboard', user.pk, month_start.date(),
+            lambda: self.build_payload(user, month_start),
+        )
+        return Response(payload)
+
+    def build_payload(self, user, month_start):
+        # Category totals for this month from the monthly spending rollup
+        month_rows = list(rollups.category_totals(user, month_start.date()))
         
         # Total expenses this month
-        total_expenses = Expense.objects.filter(
-            user=user, 
-            date__gte=month_start
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        total_expenses = sum(row['category_total'] for row in month_rows)
         
         # Budget (assuming simple profile monthly income as budget for now, or fetch from Budget model)
         # Using a dummy value if no budget model integration yet
@@ -54,22 +270,28 @@ class FinancialDataView(APIView):
              monthly_budget = user.profile.monthly_income
 
         # Category breakdown
-        category_expenses = []
-        categories = Category.objects.filter(expense__user=user, expense__date__gte=month_start).distinct()
-        for cat in categories:
-            amount = Expense.objects.filter(
-                user=user, 
-                category=cat,
-                date__gte=month_start
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            category_expenses.append({
-                'name': cat.name,
-                'amount': amount
-            })
+        category_expenses = [
+            {'name': row['category__name'], 'amount': row['category_total']}
+            for row in month_rows
+            if row['category_id'] is not None
+        ]
             
-        return Response({
+        return {
             'totalExpenses': total_expenses,
             'monthlyBudget': monthly_budget,
             'categoryExpenses': category_expenses
-        })
+        }
+
+class SyncView(APIView):
+    """Changes since a sync token: GET /api/sync/?token=<token>&limit=<n>"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', sync.PAGE_SIZE)), 1), sync.MAX_PAGE_SIZE)
+        except ValueError:
+            limit = sync.PAGE_SIZE
+        try:
+            return Response(sync.sync_page(request.user, request.query_params.get('token'), limit))
+        except sync.SyncTokenError as e:
+            return Response({'error': str(e)}, status=400)
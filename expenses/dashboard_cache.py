@@ -0,0 +1,83 @@
+"""Per-user, per-month cache of the assembled dashboard API payloads.
+
+`financial_data` and the mobile `FinancialDataView` are polled constantly and
+rebuild the same payload each time. Payloads are stored in the Django cache
+under the user, the month and a per-user version token. Expense and budget
+writes drop only the months they touch (see expenses.signals); changes to
+income sources, bills, the profile or categories bump the user's version,
+which retires every cached month at once.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+PAYLOADS = ('financial_data', 'mobile_dashboard')
+STATS_KEY = 'dashboard-cache-stats:{payload}:{outcome}'
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def _version(user_id):
+    key = f'dashboard-version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _key(payload, user_id, version, month):
+    return f'dashboard:{payload}:{user_id}:{version}:{month:%Y-%m}'
+
+
+def _count(payload, outcome):
+    key = STATS_KEY.format(payload=payload, outcome=outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def get_payload(payload, user_id, month, build):
+    """Return the cached payload for (user, month), calling `build()` to fill it on a miss"""
+    key = _key(payload, user_id, _version(user_id), month)
+    data = cache.get(key)
+    if data is not None:
+        _count(payload, 'hits')
+        return data
+    _count(payload, 'misses')
+    data = build()
+    cache.set(key, data, _timeout())
+    return data
+
+
+def invalidate_months(user_id, months):
+    """Drop the cached payloads of the given months for one user"""
+    version = _version(user_id)
+    cache.delete_many([
+        _key(payload, user_id, version, month)
+        for payload in PAYLOADS
+        for month in {month.replace(day=1) for month in months}
+    ])
+
+
+def invalidate_user(user_id):
+    """Drop every cached payload for one user"""
+    cache.set(f'dashboard-version:{user_id}', uuid.uuid4().hex, None)
+
+
+def stats():
+    """Return {payload: {'hits': n, 'misses': n}} since the cache was last cleared"""
+    return {
+        payload: {
+            outcome: cache.get(STATS_KEY.format(payload=payload, outcome=outcome), 0)
+            for outcome in ('hits', 'misses')
+        }
+        for payload in PAYLOADS
+    }
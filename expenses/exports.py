@@ -0,0 +1,174 @@
+"""Streaming exports of the expense ledger.
+
+Rows are read with `iterator(chunk_size=...)` and written out as they arrive,
+so memory use stays flat however many expenses are exported. CSV and JSON
+Lines need only the standard library; Parquet needs the optional pyarrow
+package and writes one row group per chunk.
+"""
+import csv
+import json
+from importlib.util import find_spec
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .models import ExpenseTag
+
+CHUNK_SIZE = 2000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _tags(expense):
+    return [expense_tag.tag.name for expense_tag in expense.expense_tags.all()]
+
+
+# name: (header, value getter, pyarrow type name)
+COLUMNS = {
+    'id': ('ID', lambda e: e.id, 'int64'),
+    'date': ('Date', lambda e: e.date, 'date32'),
+    'description': ('Description', lambda e: e.description, 'string'),
+    'amount': ('Amount', lambda e: e.amount, 'decimal'),
+    'category': ('Category', lambda e: e.category.name if e.category else '', 'string'),
+    'tags': ('Tags', _tags, 'list'),
+    'notes': ('Notes', lambda e: e.notes, 'string'),
+    'is_recurring': ('Is Recurring', lambda e: e.is_recurring, 'bool'),
+    'created_at': ('Created At', lambda e: e.created_at, 'timestamp'),
+}
+DEFAULT_COLUMNS = ['date', 'description', 'amount', 'category', 'is_recurring']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def parquet_available():
+    return find_spec('pyarrow') is not None
+
+
+def parse_columns(raw):
+    """Turn a list of (possibly comma separated) column names into a validated list"""
+    names = [name.strip() for value in raw for name in value.split(',') if name.strip()]
+    if not names:
+        return list(DEFAULT_COLUMNS)
+    unknown = [name for name in names if name not in COLUMNS]
+    if unknown:
+        raise ExportError(f"Unknown column(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def _rows(queryset, columns):
+    queryset = queryset.select_related('category').order_by('date', 'id')
+    if 'tags' in columns:
+        queryset = queryset.prefetch_related(
+            Prefetch('expense_tags', queryset=ExpenseTag.objects.select_related('tag'))
+        )
+    getters = [COLUMNS[name][1] for name in columns]
+    for expense in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield [getter(expense) for getter in getters]
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller"""
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([COLUMNS[name][0] for name in columns])
+    tags_index = columns.index('tags') if 'tags' in columns else None
+    for row in _rows(queryset, columns):
+        if tags_index is not None:
+            row[tags_index] = '|'.join(row[tags_index])
+        yield writer.writerow(row)
+
+
+def stream_jsonl(queryset, columns):
+    for row in _rows(queryset, columns):
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+
+class _ChunkSink:
+    """Write target for pyarrow that collects bytes until they are drained"""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_parquet(queryset, columns):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export requires the pyarrow package.')
+
+    types = {
+        'int64': pa.int64(),
+        'date32': pa.date32(),
+        'string': pa.string(),
+        'decimal': pa.decimal128(12, 2),
+        'list': pa.list_(pa.string()),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    schema = pa.schema([(name, types[COLUMNS[name][2]]) for name in columns])
+
+    def generate():
+        sink = _ChunkSink()
+        with pq.ParquetWriter(sink, schema) as writer:
+            batch = []
+            for row in _rows(queryset, columns):
+                batch.append(row)
+                if len(batch) == CHUNK_SIZE:
+                    writer.write_table(pa.Table.from_pylist([dict(zip(columns, r)) for r in batch], schema=schema))
+                    batch = []
+                    yield sink.drain()
+            if batch:
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, r)) for r in batch], schema=schema))
+        yield sink.drain()
+
+    return generate()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+    'parquet': stream_parquet,
+}
+
+
+def export_response(queryset, fmt='csv', columns=None, filename='expenses'):
+    """Return a StreamingHttpResponse exporting `queryset`; raises ExportError for bad options"""
+    if fmt not in STREAMERS:
+        raise ExportError(f"Unsupported format: {fmt}")
+    columns = columns or list(DEFAULT_COLUMNS)
+
+    response = StreamingHttpResponse(STREAMERS[fmt](queryset, columns), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,61 @@
+"""Shared query builder and keyset pagination for expense listings.
+
+Pages are ordered by (date, id) descending and continue from an opaque
+"<date>_<id>" cursor, so each page is an index range scan on
+(user, date, id) however deep the user scrolls.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def filter_expenses(queryset, filters):
+    """Apply cleaned ExpenseFilterForm data to an expense queryset"""
+    if filters.get('start_date'):
+        queryset = queryset.filter(date__gte=filters['start_date'])
+    if filters.get('end_date'):
+        queryset = queryset.filter(date__lte=filters['end_date'])
+    if filters.get('category'):
+        queryset = queryset.filter(category=filters['category'])
+    if filters.get('min_amount') is not None:
+        queryset = queryset.filter(amount__gte=filters['min_amount'])
+    if filters.get('max_amount') is not None:
+        queryset = queryset.filter(amount__lte=filters['max_amount'])
+    if filters.get('tag'):
+        queryset = queryset.filter(expense_tags__tag__name=filters['tag'].strip())
+    if filters.get('q'):
+        text = filters['q'].strip()
+        queryset = queryset.filter(Q(description__icontains=text) | Q(notes__icontains=text))
+    return queryset
+
+
+def encode_cursor(expense):
+    return f'{expense.date.isoformat()}_{expense.pk}'
+
+
+def decode_cursor(cursor):
+    """Return (date, id) for a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        day, pk = cursor.split('_', 1)
+        return date.fromisoformat(day), int(pk)
+    except ValueError:
+        return None
+
+
+def paginate(queryset, cursor=None, limit=PAGE_SIZE):
+    """Return (expenses, next_cursor) for the page that follows `cursor`"""
+    queryset = queryset.order_by('-date', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        day, pk = position
+        queryset = queryset.filter(Q(date__lt=day) | Q(date=day, id__lt=pk))
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
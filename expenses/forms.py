@@ -3,7 +3,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.db import models
 from django.contrib.auth.models import User
-from .models import Expense, Category, Receipt, SharedExpense, CategoryRule, RecurringExpense
+from .models import Expense, Category, Receipt, SharedExpense, CategoryRule, RecurringExpense, ImportJob
 
 class FormWarningMixin:
     def __init__(self, *args, **kwargs):
@@ -129,6 +129,58 @@ class ReceiptUploadForm(forms.ModelForm):
                 raise ValidationError('Invalid image file') from exc
         return image
 
+DATE_FORMAT_CHOICES = [
+    ('%Y-%m-%d', 'YYYY-MM-DD'),
+    ('%d/%m/%Y', 'DD/MM/YYYY'),
+    ('%m/%d/%Y', 'MM/DD/YYYY'),
+    ('%d-%m-%Y', 'DD-MM-YYYY'),
+    ('%d.%m.%Y', 'DD.MM.YYYY'),
+]
+
+def validate_import_file(value):
+    import os
+    if value.size > 50 * 1024 * 1024:  # 50MB
+        raise ValidationError("Maximum file size is 50MB")
+    ext = os.path.splitext(value.name)[1]
+    if ext.lower() not in ['.csv', '.txt', '.ofx', '.qfx']:
+        raise ValidationError('Unsupported file extension. Allowed: csv, txt, ofx, qfx')
+
+class ImportJobForm(forms.ModelForm):
+    file = forms.FileField(
+        validators=[validate_import_file],
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.txt,.ofx,.qfx'})
+    )
+    date_column = forms.CharField(initial='date', required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    description_column = forms.CharField(initial='description', required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    amount_column = forms.CharField(initial='amount', required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    category_column = forms.CharField(required=False, help_text="Optional; matched against your category names",
+                                      widget=forms.TextInput(attrs={'class': 'form-control'}))
+    date_format = forms.ChoiceField(choices=DATE_FORMAT_CHOICES, widget=forms.Select(attrs={'class': 'form-select'}))
+
+    class Meta:
+        model = ImportJob
+        fields = ['file', 'format']
+        widgets = {
+            'format': forms.Select(attrs={'class': 'form-select'}),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('format') == 'csv':
+            for field in ('date_column', 'amount_column'):
+                if not cleaned_data.get(field):
+                    self.add_error(field, 'Required for CSV files')
+        return cleaned_data
+
+    def get_mapping(self):
+        return {
+            'date': self.cleaned_data['date_column'],
+            'description': self.cleaned_data['description_column'],
+            'amount': self.cleaned_data['amount_column'],
+            'category': self.cleaned_data['category_column'],
+            'date_format': self.cleaned_data['date_format'],
+        }
+
 class SharedExpenseForm(forms.ModelForm):
     class Meta:
         model = SharedExpense
@@ -164,6 +216,30 @@ class BulkCategoryUpdateForm(forms.Form):
         self.fields['category'].queryset = Category.objects.filter(user=user)
         self.fields['expenses'].queryset = Expense.objects.filter(user=user)
 
+class ExpenseFilterForm(forms.Form):
+    q = forms.CharField(required=False, widget=forms.TextInput(attrs={
+        'class': 'form-control', 'placeholder': 'Search description or notes'
+    }))
+    start_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.none(),
+        required=False,
+        empty_label='All categories',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    min_amount = forms.DecimalField(required=False, min_value=0, widget=forms.NumberInput(attrs={
+        'class': 'form-control', 'placeholder': 'Min', 'step': '0.01'
+    }))
+    max_amount = forms.DecimalField(required=False, min_value=0, widget=forms.NumberInput(attrs={
+        'class': 'form-control', 'placeholder': 'Max', 'step': '0.01'
+    }))
+    tag = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Tag'}))
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['category'].queryset = Category.objects.filter(user=user)
+
 class ShareExpenseForm(forms.ModelForm):
     shared_with = forms.ModelChoiceField(
         queryset=User.objects.all(),
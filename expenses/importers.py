@@ -0,0 +1,223 @@
+"""Bulk expense import from CSV files and OFX/QFX bank statements.
+
+Files are read one row at a time and written with bulk_create in batches, so
+large statements import in a handful of queries per batch. Rows are
+categorised with the user's compiled CategoryRule/keyword matcher and rows
+that already exist (same date, amount and description) are skipped.
+Identical rows within one file are told apart by position: the n-th copy of a
+row is only skipped if the ledger already held n such expenses before the
+import, so two identical withdrawals on one day are both kept.
+
+A job left running longer than STALE_AFTER (its worker died) is failed; the
+rows imported before that are kept, and uploading the file again only adds
+the rest.
+"""
+import csv
+import io
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .matching import get_matcher
+from .models import Category, Expense, ImportJob
+
+BATCH_SIZE = 1000
+MAX_STORED_ERRORS = 20
+# Longer than any import should take; a job running this long has lost its worker
+STALE_AFTER = timedelta(hours=1)
+# Expense.amount is max_digits=10, decimal_places=2
+MAX_AMOUNT = Decimal('100000000')
+
+DEFAULT_MAPPING = {
+    'date': 'date',
+    'description': 'description',
+    'amount': 'amount',
+    'category': '',
+    'date_format': '%Y-%m-%d',
+}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def parse_amount(value):
+    """Parse '1,234.50', 'UGX 1,234.50', '-12.00' or '(12.00)' into a positive Decimal"""
+    text = re.sub(r'[^\d.()\-]', '', str(value or ''))
+    try:
+        amount = abs(Decimal(text.strip('()'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ImportFileError(f'invalid amount {value!r}')
+    if not amount:
+        raise ImportFileError(f'amount {value!r} is zero')
+    if amount >= MAX_AMOUNT:
+        raise ImportFileError(f'amount {value!r} is too large')
+    return amount
+
+
+def parse_date(value, date_format):
+    try:
+        return datetime.strptime(str(value).strip(), date_format).date()
+    except ValueError:
+        raise ImportFileError(f'invalid date {value!r}')
+
+
+def read_csv(fileobj, mapping):
+    """Yield raw (date, description, amount, category name) strings for each CSV row"""
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    headers = {name.strip().lower(): name for name in reader.fieldnames or []}
+
+    columns = {}
+    for key in ('date', 'description', 'amount', 'category'):
+        wanted = (mapping.get(key) or '').strip().lower()
+        if not wanted:
+            continue
+        if wanted not in headers:
+            raise ImportFileError(f'column {mapping[key]!r} not found in the file')
+        columns[key] = headers[wanted]
+    if not {'date', 'amount'} <= columns.keys():
+        raise ImportFileError('the date and amount columns are required')
+
+    for row in reader:
+        yield tuple(
+            (row.get(columns[key]) or '').strip() if key in columns else ''
+            for key in ('date', 'description', 'amount', 'category')
+        )
+
+
+OFX_FIELD = re.compile(r'<(DTPOSTED|TRNAMT|NAME|MEMO)>([^<\r\n]*)', re.IGNORECASE)
+OFX_DATE_FORMAT = '%Y%m%d'
+
+
+def read_ofx(fileobj):
+    """Yield raw (date, description, amount, '') strings for each debit in an OFX/QFX statement.
+
+    Handles both SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) files.
+    Credits are skipped since they are not expenses.
+    """
+    fields = None
+    for line in io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace'):
+        upper = line.upper()
+        if '<STMTTRN>' in upper:
+            fields = {}
+        if fields is not None:
+            for name, value in OFX_FIELD.findall(line):
+                fields[name.upper()] = value.strip()
+        if '</STMTTRN>' in upper and fields is not None:
+            transaction_fields, fields = fields, None
+            if not transaction_fields.get('TRNAMT', '').startswith('-'):
+                continue
+            yield (
+                transaction_fields.get('DTPOSTED', '')[:8],
+                transaction_fields.get('NAME') or transaction_fields.get('MEMO') or '',
+                transaction_fields['TRNAMT'],
+                '',
+            )
+
+
+def run_import(job):
+    """Import every row of `job`'s file, saving its counters after each batch"""
+    user = job.user
+    matcher = get_matcher(user.pk)
+    categories = {name.lower(): pk for pk, name in Category.objects.filter(user=user).values_list('id', 'name')}
+    # Copies of each (date, amount, description) read from the file, and imported from it, so far
+    occurrences = Counter()
+    imported = Counter()
+    errors = []
+
+    def flush(batch):
+        # One query finds every existing expense that could collide with this batch
+        existing = Counter(
+            (day, amount, description.lower())
+            for day, amount, description in Expense.objects.filter(
+                user=user,
+                date__gte=min(expense.date for expense, key, occurrence in batch),
+                date__lte=max(expense.date for expense, key, occurrence in batch),
+            ).values_list('date', 'amount', 'description')
+        ) if batch else Counter()
+        # Only expenses that were there before this import make a row a duplicate
+        new = [
+            (expense, key) for expense, key, occurrence in batch
+            if occurrence > existing[key] - imported[key]
+        ]
+        with transaction.atomic():
+            Expense.objects.bulk_create([expense for expense, key in new], batch_size=BATCH_SIZE)
+        imported.update(key for expense, key in new)
+        job.created_count += len(new)
+        job.duplicate_count += len(batch) - len(new)
+        ImportJob.objects.filter(pk=job.pk).update(
+            processed_rows=job.processed_rows, created_count=job.created_count,
+            duplicate_count=job.duplicate_count, error_count=job.error_count,
+        )
+
+    with job.file.open('rb') as fileobj:
+        if job.format == 'ofx':
+            rows, date_format = read_ofx(fileobj), OFX_DATE_FORMAT
+        else:
+            mapping = {**DEFAULT_MAPPING, **job.mapping}
+            rows, date_format = read_csv(fileobj, mapping), mapping['date_format']
+
+        batch = []
+        for line, (raw_date, description, raw_amount, category_name) in enumerate(rows, start=1):
+            job.processed_rows += 1
+            try:
+                day = parse_date(raw_date, date_format)
+                amount = parse_amount(raw_amount)
+            except ImportFileError as e:
+                job.error_count += 1
+                if len(errors) < MAX_STORED_ERRORS:
+                    errors.append(f'Row {line}: {e}')
+                continue
+
+            description = (description or 'Imported expense')[:200]
+            key = (day, amount, description.lower())
+            occurrences[key] += 1
+
+            category_id = categories.get(category_name.lower()) if category_name else None
+            batch.append((Expense(
+                user=user,
+                category_id=category_id or matcher.match(description),
+                amount=amount,
+                description=description,
+                date=day,
+            ), key, occurrences[key]))
+            if len(batch) >= BATCH_SIZE:
+                flush(batch)
+                batch = []
+        flush(batch)
+
+    job.errors = '\n'.join(errors)
+    return job
+
+
+def process_job(job):
+    """Run a claimed job and record whether it finished"""
+    try:
+        run_import(job)
+        job.status = 'done'
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as e:
+        job.status = 'failed'
+        job.errors = '\n'.join(filter(None, [str(e), job.errors]))
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def fail_stale_jobs(older_than=STALE_AFTER):
+    """Fail imports stuck in 'running' (e.g. after a worker crash); return how many there were"""
+    now = timezone.now()
+    return ImportJob.objects.filter(status='running', started_at__lt=now - older_than).update(
+        status='failed', errors='Import interrupted; rows imported before that were kept', finished_at=now
+    )
+
+
+def claim_next_job():
+    """Mark the oldest pending import as running and return it, or None"""
+    for pk in ImportJob.objects.filter(status='pending').order_by('created_at').values_list('pk', flat=True)[:10]:
+        if ImportJob.objects.filter(pk=pk, status='pending').update(status='running', started_at=timezone.now()):
+            return ImportJob.objects.select_related('user').get(pk=pk)
+    return None
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.recurring import generate_due_expenses
+
+
+class Command(BaseCommand):
+    help = 'Generate every due occurrence of active recurring expenses for all users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Generate occurrences up to this date (YYYY-MM-DD, default: today).')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format.')
+
+        created, advanced = generate_due_expenses(today=today, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} expense(s) from {advanced} recurring expense(s).'
+        ))
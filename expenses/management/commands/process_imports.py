@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from expenses.importers import STALE_AFTER, claim_next_job, fail_stale_jobs, process_job
+
+
+class Command(BaseCommand):
+    help = 'Import queued CSV/OFX expense files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the imports currently queued and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=int(STALE_AFTER.total_seconds() // 60),
+                            metavar='MINUTES',
+                            help='Fail running imports that started more than this many minutes ago.')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_after'])
+        while True:
+            fail_stale_jobs(stale_after)
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            try:
+                process_job(job)
+            except Exception as e:
+                job.status = 'failed'
+                job.errors = str(e)
+                job.finished_at = timezone.now()
+                job.save(update_fields=['status', 'errors', 'finished_at'])
+                self.stderr.write(f'Import {job.pk} failed: {e}')
+                continue
+
+            self.stdout.write(
+                f'Import {job.pk} {job.status}: {job.created_count} created, {job.duplicate_count} duplicates, '
+                f'{job.error_count} errors in {time.monotonic() - started:.1f}s'
+            )
@@ -0,0 +1,88 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from expenses.ocr import run_ocr
+from expenses.ocr_queue import claim_jobs, complete_job, fail_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued receipt OCR jobs in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.RECEIPT_OCR_WORKERS,
+                            help='Number of OCR processes (default: RECEIPT_OCR_WORKERS).')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs currently queued and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--stale-after', type=int, default=15, metavar='MINUTES',
+                            help='Requeue running jobs that started more than this many minutes ago.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        stale_after = timedelta(minutes=options['stale_after'])
+        processed = failed = 0
+
+        # Children only run OCR on files; the parent owns every database write.
+        # Close connections so no socket is shared with the pool.
+        connections.close_all()
+        pool = self.start_pool(workers)
+        try:
+            while True:
+                requeue_stale_jobs(stale_after, options['max_attempts'])
+                jobs = claim_jobs(limit=workers * 2)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                try:
+                    futures = self.submit(pool, jobs)
+                except BrokenProcessPool:
+                    # A child died while the pool was idle
+                    pool = self.restart_pool(pool, workers)
+                    futures = self.submit(pool, jobs)
+
+                broken = False
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        text, parsed = future.result()
+                        complete_job(job, text, parsed)
+                        processed += 1
+                    except Exception as e:
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        fail_job(job, e, options['max_attempts'])
+                        failed += 1
+                        self.stderr.write(f'Receipt {job.receipt_id}: {e}')
+
+                if broken:
+                    # An OCR process crashed or was killed, which takes the whole pool down
+                    pool = self.restart_pool(pool, workers)
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} receipt(s), {failed} failed.'))
+
+    def start_pool(self, workers):
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def restart_pool(self, pool, workers):
+        self.stderr.write('OCR worker pool broke; starting a new one.')
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self.start_pool(workers)
+
+    def submit(self, pool, jobs):
+        return {pool.submit(run_ocr, job.receipt.image.path, settings.TESSERACT_CMD): job for job in jobs}
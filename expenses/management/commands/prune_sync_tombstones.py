@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from expenses.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than the sync token lifetime.'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sync tombstones'))
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.rollups import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly per-category spending rollups from the expense ledger.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', metavar='USERNAME',
+                            help='Only rebuild rollups for this user (can be repeated).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = list(User.objects.filter(username__in=options['usernames']))
+            missing = set(options['usernames']) - {user.username for user in users}
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+
+        created = rebuild_all(users=users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} monthly spending rollup rows."))
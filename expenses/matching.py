@@ -0,0 +1,121 @@
+"""Compiled category suggestions from CategoryRule patterns and Category keywords.
+
+Matchers are compiled once per user and kept in a small per-process cache. A
+version token stored in the Django cache is bumped whenever a user's rules or
+categories change, so every process rebuilds its matcher on the next lookup.
+"""
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .models import Category, CategoryRule
+
+MAX_CACHED_MATCHERS = 1024
+
+_matchers = OrderedDict()  # {user_id: (version, CategoryMatcher)}
+_lock = threading.Lock()
+
+
+def compile_pattern(pattern):
+    """Compile a rule pattern case-insensitively, treating invalid regexes as literal text"""
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(pattern), re.IGNORECASE)
+
+
+class CategoryMatcher:
+    def __init__(self, rules, keywords):
+        """`rules` is [(pattern, category_id)] in priority order, `keywords` is [(keyword, category_id)]"""
+        self.rules = [(compile_pattern(pattern), category_id) for pattern, category_id in rules if pattern]
+
+        # A combined alternation rejects descriptions that match no rule in one
+        # pass. Patterns with groups are left out so their group numbers stay
+        # valid; they are always checked individually.
+        simple = [regex.pattern for regex, _ in self.rules if regex.groups == 0]
+        self.grouped_rules = [(regex, category_id) for regex, category_id in self.rules if regex.groups]
+        self.any_rule = None
+        if simple:
+            try:
+                self.any_rule = re.compile('|'.join(f'(?:{pattern})' for pattern in simple), re.IGNORECASE)
+            except re.error:
+                self.any_rule = None
+
+        self.keyword_categories = {}
+        for keyword, category_id in keywords:
+            self.keyword_categories.setdefault(keyword.lower(), category_id)
+        self.any_keyword = None
+        if self.keyword_categories:
+            alternatives = sorted(self.keyword_categories, key=len, reverse=True)
+            self.any_keyword = re.compile(
+                r'(?<!\w)(?:' + '|'.join(re.escape(keyword) for keyword in alternatives) + r')(?!\w)',
+                re.IGNORECASE,
+            )
+
+    def match(self, description):
+        """Return the id of the suggested category for `description`, or None"""
+        if not description:
+            return None
+
+        if self.grouped_rules or self.any_rule is None or self.any_rule.search(description):
+            for regex, category_id in self.rules:
+                if regex.search(description):
+                    return category_id
+
+        if self.any_keyword is not None:
+            found = self.any_keyword.search(description)
+            if found:
+                return self.keyword_categories[found.group(0).lower()]
+        return None
+
+
+def build_matcher(user_id):
+    rules = (
+        CategoryRule.objects.filter(user_id=user_id, is_active=True, category__user_id=user_id)
+        .order_by('-priority', 'id')
+        .values_list('pattern', 'category_id')
+    )
+    keywords = []
+    for category_id, raw_keywords in (
+        Category.objects.filter(user_id=user_id).exclude(keywords='').values_list('id', 'keywords')
+    ):
+        keywords.extend((keyword.strip(), category_id) for keyword in raw_keywords.split(',') if keyword.strip())
+    return CategoryMatcher(list(rules), keywords)
+
+
+def _version_key(user_id):
+    return f'category-matcher-version:{user_id}'
+
+
+def invalidate_matcher(user_id):
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def get_matcher(user_id):
+    """Return the compiled matcher for a user, rebuilding it only when their rules changed"""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, None):
+            version = cache.get(_version_key(user_id), version)
+
+    with _lock:
+        cached = _matchers.get(user_id)
+        if cached and cached[0] == version:
+            _matchers.move_to_end(user_id)
+            return cached[1]
+
+    matcher = build_matcher(user_id)
+    with _lock:
+        _matchers[user_id] = (version, matcher)
+        _matchers.move_to_end(user_id)
+        while len(_matchers) > MAX_CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def suggest_category_id(user, description):
+    return get_matcher(user.pk).match(description)
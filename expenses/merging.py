@@ -0,0 +1,63 @@
+"""Merging categories with set-based updates.
+
+Everything filed under the merged categories moves to the primary one with one
+UPDATE per model, so the cost does not depend on how many expenses are moved.
+The expense UPDATE sends a single expenses_bulk_changed signal, which rebuilds
+the affected rollup months and invalidates the dashboards once. Budgets for
+the same month are combined into one budget whose limit is their sum. They are
+written with bulk_update, which sends no signals, so the user's data version
+is bumped explicitly.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from budgets.models import Budget
+from users.models import DataVersion
+from . import dashboard_cache
+from .matching import invalidate_matcher
+from .models import Category, CategoryRule, Expense, RecurringExpense
+
+
+class MergeError(ValueError):
+    pass
+
+
+def merge_categories(primary, others):
+    """Move everything in `others` to `primary` and delete them; return the number of expenses moved"""
+    others = [category for category in others if category.pk != primary.pk]
+    if any(category.user_id != primary.user_id for category in others):
+        raise MergeError('Only categories of the same user can be merged')
+    other_ids = [category.pk for category in others]
+    now = timezone.now()
+
+    with transaction.atomic():
+        moved = Expense.objects.filter(category_id__in=other_ids).update(category=primary)
+        CategoryRule.objects.filter(category_id__in=other_ids).update(category=primary, updated_at=now)
+        RecurringExpense.objects.filter(category_id__in=other_ids).update(category=primary, updated_at=now)
+
+        # One budget per month: the primary category's if it has one, with the limits summed
+        budgets_by_month = defaultdict(list)
+        for budget in Budget.objects.filter(category_id__in=[primary.pk, *other_ids]).order_by('id'):
+            budgets_by_month[budget.month.replace(day=1)].append(budget)
+        kept, dropped = [], []
+        for budgets in budgets_by_month.values():
+            budgets.sort(key=lambda budget: budget.category_id != primary.pk)
+            keep = budgets[0]
+            if len(budgets) == 1 and keep.category_id == primary.pk:
+                continue
+            keep.limit = sum(budget.limit for budget in budgets)
+            keep.category = primary
+            keep.updated_at = now
+            kept.append(keep)
+            dropped.extend(budget.pk for budget in budgets[1:])
+        Budget.objects.filter(pk__in=dropped).delete()
+        Budget.objects.bulk_update(kept, ['limit', 'category', 'updated_at'])
+
+        Category.objects.filter(pk__in=other_ids).delete()
+        DataVersion.bump([primary.user_id])
+
+    invalidate_matcher(primary.user_id)
+    dashboard_cache.invalidate_user(primary.user_id)
+    return moved
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_monthlycategoryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptOCRJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expense', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='expenses.expense')),
+                ('receipt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_job', to='expenses.receipt')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='ocr_job_status_idx')],
+            },
+        ),
+    ]
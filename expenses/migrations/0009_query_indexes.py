@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0008_expense_user_date_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringexpense',
+            index=models.Index(fields=['user', 'status', 'next_date'], name='recurring_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringexpense',
+            index=models.Index(fields=['status', 'next_date'], name='recurring_status_next_idx'),
+        ),
+    ]
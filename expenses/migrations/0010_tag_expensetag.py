@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:29
+
+import json
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_tags_json(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    Tag = apps.get_model('expenses', 'Tag')
+    ExpenseTag = apps.get_model('expenses', 'ExpenseTag')
+
+    expense_tags = {}  # {(expense_id, name): (user_id, color)}
+    rows = (
+        Expense.objects.exclude(tags_json__isnull=True)
+        .exclude(tags_json__in=['', '{}'])
+        .values_list('id', 'user_id', 'tags_json')
+    )
+    for expense_id, user_id, blob in rows.iterator():
+        try:
+            tags_data = json.loads(blob)
+        except ValueError:
+            continue
+        if not isinstance(tags_data, dict):
+            continue
+        for name, color in tags_data.items():
+            name = str(name).strip()[:100]
+            if name:
+                expense_tags[(expense_id, name)] = (user_id, str(color or '#8888ff')[:20])
+
+    Tag.objects.bulk_create(
+        [Tag(user_id=user_id, name=name) for user_id, name in {
+            (user_id, name) for (_, name), (user_id, _) in expense_tags.items()
+        }],
+        batch_size=1000,
+    )
+    tag_ids = {(user_id, name): pk for pk, user_id, name in Tag.objects.values_list('id', 'user_id', 'name')}
+    ExpenseTag.objects.bulk_create(
+        [
+            ExpenseTag(expense_id=expense_id, tag_id=tag_ids[(user_id, name)], color=color)
+            for (expense_id, name), (user_id, color) in expense_tags.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def copy_tags_back(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseTag = apps.get_model('expenses', 'ExpenseTag')
+
+    tags_by_expense = {}
+    for expense_id, name, color in ExpenseTag.objects.values_list('expense_id', 'tag__name', 'color').iterator():
+        tags_by_expense.setdefault(expense_id, {})[name] = color
+    for expense_id, tags_data in tags_by_expense.items():
+        Expense.objects.filter(pk=expense_id).update(tags_json=json.dumps(tags_data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0009_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExpenseTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('color', models.CharField(default='#8888ff', max_length=20)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_tags', to='expenses.expense')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_tags', to='expenses.tag')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_user_tag'),
+        ),
+        migrations.AddIndex(
+            model_name='expensetag',
+            index=models.Index(fields=['tag', 'expense'], name='expensetag_tag_expense_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='expensetag',
+            constraint=models.UniqueConstraint(fields=('expense', 'tag'), name='unique_expense_tag'),
+        ),
+        migrations.RunPython(copy_tags_json, copy_tags_back),
+        migrations.RemoveField(
+            model_name='expense',
+            name='tags_json',
+        ),
+    ]
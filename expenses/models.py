@@ -1,8 +1,26 @@
-from django.db import models
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.db.models.functions import TruncMonth
+from django.dispatch import Signal
 from django.contrib.auth.models import User
 from django.utils import timezone
-import json
-from datetime import datetime, timedelta
+from .schedule import next_occurrence
+
+# Sent after queryset-level writes (update, bulk_create, bulk_update) that skip
+# the per-row model signals. `user_months` is a set of (user_id, month) pairs
+# whose spending totals may have changed.
+expenses_bulk_changed = Signal()
+
+# Sent after queryset updates that leave the spending totals alone. `user_ids`
+# is the set of users whose expenses were modified.
+expenses_bulk_written = Signal()
+
+# Set while ExpenseQuerySet.bulk_update runs its per-batch update() queries
+_in_bulk_update = ContextVar('expense_bulk_update', default=False)
+
+# Fields that feed the per-month spending totals
+ROLLUP_FIELDS = {'user', 'user_id', 'category', 'category_id', 'amount', 'date'}
 
 class Category(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -13,9 +31,83 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='category_user_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+class ExpenseQuerySet(models.QuerySet):
+    def user_months(self):
+        """Return the distinct (user_id, month) pairs covered by this queryset"""
+        return set(
+            self.annotate(rollup_month=TruncMonth('date'))
+            .order_by()
+            .values_list('user_id', 'rollup_month')
+            .distinct()
+        )
+
+    def update(self, **kwargs):
+        # auto_now only applies to save(); delta sync relies on updated_at
+        kwargs.setdefault('updated_at', timezone.now())
+        if _in_bulk_update.get():
+            # Django's bulk_update runs update() per batch; bulk_update reports the change once
+            return super().update(**kwargs)
+        if not ROLLUP_FIELDS.intersection(kwargs):
+            with transaction.atomic(using=self.db):
+                user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+                rows = super().update(**kwargs)
+                expenses_bulk_written.send(sender=self.model, user_ids=user_ids)
+            return rows
+
+        with transaction.atomic(using=self.db):
+            user_months = self.user_months()
+            moves_rows = 'date' in kwargs or 'user' in kwargs or 'user_id' in kwargs
+            pks = list(self.values_list('pk', flat=True)) if moves_rows else None
+            rows = super().update(**kwargs)
+            if moves_rows:
+                user_months |= self.model.objects.filter(pk__in=pks).user_months()
+            expenses_bulk_changed.send(sender=self.model, user_months=user_months)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            expenses_bulk_changed.send(
+                sender=self.model,
+                user_months={(obj.user_id, obj.date_value.replace(day=1)) for obj in objs},
+            )
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        fields = list(dict.fromkeys([*fields, 'updated_at']))
+        if not ROLLUP_FIELDS.intersection(fields):
+            with transaction.atomic(using=self.db):
+                rows = self._bulk_update(objs, fields, *args, **kwargs)
+                expenses_bulk_written.send(sender=self.model, user_ids={obj.user_id for obj in objs})
+            return rows
+
+        with transaction.atomic(using=self.db):
+            user_months = self.model.objects.filter(pk__in=[obj.pk for obj in objs]).user_months()
+            rows = self._bulk_update(objs, fields, *args, **kwargs)
+            user_months |= {(obj.user_id, obj.date_value.replace(day=1)) for obj in objs}
+            expenses_bulk_changed.send(sender=self.model, user_months=user_months)
+        return rows
+
+    def _bulk_update(self, objs, fields, *args, **kwargs):
+        token = _in_bulk_update.set(True)
+        try:
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        finally:
+            _in_bulk_update.reset(token)
+
 class Expense(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
@@ -26,29 +118,87 @@ class Expense(models.Model):
     recurring_expense = models.ForeignKey('RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True, related_name='generated_expenses')
     receipt = models.ForeignKey('Receipt', on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True, help_text="Optional notes for this expense")
-    tags_json = models.TextField(blank=True, null=True, default='{}')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ExpenseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of expense_list: WHERE user = ? ORDER BY date DESC, id DESC
+            models.Index(fields=['user', 'date', 'id'], name='expense_user_date_id_idx'),
+            models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+            # Delta sync: WHERE user = ? AND updated_at > ? ORDER BY updated_at, id
+            models.Index(fields=['user', 'updated_at'], name='expense_user_updated_idx'),
+        ]
     
+    @property
+    def date_value(self):
+        """`date` as a date, also when it was assigned as an ISO string and not yet reloaded"""
+        return self._meta.get_field('date').to_python(self.date)
+
     @property
     def tags_with_colors(self):
-        """Return a list of (tag, color) tuples from the JSON data"""
-        if not self.tags_json:
-            return []
-        try:
-            tags_data = json.loads(self.tags_json)
-            return [(tag, color) for tag, color in tags_data.items()]
-        except:
-            return []
+        """Return a list of (tag, color) tuples; prefetch 'expense_tags__tag' when listing expenses"""
+        return [(expense_tag.tag.name, expense_tag.color) for expense_tag in self.expense_tags.all()]
     
     @property
     def tags(self):
         """Return just the list of tags"""
         return [tag for tag, _ in self.tags_with_colors]
 
+    def set_tags(self, tags_data):
+        """Replace this expense's tags with `tags_data`, a {name: color} dict"""
+        tags_data = {name.strip()[:Tag.NAME_MAX_LENGTH]: color for name, color in tags_data.items() if name.strip()}
+        with transaction.atomic():
+            ExpenseTag.objects.filter(expense=self).delete()
+            if not tags_data:
+                return
+            Tag.objects.bulk_create(
+                [Tag(user_id=self.user_id, name=name) for name in tags_data], ignore_conflicts=True
+            )
+            tags = Tag.objects.filter(user_id=self.user_id, name__in=tags_data)
+            ExpenseTag.objects.bulk_create([
+                ExpenseTag(expense=self, tag=tag, color=tags_data[tag.name] or DEFAULT_TAG_COLOR) for tag in tags
+            ])
+
     def __str__(self):
         return f"{self.description} - UGX {self.amount}"
 
+DEFAULT_TAG_COLOR = '#8888ff'
+
+class Tag(models.Model):
+    NAME_MAX_LENGTH = 100
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=NAME_MAX_LENGTH)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_user_tag'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class ExpenseTag(models.Model):
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='expense_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='expense_tags')
+    color = models.CharField(max_length=20, default=DEFAULT_TAG_COLOR)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['expense', 'tag'], name='unique_expense_tag'),
+        ]
+        indexes = [
+            # Tag filters look up expenses by tag
+            models.Index(fields=['tag', 'expense'], name='expensetag_tag_expense_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.expense_id} - {self.tag}"
+
 class RecurringExpense(models.Model):
     FREQUENCY_CHOICES = [
         ('daily', 'Daily'),
@@ -81,6 +231,14 @@ class RecurringExpense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'next_date'], name='recurring_user_status_idx'),
+            # generate_recurring_expenses scans due templates across all users
+            models.Index(fields=['status', 'next_date'], name='recurring_status_next_idx'),
+            models.Index(fields=['user', 'updated_at'], name='recurring_user_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.description} - {self.get_frequency_display()} (UGX {self.amount})"
     
@@ -91,66 +249,12 @@ class RecurringExpense(models.Model):
     def calculate_next_date(self):
         if not self.last_generated:
             return self.start_date
-            
-        current_date = self.last_generated
-        
-        if self.frequency == 'daily':
-            next_date = current_date + timedelta(days=1)
-        elif self.frequency == 'weekly':
-            next_date = current_date + timedelta(weeks=1)
-        elif self.frequency == 'biweekly':
-            next_date = current_date + timedelta(weeks=2)
-        elif self.frequency == 'monthly':
-            # Handle month rollover properly
-            month = current_date.month + 1
-            year = current_date.year
-            if month > 12:
-                month = 1
-                year += 1
-                
-            # Handle day of month preference if set
-            if self.day_of_month:
-                day = min(self.day_of_month, 28)  # Ensure valid for all months
-            else:
-                day = current_date.day
-                
-            # Adjust for months with fewer days
-            while True:
-                try:
-                    next_date = datetime(year, month, day).date()
-                    break
-                except ValueError:
-                    day -= 1
-        elif self.frequency == 'quarterly':
-            # Add 3 months
-            month = current_date.month + 3
-            year = current_date.year
-            if month > 12:
-                month = month - 12
-                year += 1
-            
-            day = min(current_date.day, 28)
-            next_date = datetime(year, month, day).date()
-        elif self.frequency == 'biannual':
-            # Add 6 months
-            month = current_date.month + 6
-            year = current_date.year
-            if month > 12:
-                month = month - 12
-                year += 1
-            
-            day = min(current_date.day, 28)
-            next_date = datetime(year, month, day).date()
-        elif self.frequency == 'annual':
-            # Add a year
-            next_date = datetime(current_date.year + 1, 
-                                current_date.month, 
-                                min(current_date.day, 28)).date()
-        else:
-            # Default to monthly if unknown frequency
-            next_date = current_date + timedelta(days=30)
-            
-        return next_date
+
+        return self.next_date_after(self.last_generated)
+
+    def next_date_after(self, current_date):
+        """Return the occurrence that follows `current_date`"""
+        return next_occurrence(self, current_date)
     
     def is_due(self):
         """Check if this recurring expense is due to be generated"""
@@ -204,6 +308,91 @@ class Receipt(models.Model):
     def __str__(self):
         return f"Receipt {self.id} - {self.user.username}"
 
+class ReceiptOCRJob(models.Model):
+    """A queued OCR run for an uploaded receipt, picked up by the process_receipts worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    receipt = models.OneToOneField(Receipt, on_delete=models.CASCADE, related_name='ocr_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    expense = models.ForeignKey('Expense', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ocr_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"OCR job for receipt {self.receipt_id} ({self.status})"
+
+class ImportJob(models.Model):
+    """An uploaded CSV or OFX statement, imported by the process_imports worker"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ofx', 'OFX / QFX bank statement'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file = models.FileField(upload_to='imports/')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    # CSV column mapping: {'date': ..., 'description': ..., 'amount': ..., 'category': ..., 'date_format': ...}
+    mapping = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    processed_rows = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    errors = models.TextField(blank=True, help_text="First few row errors, one per line")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='import_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import {self.id} - {self.user.username} ({self.status})"
+
+class SyncTombstone(models.Model):
+    """Record of a deleted synced object, so /api/sync/ can report deletions"""
+    KIND_CHOICES = [
+        ('categories', 'Category'),
+        ('expenses', 'Expense'),
+        ('budgets', 'Budget'),
+        ('recurring', 'Recurring expense'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted {self.deleted_at}"
+
 class SharedExpense(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE)
     shared_with = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shared_expenses')
@@ -226,3 +415,26 @@ class CategoryRule(models.Model):
 
     def __str__(self):
         return f"{self.category.name} - {self.pattern}"
+
+class MonthlyCategoryRollup(models.Model):
+    """Per-user spending totals for each category and calendar month.
+
+    Maintained incrementally from Expense writes (see expenses.signals) so that
+    dashboards read a handful of rows instead of summing the raw ledger.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    month = models.DateField(help_text="First day of the month")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'month'], name='unique_monthly_category_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month'], name='rollup_user_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category or 'Uncategorized'} - {self.month:%b %Y}: UGX {self.total}"
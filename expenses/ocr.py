@@ -0,0 +1,78 @@
+"""Receipt OCR helpers.
+
+`run_ocr` is a plain function of a file path so it can run in a worker process
+(see the process_receipts management command) without touching the database.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+AMOUNT_PATTERN = r'\$?\d+\,?\d*\.\d{2}'
+DATE_FORMATS = [
+    (r'\d{2}/\d{2}/\d{4}', '%d/%m/%Y'),
+    (r'\d{2}-\d{2}-\d{4}', '%d-%m-%Y'),
+    (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d'),
+]
+
+
+def extract_text(image_path, tesseract_cmd=None):
+    """Threshold the receipt image and run Tesseract over it"""
+    # Imported here so web processes that only enqueue jobs don't load OpenCV
+    import cv2
+    import numpy as np
+    import pytesseract
+    from PIL import Image
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    with Image.open(image_path) as image:
+        image_np = np.array(image.convert('RGB'))
+
+    # Convert to grayscale
+    gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
+    # Thresholding
+    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+    return pytesseract.image_to_string(thresh)
+
+
+def parse_receipt_text(text):
+    """Pull the amount, date and merchant out of OCR text"""
+    result = {'amount': None, 'date': None, 'merchant': ''}
+
+    # Try to extract amount
+    amounts = []
+    for match in re.findall(AMOUNT_PATTERN, text):
+        try:
+            amounts.append(Decimal(match.replace('$', '').replace(',', '')))
+        except InvalidOperation:
+            continue
+    if amounts:
+        result['amount'] = max(amounts)
+
+    # Try to extract date
+    for pattern, date_format in DATE_FORMATS:
+        for found in re.findall(pattern, text):
+            try:
+                result['date'] = datetime.strptime(found, date_format).date()
+                break
+            except ValueError:
+                continue
+        if result['date']:
+            break
+
+    # Try to extract merchant name (first line that's not a date or amount)
+    for line in text.split('\n'):
+        line = line.strip()
+        if line and not re.search(AMOUNT_PATTERN, line) and not any(re.search(p, line) for p, _ in DATE_FORMATS):
+            result['merchant'] = line[:200]  # Limit to model field size
+            break
+
+    return result
+
+
+def run_ocr(image_path, tesseract_cmd=None):
+    """Extract and parse one receipt; safe to call in a child process"""
+    text = extract_text(image_path, tesseract_cmd)
+    return text, parse_receipt_text(text)
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .matching import suggest_category_id
+from .models import Expense, ReceiptOCRJob
+
+
+def enqueue_receipt(receipt):
+    job, _ = ReceiptOCRJob.objects.update_or_create(
+        receipt=receipt,
+        defaults={'status': 'pending', 'error': '', 'started_at': None, 'finished_at': None},
+    )
+    return job
+
+
+def claim_jobs(limit):
+    """Mark up to `limit` pending jobs as running and return them.
+
+    Each job is claimed with a conditional UPDATE, so concurrent workers never
+    pick up the same job.
+    """
+    claimed = []
+    candidates = (
+        ReceiptOCRJob.objects.filter(status='pending')
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    for pk in list(candidates):
+        won = ReceiptOCRJob.objects.filter(pk=pk, status='pending').update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if won:
+            claimed.append(pk)
+    return list(ReceiptOCRJob.objects.filter(pk__in=claimed).select_related('receipt', 'receipt__user'))
+
+
+def requeue_stale_jobs(older_than, max_attempts):
+    """Return jobs stuck in 'running' (e.g. after a worker crash) to the queue.
+
+    Jobs that have used up their attempts are failed instead, so a receipt
+    that hangs or kills its worker every time is not retried forever.
+    """
+    now = timezone.now()
+    stale = ReceiptOCRJob.objects.filter(status='running', started_at__lt=now - older_than)
+    stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='Timed out or worker died while processing', finished_at=now
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status='pending')
+
+
+def complete_job(job, text, parsed):
+    receipt = job.receipt
+    with transaction.atomic():
+        # The user may have filled the receipt in by hand while it was queued
+        if not receipt.is_processed:
+            receipt.extracted_text = text
+            receipt.extracted_amount = parsed['amount']
+            receipt.extracted_date = parsed['date']
+            receipt.extracted_merchant = parsed['merchant']
+            receipt.is_processed = True
+            receipt.save()
+
+            # Create expense if we have an amount
+            if receipt.extracted_amount and not Expense.objects.filter(receipt=receipt).exists():
+                description = receipt.extracted_merchant or 'Receipt expense'
+                job.expense = Expense.objects.create(
+                    user=receipt.user,
+                    category_id=suggest_category_id(receipt.user, description),
+                    amount=receipt.extracted_amount,
+                    date=receipt.extracted_date or timezone.now().date(),
+                    description=description,
+                    receipt=receipt,
+                )
+
+        job.status = 'done'
+        job.error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'expense'])
+
+
+def fail_job(job, error, max_attempts):
+    job.status = 'pending' if job.attempts < max_attempts else 'failed'
+    job.error = str(error)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
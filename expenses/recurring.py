@@ -0,0 +1,110 @@
+"""Batch generation of expenses from due RecurringExpense templates.
+
+Run from the generate_recurring_expenses management command on a schedule
+rather than from page views.
+"""
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Expense, RecurringExpense
+from .schedule import expand, next_occurrence
+
+
+def due_dates(recurring_expenses, today):
+    """Return {pk: (missed occurrences up to `today`, next date after them)} for active templates.
+
+    The missed occurrences of the whole batch come from one `schedule.expand`
+    call; only the next date is stepped to from the last of them.
+    """
+    recurring_expenses = list(recurring_expenses)
+    if not recurring_expenses:
+        return {}
+    expanded = expand(recurring_expenses, min(r.next_date for r in recurring_expenses), today)
+    due = {}
+    for recurring in recurring_expenses:
+        dates = list(expanded[recurring.pk].astype(date))
+        due[recurring.pk] = (dates, next_occurrence(recurring, dates[-1]) if dates else recurring.next_date)
+    return due
+
+
+def _lock(queryset):
+    if not connection.features.has_select_for_update:
+        return queryset
+    if connection.features.has_select_for_update_skip_locked:
+        # Templates another run is already generating are left to that run
+        return queryset.select_for_update(skip_locked=True)
+    return queryset.select_for_update()
+
+
+def generate_due_expenses(today=None, batch_size=500):
+    """Generate all missed occurrences of every active recurring expense.
+
+    Templates are processed in batches; each batch is locked, its expenses are
+    written with one bulk_create and the templates are advanced with one
+    bulk_update inside a single transaction. Occurrences that already have an
+    expense are skipped, so overlapping runs never create duplicates.
+    Returns (expenses created, templates advanced).
+    """
+    today = today or timezone.now().date()
+    due_ids = list(
+        RecurringExpense.objects.filter(status='active', next_date__lte=today)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+    created = advanced = 0
+    for start in range(0, len(due_ids), batch_size):
+        with transaction.atomic():
+            batch = list(_lock(
+                RecurringExpense.objects.filter(
+                    pk__in=due_ids[start:start + batch_size], status='active', next_date__lte=today
+                )
+            ))
+            if not batch:
+                continue
+
+            existing = set(
+                Expense.objects.filter(
+                    recurring_expense__in=batch,
+                    date__gte=min(recurring.next_date for recurring in batch),
+                    date__lte=today,
+                ).values_list('recurring_expense_id', 'date')
+            )
+
+            now = timezone.now()
+            expenses = []
+            due = due_dates(batch, today)
+            for recurring in batch:
+                dates, next_date = due[recurring.pk]
+                for day in dates:
+                    if (recurring.pk, day) in existing:
+                        continue
+                    expenses.append(Expense(
+                        user_id=recurring.user_id,
+                        category_id=recurring.category_id,
+                        amount=recurring.amount,
+                        description=recurring.description,
+                        date=day,
+                        is_recurring=True,
+                        recurring_expense=recurring,
+                        notes=recurring.notes,
+                    ))
+
+                if dates:
+                    recurring.last_generated = dates[-1]
+                recurring.next_date = next_date
+                # Check if we've reached the end date
+                if recurring.end_date and next_date > recurring.end_date:
+                    recurring.status = 'completed'
+                recurring.updated_at = now
+
+            Expense.objects.bulk_create(expenses, batch_size=batch_size)
+            RecurringExpense.objects.bulk_update(
+                batch, ['last_generated', 'next_date', 'status', 'updated_at'], batch_size=batch_size
+            )
+            created += len(expenses)
+            advanced += len(batch)
+
+    return created, advanced
@@ -0,0 +1,111 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Expense, MonthlyCategoryRollup
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def apply_delta(user_id, category_id, month, amount, count):
+    """Add `amount` and `count` to one (user, category, month) rollup row"""
+    rows = MonthlyCategoryRollup.objects.filter(user_id=user_id, category_id=category_id, month=month)
+    if rows.update(total=F('total') + amount, count=F('count') + count):
+        return
+    # Only create rows for new spending; a negative delta for a missing row means
+    # the row (or its user/category) is already gone.
+    if count <= 0:
+        return
+    try:
+        with transaction.atomic():
+            MonthlyCategoryRollup.objects.create(
+                user_id=user_id, category_id=category_id, month=month, total=amount, count=count
+            )
+    except IntegrityError:
+        rows.update(total=F('total') + amount, count=F('count') + count)
+
+
+def rebuild(user_months):
+    """Recompute the rollup rows for the given (user_id, month) pairs from the ledger"""
+    months_by_user = defaultdict(set)
+    for user_id, month in user_months:
+        months_by_user[user_id].add(month_start(month))
+
+    with transaction.atomic():
+        for user_id, months in months_by_user.items():
+            MonthlyCategoryRollup.objects.filter(user_id=user_id, month__in=months).delete()
+            totals = (
+                Expense.objects.filter(user_id=user_id)
+                .annotate(month=TruncMonth('date'))
+                .filter(month__in=months)
+                .values('category_id', 'month')
+                .annotate(total=Sum('amount'), count=Count('id'))
+                .order_by()
+            )
+            MonthlyCategoryRollup.objects.bulk_create([
+                MonthlyCategoryRollup(user_id=user_id, category_id=row['category_id'], month=row['month'],
+                                      total=row['total'], count=row['count'])
+                for row in totals
+            ])
+
+
+def rebuild_all(users=None, batch_size=1000):
+    """Recompute every rollup row, optionally only for the given users"""
+    expenses = Expense.objects.all()
+    rollups = MonthlyCategoryRollup.objects.all()
+    if users is not None:
+        expenses = expenses.filter(user__in=users)
+        rollups = rollups.filter(user__in=users)
+
+    totals = (
+        expenses.annotate(month=TruncMonth('date'))
+        .values('user_id', 'category_id', 'month')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = MonthlyCategoryRollup.objects.bulk_create(
+            (MonthlyCategoryRollup(**row) for row in totals.iterator()),
+            batch_size=batch_size,
+        )
+    return len(created)
+
+
+# Read helpers used by the dashboards
+
+def monthly_totals(user, first_month, last_month):
+    """Return {month: total} for every month with spending in [first_month, last_month]"""
+    rows = (
+        MonthlyCategoryRollup.objects.filter(user=user, month__gte=month_start(first_month),
+                                             month__lte=month_start(last_month))
+        .values('month')
+        .annotate(month_total=Sum('total'))
+        .order_by()
+    )
+    return {row['month']: row['month_total'] for row in rows}
+
+
+def month_total(user, month, category=None):
+    """Return the total spent in one month, optionally limited to one category"""
+    rows = MonthlyCategoryRollup.objects.filter(user=user, month=month_start(month))
+    if category is not None:
+        rows = rows.filter(category=category)
+    return rows.aggregate(month_total=Sum('total'))['month_total'] or 0
+
+
+def category_totals(user, first_month, last_month=None):
+    """Return per-category rows (category id, name, color, icon, total, count) for a month range"""
+    last_month = last_month or first_month
+    return (
+        MonthlyCategoryRollup.objects.filter(user=user, month__gte=month_start(first_month),
+                                             month__lte=month_start(last_month))
+        .values('category_id', 'category__name', 'category__color', 'category__icon')
+        .annotate(category_total=Sum('total'), category_count=Sum('count'))
+        .filter(category_count__gt=0)
+        .order_by('-category_total')
+    )
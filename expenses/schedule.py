@@ -0,0 +1,141 @@
+"""Recurrence schedule expansion for RecurringExpense.
+
+`expand` returns every occurrence of a set of recurring expenses inside a date
+window using NumPy datetime64 arithmetic, one array operation per frequency
+kind instead of a Python loop per occurrence. Month-based schedules keep their
+anchor day and clamp it to the length of each month, so a bill due on the
+31st falls on Feb 28/29 and returns to the 31st in March.
+"""
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+DAY_STEPS = {'daily': 1, 'weekly': 7, 'biweekly': 14}
+MONTH_STEPS = {'monthly': 1, 'quarterly': 3, 'biannual': 6, 'annual': 12}
+# Unknown frequencies have always been treated as every 30 days
+DEFAULT_DAY_STEP = 30
+
+EMPTY = np.array([], dtype='datetime64[D]')
+
+
+def anchor_day(recurring):
+    """Day of the month a month-based schedule falls on"""
+    if recurring.frequency == 'monthly' and recurring.day_of_month:
+        return recurring.day_of_month
+    return recurring.start_date.day
+
+
+def next_occurrence(recurring, current):
+    """Return the occurrence after `current`; the scalar counterpart of `expand`"""
+    months = MONTH_STEPS.get(recurring.frequency)
+    if months is None:
+        return current + timedelta(days=DAY_STEPS.get(recurring.frequency, DEFAULT_DAY_STEP))
+
+    month_index = current.year * 12 + current.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(anchor_day(recurring), calendar.monthrange(year, month + 1)[1])
+    return date(year, month + 1, day)
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _expand_days(items, start, end):
+    first = np.array([r.next_date for r in items], dtype='datetime64[D]')
+    last = np.array([min(end, r.end_date) if r.end_date else end for r in items], dtype='datetime64[D]')
+    step = np.array([DAY_STEPS.get(r.frequency, DEFAULT_DAY_STEP) for r in items])
+
+    # Skip straight to the first occurrence on or after `start`
+    skip = np.maximum(0, _ceil_div((np.datetime64(start, 'D') - first).astype(int), step))
+    count = np.maximum(0, (last - first).astype(int) // step - skip + 1)
+    width = int(count.max()) if len(count) else 0
+
+    offsets = skip[:, None] + np.arange(width)[None, :]
+    dates = first[:, None] + (offsets * step[:, None]).astype('timedelta64[D]')
+    valid = np.arange(width)[None, :] < count[:, None]
+    return {r.pk: dates[i][valid[i]] for i, r in enumerate(items)}
+
+
+def _expand_months(items, start, end):
+    start = np.datetime64(start, 'D')
+    first = np.array([r.next_date for r in items], dtype='datetime64[D]')
+    last = np.array([min(end, r.end_date) if r.end_date else end for r in items], dtype='datetime64[D]')
+    step = np.array([MONTH_STEPS[r.frequency] for r in items])
+    anchor = np.array([anchor_day(r) for r in items])
+
+    first_month = first.astype('datetime64[M]')
+    skip = np.maximum(0, (start.astype('datetime64[M]') - first_month).astype(int) // step)
+    count = np.maximum(0, (last.astype('datetime64[M]') - first_month).astype(int) // step - skip + 1)
+    width = int(count.max()) if len(count) else 0
+
+    offsets = skip[:, None] + np.arange(width)[None, :]
+    months = first_month[:, None] + (offsets * step[:, None]).astype('timedelta64[M]')
+    month_start = months.astype('datetime64[D]')
+    month_length = ((months + 1).astype('datetime64[D]') - month_start).astype(int)
+    dates = month_start + (np.minimum(anchor[:, None], month_length) - 1).astype('timedelta64[D]')
+    # The first occurrence is next_date itself, whatever day it falls on
+    dates = np.where(offsets == 0, first[:, None], dates)
+
+    valid = (np.arange(width)[None, :] < count[:, None]) & (dates >= start) & (dates <= last[:, None])
+    return {r.pk: dates[i][valid[i]] for i, r in enumerate(items)}
+
+
+def expand(recurring_expenses, start, end):
+    """Return {recurring_expense.pk: datetime64[D] array} of occurrences between `start` and `end` inclusive.
+
+    Only active schedules produce occurrences; they start at `next_date` and
+    stop at `end_date`.
+    """
+    recurring_expenses = list(recurring_expenses)
+    result = {r.pk: EMPTY for r in recurring_expenses}
+    active = [r for r in recurring_expenses if r.status == 'active' and r.next_date <= end]
+
+    by_days = [r for r in active if r.frequency not in MONTH_STEPS]
+    by_months = [r for r in active if r.frequency in MONTH_STEPS]
+    if by_days:
+        result.update(_expand_days(by_days, start, end))
+    if by_months:
+        result.update(_expand_months(by_months, start, end))
+    return result
+
+
+def occurrences(recurring_expenses, start, end):
+    """Return [(date, recurring_expense)] for every occurrence in the window, in date order"""
+    recurring_expenses = list(recurring_expenses)
+    expanded = expand(recurring_expenses, start, end)
+    rows = [
+        (day, recurring)
+        for recurring in recurring_expenses
+        for day in expanded[recurring.pk].astype(date)
+    ]
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def monthly_forecast(recurring_expenses, first_month, months=12):
+    """Return [{'month': date, 'total': Decimal, 'count': int}] of projected recurring spend per month"""
+    recurring_expenses = list(recurring_expenses)
+    first_month = first_month.replace(day=1)
+    start = np.datetime64(first_month, 'M')
+    end = ((start + months).astype('datetime64[D]') - 1).astype(date)
+
+    totals = [Decimal('0')] * months
+    counts = np.zeros(months, dtype=int)
+    expanded = expand(recurring_expenses, first_month, end)
+    for recurring in recurring_expenses:
+        dates = expanded[recurring.pk]
+        if not len(dates):
+            continue
+        per_month = np.bincount((dates.astype('datetime64[M]') - start).astype(int), minlength=months)
+        counts += per_month
+        for index in np.flatnonzero(per_month):
+            totals[index] += recurring.amount * int(per_month[index])
+
+    month_starts = (start + np.arange(months)).astype('datetime64[D]').astype(date)
+    return [
+        {'month': month, 'total': total, 'count': int(count)}
+        for month, total, count in zip(month_starts, totals, counts)
+    ]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Expense, Category
+from .models import Expense, Category, RecurringExpense
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,6 +9,23 @@ class CategorySerializer(serializers.ModelSerializer):
 class ExpenseSerializer(serializers.ModelSerializer):
     category_details = CategorySerializer(source='category', read_only=True)
     
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            # Expenses can only be filed under the requesting user's own categories
+            self.fields['category'].queryset = Category.objects.filter(user=request.user)
+        if fields is not None:
+            # Sparse fieldset: keep only the requested fields
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
     class Meta:
         model = Expense
         fields = ['id', 'description', 'amount', 'date', 'category', 'category_details', 'notes', 'is_recurring']
+
+class RecurringExpenseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecurringExpense
+        fields = ['id', 'description', 'amount', 'category', 'frequency', 'start_date', 'end_date',
+                  'next_date', 'day_of_month', 'status', 'notes']
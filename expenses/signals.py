@@ -0,0 +1,209 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from budgets.models import Budget
+from users import balances
+from users.models import DataVersion, IncomeSource, Profile, RecurringBill
+from .timeseries import add_months
+from .models import (
+    Expense, Category, CategoryRule, MonthlyCategoryRollup, RecurringExpense, SyncTombstone,
+    expenses_bulk_changed, expenses_bulk_written,
+)
+from .matching import invalidate_matcher
+from . import dashboard_cache, rollups
+
+
+@receiver(pre_save, sender=Expense)
+def remember_previous_expense(sender, instance, **kwargs):
+    """Keep the stored values of an edited expense so its old month can be debited"""
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = (
+            Expense.objects.filter(pk=instance.pk)
+            .values_list('user_id', 'category_id', 'date', 'amount')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Expense)
+def update_rollup_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        user_id, category_id, day, amount = previous
+        rollups.apply_delta(user_id, category_id, rollups.month_start(day), -amount, -1)
+    rollups.apply_delta(instance.user_id, instance.category_id, rollups.month_start(instance.date_value),
+                        instance.amount, 1)
+
+
+@receiver(post_delete, sender=Expense)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollups.apply_delta(instance.user_id, instance.category_id, rollups.month_start(instance.date_value),
+                        -instance.amount, -1)
+
+
+@receiver(expenses_bulk_changed, sender=Expense)
+def rebuild_rollup_on_bulk_change(sender, user_months, **kwargs):
+    rollups.rebuild(user_months)
+
+
+@receiver(post_save, sender=Expense)
+def update_balance_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        user_id, category_id, day, amount = previous
+        balances.apply_expense_delta(user_id, day, -amount)
+    balances.apply_expense_delta(instance.user_id, instance.date_value, instance.amount)
+
+
+@receiver(post_delete, sender=Expense)
+def update_balance_on_delete(sender, instance, **kwargs):
+    balances.apply_expense_delta(instance.user_id, instance.date_value, -instance.amount)
+
+
+@receiver(expenses_bulk_changed, sender=Expense)
+def invalidate_balance_on_bulk_change(sender, user_months, **kwargs):
+    since = {}
+    for user_id, month in user_months:
+        since[user_id] = min(since.get(user_id, month), month)
+    for user_id, month in since.items():
+        balances.invalidate([user_id], since=rollups.month_start(month))
+
+
+@receiver(post_save, sender=IncomeSource)
+@receiver(post_delete, sender=IncomeSource)
+def invalidate_balance_on_income_change(sender, instance, **kwargs):
+    balances.invalidate([instance.user_id])
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_rollup_months(sender, instance, **kwargs):
+    instance._rollup_user_months = set(
+        MonthlyCategoryRollup.objects.filter(category=instance).values_list('user_id', 'month')
+    )
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_rollup_on_category_delete(sender, instance, **kwargs):
+    # Expenses of a deleted category become uncategorized (SET_NULL) without
+    # per-row signals. Rebuild once the delete is committed, when any cascaded
+    # user deletion has also gone through.
+    user_months = getattr(instance, '_rollup_user_months', None)
+    if user_months:
+        transaction.on_commit(lambda: rollups.rebuild(user_months))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryRule)
+@receiver(post_delete, sender=CategoryRule)
+def invalidate_category_matcher(sender, instance, **kwargs):
+    invalidate_matcher(instance.user_id)
+
+
+def _invalidate_dashboard_months(user_months):
+    # A month's payload also compares against the month before it
+    months_by_user = defaultdict(set)
+    for user_id, month in user_months:
+        months_by_user[user_id] |= {month, add_months(month, 1)}
+    for user_id, months in months_by_user.items():
+        dashboard_cache.invalidate_months(user_id, months)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def invalidate_dashboard_on_expense_change(sender, instance, **kwargs):
+    user_months = {(instance.user_id, instance.date_value)}
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        user_months.add((previous[0], previous[2]))
+    _invalidate_dashboard_months(user_months)
+
+
+@receiver(expenses_bulk_changed, sender=Expense)
+def invalidate_dashboard_on_bulk_change(sender, user_months, **kwargs):
+    _invalidate_dashboard_months(user_months)
+
+
+@receiver(pre_save, sender=Budget)
+def remember_previous_budget_month(sender, instance, **kwargs):
+    instance._dashboard_previous_month = (
+        Budget.objects.filter(pk=instance.pk).values_list('month', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+def invalidate_dashboard_on_budget_change(sender, instance, **kwargs):
+    months = {instance.month}
+    if getattr(instance, '_dashboard_previous_month', None):
+        months.add(instance._dashboard_previous_month)
+    dashboard_cache.invalidate_months(instance.user_id, months)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=IncomeSource)
+@receiver(post_delete, sender=IncomeSource)
+@receiver(post_save, sender=RecurringBill)
+@receiver(post_delete, sender=RecurringBill)
+@receiver(post_save, sender=Profile)
+def invalidate_dashboard_for_user(sender, instance, **kwargs):
+    dashboard_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(post_save, sender=IncomeSource)
+@receiver(post_delete, sender=IncomeSource)
+@receiver(post_save, sender=Profile)
+def bump_data_version(sender, instance, **kwargs):
+    user_ids = {instance.user_id}
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        user_ids.add(previous[0])
+    DataVersion.bump(user_ids)
+
+
+@receiver(expenses_bulk_changed, sender=Expense)
+def bump_data_version_on_bulk_change(sender, user_months, **kwargs):
+    DataVersion.bump(user_id for user_id, month in user_months)
+
+
+@receiver(expenses_bulk_written, sender=Expense)
+def bump_data_version_on_bulk_write(sender, user_ids, **kwargs):
+    DataVersion.bump(user_ids)
+
+
+SYNC_KINDS = {Category: 'categories', Expense: 'expenses', Budget: 'budgets', RecurringExpense: 'recurring'}
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Budget)
+@receiver(post_delete, sender=RecurringExpense)
+def record_sync_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(user_id=instance.user_id, kind=SYNC_KINDS[sender], object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+def touch_rows_losing_category(sender, instance, **kwargs):
+    # SET_NULL rewrites these rows without saving them; stamp them so they sync
+    now = timezone.now()
+    Expense.objects.filter(category=instance).update(updated_at=now)
+    RecurringExpense.objects.filter(category=instance).update(updated_at=now)
+
+
+@receiver(post_delete, sender=User)
+def drop_tombstones_of_deleted_user(sender, instance, **kwargs):
+    # Tombstones recorded while the user's rows were cascaded would otherwise
+    # reference the deleted user
+    SyncTombstone.objects.filter(user_id=instance.pk).delete()
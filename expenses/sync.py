@@ -0,0 +1,138 @@
+"""Delta sync of a user's ledger for offline clients (/api/sync/).
+
+A sync pass returns every category, expense, budget and recurring template
+whose `updated_at` falls in (since, until], followed by the tombstones of
+objects deleted in that window. `until` is fixed when a pass starts, so rows
+changed while a client pages through it are picked up by the next pass
+instead of being skipped. Pages are keyset-paginated on (updated_at, id) and
+the position is carried in a signed, opaque sync token.
+
+Tokens expire after TOKEN_MAX_AGE, after which the client starts over with a
+full sync; tombstones older than that can no longer be asked for and are
+removed by the prune_sync_tombstones command.
+"""
+from datetime import datetime, timedelta
+
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from budgets.models import Budget
+from budgets.serializers import BudgetSerializer
+from .models import Category, Expense, RecurringExpense, SyncTombstone
+from .serializers import CategorySerializer, ExpenseSerializer, RecurringExpenseSerializer
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+# A pass stops slightly in the past so that transactions still committing
+# with an earlier updated_at are not missed
+SETTLE_TIME = timedelta(seconds=2)
+
+TOKEN_SALT = 'expenses.sync'
+TOKEN_MAX_AGE = timedelta(days=30)
+
+# kind: (model, serializer, related fields to select)
+KINDS = {
+    'categories': (Category, CategorySerializer, []),
+    'expenses': (Expense, ExpenseSerializer, ['category']),
+    'budgets': (Budget, BudgetSerializer, []),
+    'recurring': (RecurringExpense, RecurringExpenseSerializer, []),
+}
+PHASES = [*KINDS, 'deleted']
+
+
+class SyncTokenError(ValueError):
+    pass
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def encode_token(user, state):
+    return signing.dumps({**state, 'user': user.pk}, salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(user, token):
+    """Return the pass state stored in `token`; an empty token starts a full sync"""
+    if not token:
+        return {'since': None, 'until': None, 'phase': 0, 'after': None}
+    try:
+        state = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise SyncTokenError('Invalid sync token')
+    if state.get('user') != user.pk:
+        raise SyncTokenError('Invalid sync token')
+    # Deletions before the cutoff may already have been pruned
+    if state['since'] and _parse_time(state['since']) < timezone.now() - TOKEN_MAX_AGE:
+        raise SyncTokenError('Expired sync token')
+    return state
+
+
+def prune_tombstones():
+    """Delete the tombstones no valid token can ask for; return how many were deleted"""
+    deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=timezone.now() - TOKEN_MAX_AGE).delete()
+    return deleted
+
+
+def _window(queryset, field, since, until, after):
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if since:
+        queryset = queryset.filter(**{f'{field}__gt': since})
+    if after:
+        moment, pk = _parse_time(after[0]), after[1]
+        queryset = queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk}))
+    return queryset.order_by(field, 'id')
+
+
+def sync_page(user, token=None, limit=PAGE_SIZE):
+    """Return one page of changes for `user` along with the token for the next request"""
+    state = decode_token(user, token)
+    since = _parse_time(state['since'])
+    until = _parse_time(state['until'])
+    if until is None:
+        until = max(timezone.now() - SETTLE_TIME, since) if since else timezone.now() - SETTLE_TIME
+    phase, after = state['phase'], state['after']
+
+    changes = {kind: {'created': [], 'updated': [], 'deleted': []} for kind in KINDS}
+    remaining = limit
+    while phase < len(PHASES) and remaining > 0:
+        kind = PHASES[phase]
+        if kind == 'deleted':
+            if since is None:
+                # A full sync has nothing to delete on the client
+                phase += 1
+                continue
+            rows = list(_window(SyncTombstone.objects.filter(user=user), 'deleted_at', since, until, after)
+                        [:remaining + 1])
+            for tombstone in rows[:remaining]:
+                changes[tombstone.kind]['deleted'].append(tombstone.object_id)
+            last_moment = rows[remaining - 1].deleted_at if len(rows) > remaining else None
+        else:
+            model, serializer, related = KINDS[kind]
+            queryset = model.objects.filter(user=user).select_related(*related)
+            rows = list(_window(queryset, 'updated_at', since, until, after)[:remaining + 1])
+            for obj, data in zip(rows[:remaining], serializer(rows[:remaining], many=True).data):
+                created = since is None or obj.created_at > since
+                changes[kind]['created' if created else 'updated'].append(data)
+            last_moment = rows[remaining - 1].updated_at if len(rows) > remaining else None
+
+        if last_moment is not None:
+            # This phase continues on the next page
+            after = [last_moment.isoformat(), rows[remaining - 1].id]
+            remaining = 0
+        else:
+            remaining -= len(rows)
+            phase, after = phase + 1, None
+
+    has_more = phase < len(PHASES)
+    if has_more:
+        next_state = {'since': state['since'], 'until': until.isoformat(), 'phase': phase, 'after': after}
+    else:
+        next_state = {'since': until.isoformat(), 'until': None, 'phase': 0, 'after': None}
+    return {
+        **changes,
+        'token': encode_token(user, next_state),
+        'has_more': has_more,
+        'server_time': until.isoformat(),
+    }
@@ -1,3 +1,1052 @@
-from django.test import TestCase
+import json
+import tempfile
+from collections import defaultdict
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from budgets.models import Budget
+from users.models import DataVersion, IncomeSource
+from . import dashboard_cache, rollups, sync, timeseries
+from .aggregation import dashboard_summary, user_tags
+from .importers import claim_next_job, process_job
+from .matching import get_matcher
+from .merging import MergeError, merge_categories
+from .models import (
+    Category, CategoryRule, Expense, ImportJob, MonthlyCategoryRollup, Receipt, ReceiptOCRJob, RecurringExpense,
+    SyncTombstone, Tag,
+)
+from .ocr import parse_receipt_text
+from .ocr_queue import claim_jobs, complete_job, enqueue_receipt, fail_job, requeue_stale_jobs
+from .recurring import generate_due_expenses
+from .schedule import expand, monthly_forecast
+from .timeseries import add_months
+
+
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.today = date(2024, 3, 15)
+
+    def add_expense(self, category, amount, day, tags=None):
+        expense = Expense.objects.create(
+            user=self.user,
+            category=category,
+            amount=Decimal(amount),
+            description='Test expense',
+            date=day,
+        )
+        expense.set_tags(tags or {})
+        return expense
+
+    def seed(self, category_count):
+        for i in range(category_count):
+            category = Category.objects.create(user=self.user, name=f'Category {i}')
+            for months_back in range(6):
+                day = add_months(self.today, -months_back).replace(day=10)
+                self.add_expense(category, '100.00', day, {f'tag{i}': '#ffffff'})
+
+    def test_totals_trend_and_tags(self):
+        food = Category.objects.create(user=self.user, name='Food')
+        rent = Category.objects.create(user=self.user, name='Rent')
+        self.add_expense(food, '50.00', date(2024, 3, 1), {'groceries': '#00ff00'})
+        self.add_expense(rent, '300.00', date(2024, 3, 31), {'home': '#0000ff'})
+        self.add_expense(food, '20.00', date(2024, 2, 29))
+        self.add_expense(food, '5.00', date(2023, 9, 30))  # Outside the 6-month window
+
+        summary = dashboard_summary(self.user, self.today)
+
+        self.assertEqual(summary['total_spent'], Decimal('350.00'))
+        self.assertEqual(summary['prev_month_spent'], Decimal('20.00'))
+        self.assertEqual(summary['top_category'], rent)
+        self.assertEqual([c['name'] for c in summary['category_spending']], ['Rent', 'Food'])
+        self.assertEqual(summary['months'], ['Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar'])
+        self.assertEqual(summary['spending_trend'], [0.0, 0.0, 0.0, 0.0, 20.0, 350.0])
+        self.assertEqual(summary['all_tags'], ['groceries', 'home'])
+
+    def test_query_count_is_constant(self):
+        self.seed(2)
+        with self.assertNumQueries(5):
+            dashboard_summary(self.user, self.today)
+
+        self.seed(20)
+        with self.assertNumQueries(5):
+            dashboard_summary(self.user, self.today)
+
+    def test_dashboard_view_query_count_does_not_grow(self):
+        self.client.force_login(self.user)
+        url = reverse('expense_dashboard')
+
+        self.seed(2)
+        # The first visit of the day records the balance snapshot
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.seed(25)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class MonthlyCategoryRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.rent = Category.objects.create(user=self.user, name='Rent')
+
+    def add_expense(self, category, amount, day):
+        return Expense.objects.create(user=self.user, category=category, amount=Decimal(amount),
+                                      description='Test expense', date=day)
+
+    def rollup_rows(self):
+        return set(
+            MonthlyCategoryRollup.objects.filter(user=self.user, count__gt=0)
+            .values_list('category_id', 'month', 'total', 'count')
+        )
+
+    def ledger_rows(self):
+        rows = set(self.rollup_rows())
+        MonthlyCategoryRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=StringIO())
+        return rows, self.rollup_rows()
+
+    def test_iso_string_dates_are_accepted(self):
+        expense = self.add_expense(self.food, '10.00', '2024-01-05')
+        Expense.objects.bulk_create([Expense(user=self.user, category=self.food, amount=Decimal('5.00'),
+                                             description='Bulk', date='2024-01-06')])
+        self.assertEqual(self.rollup_rows(), {(self.food.id, date(2024, 1, 1), Decimal('15.00'), 2)})
+        expense.date = '2024-02-01'
+        expense.save()
+        expense.delete()
+        self.assertEqual(self.rollup_rows(), {(self.food.id, date(2024, 1, 1), Decimal('5.00'), 1)})
+
+    def test_save_edit_and_delete_keep_rollup_in_sync(self):
+        expense = self.add_expense(self.food, '10.00', date(2024, 1, 5))
+        self.add_expense(self.food, '15.00', date(2024, 1, 20))
+        self.assertEqual(self.rollup_rows(), {(self.food.id, date(2024, 1, 1), Decimal('25.00'), 2)})
+
+        expense.category = self.rent
+        expense.date = date(2024, 2, 1)
+        expense.amount = Decimal('12.50')
+        expense.save()
+        self.assertEqual(self.rollup_rows(), {
+            (self.food.id, date(2024, 1, 1), Decimal('15.00'), 1),
+            (self.rent.id, date(2024, 2, 1), Decimal('12.50'), 1),
+        })
+
+        expense.delete()
+        self.assertEqual(self.rollup_rows(), {(self.food.id, date(2024, 1, 1), Decimal('15.00'), 1)})
+
+    def test_queryset_writes_rebuild_affected_months(self):
+        Expense.objects.bulk_create([
+            Expense(user=self.user, category=self.food, amount=Decimal('5.00'), description='a', date=date(2024, 3, 1)),
+            Expense(user=self.user, category=self.food, amount=Decimal('7.00'), description='b', date=date(2024, 4, 1)),
+        ])
+        Expense.objects.filter(user=self.user, date__month=3).update(category=self.rent)
+        Expense.objects.filter(user=self.user, date__month=4).update(date=date(2024, 5, 2))
+
+        rows, rebuilt = self.ledger_rows()
+        self.assertEqual(rows, rebuilt)
+        self.assertEqual(rows, {
+            (self.rent.id, date(2024, 3, 1), Decimal('5.00'), 1),
+            (self.food.id, date(2024, 5, 1), Decimal('7.00'), 1),
+        })
+
+    def test_deleting_category_moves_totals_to_uncategorized(self):
+        self.add_expense(self.food, '10.00', date(2024, 1, 5))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.delete()
+        self.assertEqual(self.rollup_rows(), {(None, date(2024, 1, 1), Decimal('10.00'), 1)})
+
+
+class CategoryMatcherTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dave', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food', keywords='groceries, supermarket')
+        self.transport = Category.objects.create(user=self.user, name='Transport', keywords='uber')
+        CategoryRule.objects.create(user=self.user, category=self.food, pattern=r'cafe|restaurant', priority=1)
+        CategoryRule.objects.create(user=self.user, category=self.transport, pattern=r'^(taxi|boda)', priority=5)
+
+    def test_rules_take_priority_over_keywords(self):
+        matcher = get_matcher(self.user.pk)
+        self.assertEqual(matcher.match('Boda ride to the restaurant'), self.transport.id)
+        self.assertEqual(matcher.match('Lunch at Java Cafe'), self.food.id)
+        self.assertEqual(matcher.match('Weekly groceries'), self.food.id)
+        self.assertEqual(matcher.match('UBER trip'), self.transport.id)
+        self.assertIsNone(matcher.match('Uberto shoes'))
+        self.assertIsNone(matcher.match('Rent'))
+
+    def test_warm_lookups_skip_the_database_and_edits_invalidate(self):
+        get_matcher(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_matcher(self.user.pk).match('Electricity bill'))
+
+        bills = Category.objects.create(user=self.user, name='Bills')
+        CategoryRule.objects.create(user=self.user, category=bills, pattern='electric', priority=0)
+        self.assertEqual(get_matcher(self.user.pk).match('Electricity bill'), bills.id)
+
+    def test_suggest_category_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('suggest_category'), {'description': 'taxi home'})
+        self.assertEqual(response.json(), {'category': self.transport.id})
+        response = self.client.get(reverse('suggest_category'), {'description': '(unbalanced'})
+        self.assertEqual(response.json(), {'category': None})
+
+
+class ReceiptOCRQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='secret')
+        self.receipt = Receipt.objects.create(user=self.user, image='receipts/test.png')
+
+    def test_parse_receipt_text(self):
+        parsed = parse_receipt_text('Java House\n12/03/2024\nCoffee 4.50\nTotal $1,204.50\n')
+        self.assertEqual(parsed, {'amount': Decimal('1204.50'), 'date': date(2024, 3, 12), 'merchant': 'Java House'})
+
+    def test_jobs_are_claimed_once_and_completion_creates_expense(self):
+        enqueue_receipt(self.receipt)
+        jobs = claim_jobs(limit=5)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(claim_jobs(limit=5), [])
+
+        complete_job(jobs[0], 'Java House', {'amount': Decimal('4.50'), 'date': date(2024, 3, 12), 'merchant': 'Java House'})
+        self.receipt.refresh_from_db()
+        self.assertTrue(self.receipt.is_processed)
+        expense = Expense.objects.get(receipt=self.receipt)
+        self.assertEqual(expense.amount, Decimal('4.50'))
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('receipt_status', args=[self.receipt.id])).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['expense_url'], reverse('expense_edit', args=[expense.id]))
+
+    def test_failed_jobs_are_retried_until_max_attempts(self):
+        enqueue_receipt(self.receipt)
+        job = claim_jobs(limit=1)[0]
+        fail_job(job, 'tesseract missing', max_attempts=2)
+        self.assertEqual(job.status, 'pending')
+
+        job = claim_jobs(limit=1)[0]
+        fail_job(job, 'tesseract missing', max_attempts=2)
+        self.assertEqual(job.status, 'failed')
+        self.assertFalse(Receipt.objects.get(pk=self.receipt.pk).is_processed)
+
+    def test_stale_jobs_are_failed_once_out_of_attempts(self):
+        enqueue_receipt(self.receipt)
+        claim_jobs(limit=1)
+        ReceiptOCRJob.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=15), max_attempts=2), 1)
+
+        claim_jobs(limit=1)
+        ReceiptOCRJob.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=15), max_attempts=2), 0)
+        self.assertEqual(ReceiptOCRJob.objects.get().status, 'failed')
+
+
+class GenerateRecurringExpensesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('frank', password='secret')
+        self.rent = RecurringExpense.objects.create(
+            user=self.user, amount=Decimal('500.00'), description='Rent', frequency='monthly',
+            start_date=date(2024, 1, 5), next_date=date(2024, 1, 5),
+        )
+
+    def test_catches_up_missed_occurrences_once(self):
+        call_command('generate_recurring_expenses', '--date', '2024-04-20', stdout=StringIO())
+        dates = list(Expense.objects.filter(recurring_expense=self.rent).order_by('date').values_list('date', flat=True))
+        self.assertEqual(dates, [date(2024, 1, 5), date(2024, 2, 5), date(2024, 3, 5), date(2024, 4, 5)])
+
+        self.rent.refresh_from_db()
+        self.assertEqual(self.rent.last_generated, date(2024, 4, 5))
+        self.assertEqual(self.rent.next_date, date(2024, 5, 5))
+        self.assertEqual(MonthlyCategoryRollup.objects.get(month=date(2024, 3, 1)).total, Decimal('500.00'))
+
+        # A second run, or a run racing with one that already wrote expenses, adds nothing
+        RecurringExpense.objects.filter(pk=self.rent.pk).update(next_date=date(2024, 1, 5))
+        self.assertEqual(generate_due_expenses(today=date(2024, 4, 20)), (0, 1))
+        self.assertEqual(Expense.objects.filter(recurring_expense=self.rent).count(), 4)
+
+    def test_catch_up_batches_mixed_schedules(self):
+        gym = RecurringExpense.objects.create(
+            user=self.user, amount=Decimal('20.00'), description='Gym', frequency='monthly', day_of_month=31,
+            start_date=date(2024, 1, 31), next_date=date(2024, 1, 31),
+        )
+        call_command('generate_recurring_expenses', '--date', '2024-03-31', stdout=StringIO())
+        dates = list(Expense.objects.filter(recurring_expense=gym).order_by('date').values_list('date', flat=True))
+        self.assertEqual(dates, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)])
+        gym.refresh_from_db()
+        self.assertEqual(gym.next_date, date(2024, 4, 30))
+        self.assertEqual(Expense.objects.filter(recurring_expense=self.rent).count(), 3)
+
+    def test_stops_at_end_date(self):
+        self.rent.end_date = date(2024, 2, 28)
+        self.rent.save()
+        generate_due_expenses(today=date(2024, 6, 1))
+        self.rent.refresh_from_db()
+        self.assertEqual(self.rent.status, 'completed')
+        self.assertEqual(Expense.objects.filter(recurring_expense=self.rent).count(), 2)
+
+
+class RecurrenceScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('grace', password='secret')
+
+    def recurring(self, frequency, start, **kwargs):
+        return RecurringExpense.objects.create(
+            user=self.user, amount=Decimal('10.00'), description=frequency, frequency=frequency,
+            start_date=start, next_date=kwargs.pop('next_date', start), **kwargs
+        )
+
+    def test_month_end_is_clamped_and_restored(self):
+        rent = self.recurring('monthly', date(2024, 1, 31))
+        dates = expand([rent], date(2024, 1, 1), date(2024, 5, 31))[rent.pk].astype(date).tolist()
+        self.assertEqual(dates, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31),
+                                 date(2024, 4, 30), date(2024, 5, 31)])
+
+    def test_matches_stepping_one_occurrence_at_a_time(self):
+        schedules = [
+            self.recurring('daily', date(2024, 1, 1)),
+            self.recurring('weekly', date(2024, 1, 3)),
+            self.recurring('biweekly', date(2023, 12, 20), end_date=date(2024, 9, 1)),
+            self.recurring('monthly', date(2024, 1, 10), day_of_month=30),
+            self.recurring('quarterly', date(2023, 11, 30)),
+            self.recurring('biannual', date(2024, 2, 29)),
+            self.recurring('annual', date(2024, 2, 29)),
+        ]
+        start, end = date(2024, 3, 15), date(2026, 3, 14)
+        expanded = expand(schedules, start, end)
+        for recurring in schedules:
+            expected, current = [], recurring.next_date
+            while current <= end and (recurring.end_date is None or current <= recurring.end_date):
+                if current >= start:
+                    expected.append(current)
+                current = recurring.next_date_after(current)
+            self.assertEqual(expanded[recurring.pk].astype(date).tolist(), expected, recurring.frequency)
+
+    def test_monthly_forecast_skips_inactive_schedules(self):
+        self.recurring('weekly', date(2024, 1, 1))
+        self.recurring('monthly', date(2024, 1, 15), status='paused')
+        forecast = monthly_forecast(RecurringExpense.objects.all(), date(2024, 1, 1), months=2)
+        self.assertEqual([(row['month'], row['total'], row['count']) for row in forecast],
+                         [(date(2024, 1, 1), Decimal('50.00'), 5), (date(2024, 2, 1), Decimal('40.00'), 4)])
+
+
+class ExpenseListPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('heidi', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        for i in range(7):
+            expense = Expense.objects.create(user=self.user, category=self.food if i % 2 else None,
+                                             amount=Decimal(10 + i), description=f'Lunch {i}',
+                                             date=date(2024, 3, 1 + i // 2))
+            if i == 3:
+                expense.set_tags({'work': '#fff'})
+        self.client.force_login(self.user)
+
+    def test_keyset_pages_cover_every_expense_once(self):
+        url = reverse('expense_list_data')
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(url, params).json()
+            seen.extend(row['id'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = list(Expense.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        url = reverse('expense_list_data')
+        def ids(**params):
+            return {row['description'] for row in self.client.get(url, params).json()['results']}
+        self.assertEqual(ids(category=self.food.id, min_amount='12', max_amount='15'), {'Lunch 3', 'Lunch 5'})
+        self.assertEqual(ids(start_date='2024-03-04'), {'Lunch 6'})
+        self.assertEqual(ids(tag='work'), {'Lunch 3'})
+        self.assertEqual(ids(q='lunch 4'), {'Lunch 4'})
+        self.assertEqual(self.client.get(url, {'min_amount': 'abc'}).status_code, 400)
+
+    def test_list_page_renders_first_page(self):
+        response = self.client.get(reverse('expense_list'), {'q': 'Lunch'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['expenses']), 7)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_field_does_not_drop_the_valid_filters(self):
+        response = self.client.get(reverse('expense_list'), {'q': 'lunch 4', 'min_amount': 'abc'})
+        self.assertEqual([expense.description for expense in response.context['expenses']], ['Lunch 4'])
+        self.assertIn('min_amount', response.context['filter_form'].errors)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Fail if a hot query falls back to a full scan of a large table"""
+    HOT_TABLES = ('expenses_expense', 'budgets_budget', 'expenses_recurringexpense', 'expenses_monthlycategoryrollup')
+    VIEWS = ['expense_dashboard', 'expense_list', 'expense_list_data', 'recurring_expense_list',
+             'recurring_expense_dashboard', 'budget_list', 'reports_dashboard', 'profile']
+
+    def setUp(self):
+        self.user = User.objects.create_user('ivan', password='secret')
+        other = User.objects.create_user('judy', password='secret')
+        for owner in (self.user, other):
+            category = Category.objects.create(user=owner, name='Food')
+            Budget.objects.create(user=owner, category=category, limit=Decimal('100.00'), month=date(2024, 1, 1))
+            RecurringExpense.objects.bulk_create([
+                RecurringExpense(user=owner, amount=Decimal('5.00'), description='Gym', start_date=date(2024, 1, 1),
+                                 next_date=date(2024 + i % 5, 1 + i % 12, 1), status='paused' if i % 3 else 'active')
+                for i in range(60)
+            ])
+            Expense.objects.bulk_create([
+                Expense(user=owner, category=category, amount=Decimal('5.00'), description='Lunch',
+                        date=date(2024, 1 + i % 12, 1 + i % 28))
+                for i in range(200)
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def full_scans(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        return [
+            detail for detail in details
+            if detail.startswith('SCAN ') and 'INDEX' not in detail
+            and any(table in detail for table in self.HOT_TABLES)
+        ]
+
+    def test_detects_full_scans(self):
+        sql, params = Expense.objects.filter(description='Lunch').query.sql_with_params()
+        self.assertTrue(self.full_scans(sql, params))
+
+    def test_view_queries_use_indexes(self):
+        self.client.force_login(self.user)
+        for name in self.VIEWS:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200, name)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if sql.startswith('SELECT') and any(table in sql for table in self.HOT_TABLES):
+                    self.assertEqual(self.full_scans(sql), [], f'{name}: {sql}')
+
+    def test_background_queries_use_indexes(self):
+        querysets = [
+            RecurringExpense.objects.filter(status='active', next_date__lte=date(2024, 6, 1)),
+            Expense.objects.filter(user=self.user, category__isnull=False, date__gte=date(2024, 3, 1)),
+            Budget.objects.filter(user=self.user, month__gte=date(2024, 1, 1), month__lt=date(2024, 7, 1)),
+        ]
+        for queryset in querysets:
+            sql, params = queryset.query.sql_with_params()
+            self.assertEqual(self.full_scans(sql, params), [], sql)
+
+
+class ExpenseTagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ken', password='secret')
+        self.expense = Expense.objects.create(user=self.user, amount=Decimal('12.00'), description='Taxi',
+                                              date=date(2024, 3, 1))
+        self.client.force_login(self.user)
+
+    def test_ajax_update_notes_tags_keeps_its_api(self):
+        url = reverse('ajax_update_notes_tags', args=[self.expense.id])
+        payload = {'notes': 'Airport', 'tags': ['travel', ' work ', ''], 'tag_colors': ['#ff0000']}
+        response = self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.json(), {'success': True})
+
+        expense = Expense.objects.prefetch_related('expense_tags__tag').get(pk=self.expense.pk)
+        self.assertEqual(expense.notes, 'Airport')
+        self.assertEqual(sorted(expense.tags_with_colors), [('travel', '#ff0000'), ('work', '#8888ff')])
+
+        # Replacing the tags reuses the user's existing Tag rows
+        payload = {'notes': 'Airport', 'tags': ['work'], 'tag_colors': ['#000000']}
+        self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(self.expense.tags, ['work'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(user_tags(self.user), ['work'])
+
+
+class ExpenseExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('leo', password='secret')
+        food = Category.objects.create(user=self.user, name='Food')
+        for i in range(5):
+            expense = Expense.objects.create(user=self.user, category=food if i else None, amount=Decimal('2.50') * (i + 1),
+                                             description=f'Item, {i}', date=date(2024, 1, 1 + i))
+            expense.set_tags({'a': '#000', 'b': '#fff'} if i == 1 else {})
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_expenses'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_streams_selected_columns_in_constant_queries(self):
+        with self.assertNumQueries(4):  # session, user, expenses, tags per chunk
+            body = self.export(format='csv', columns='date,description,category,tags', start_date='2024-01-02')
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Description,Category,Tags')
+        self.assertEqual(lines[1], '2024-01-02,"Item, 1",Food,a|b')
+        self.assertEqual(len(lines), 5)
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.export(format='jsonl', columns=['amount', 'tags']).splitlines()]
+        self.assertEqual(rows[1], {'amount': '5.00', 'tags': ['a', 'b']})
+
+    def test_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        import io
+        table = pq.read_table(io.BytesIO(self.export(format='parquet', columns='id,amount,tags,created_at')))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('tags').to_pylist()[1], ['a', 'b'])
+
+    def test_parquet_link_only_when_pyarrow_is_installed(self):
+        for available in (True, False):
+            with mock.patch('expenses.views.parquet_available', return_value=available):
+                response = self.client.get(reverse('expense_list'))
+            self.assertEqual('format=parquet' in response.content.decode(), available)
+
+    def test_rejects_unknown_options(self):
+        self.assertEqual(self.client.get(reverse('export_expenses'), {'columns': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_expenses'), {'format': 'xlsx'}).status_code, 400)
+
+
+class ExpenseImportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('mia', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.transport = Category.objects.create(user=self.user, name='Transport')
+        CategoryRule.objects.create(user=self.user, category=self.transport, pattern='uber', is_active=True)
+        Expense.objects.create(user=self.user, amount=Decimal('9.99'), description='Netflix', date=date(2024, 2, 3))
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, **data):
+        data = {'format': 'csv', 'date_column': 'Date', 'description_column': 'Payee', 'amount_column': 'Amount',
+                'category_column': 'Category', 'date_format': '%d/%m/%Y', **data}
+        data['file'] = SimpleUploadedFile(name, content)
+        response = self.client.post(reverse('import_expenses'), data)
+        self.assertRedirects(response, reverse('import_expenses'))
+        return ImportJob.objects.latest('created_at')
+
+    def test_csv_import_dedups_categorises_and_reports_errors(self):
+        job = self.upload('bank.csv', (
+            'Date,Payee,Amount,Category\n'
+            '01/02/2024,Uber trip,"-1,200.00",\n'
+            '01/02/2024,Uber trip,"-1,200.00",\n'  # a second, identical trip
+            '02/02/2024,Lunch,12.50,food\n'
+            '03/02/2024,Netflix,9.99,\n'            # already recorded
+            '31/02/2024,Broken,5.00,\n'
+            '04/02/2024,Bad amount,abc,\n'
+            '05/02/2024,Voided,0.00,\n'
+        ).encode())
+        call_command('process_imports', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.processed_rows, job.created_count, job.duplicate_count, job.error_count), (7, 3, 1, 3))
+        self.assertIn('Row 5', job.errors)
+        self.assertIn("Row 7: amount '0.00' is zero", job.errors)
+        trips = Expense.objects.filter(description='Uber trip')
+        self.assertEqual({(trip.category, trip.amount) for trip in trips}, {(self.transport, Decimal('1200.00'))})
+        self.assertEqual(Expense.objects.get(description='Lunch').category, self.food)
+
+        data = self.client.get(reverse('import_status', args=[job.id])).json()
+        self.assertEqual(data['created_count'], 3)
+        self.assertEqual(len(data['errors']), 3)
+
+    def test_identical_rows_in_a_file_are_kept_but_not_imported_twice(self):
+        content = b'Date,Payee,Amount,Category\n05/02/2024,ATM,50,\n05/02/2024,ATM,50,\n'
+        for expected_created in (2, 0):
+            job = self.upload('bank.csv', content)
+            process_job(claim_next_job())
+            job.refresh_from_db()
+            self.assertEqual((job.created_count, job.duplicate_count), (expected_created, 2 - expected_created))
+
+        # Only the third withdrawal is new
+        job = self.upload('bank.csv', content + b'05/02/2024,ATM,50,\n')
+        process_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.created_count, job.duplicate_count), (1, 2))
+        self.assertEqual(Expense.objects.filter(description='ATM').count(), 3)
+
+    def test_imports_abandoned_by_a_dead_worker_are_failed(self):
+        job = self.upload('bank.csv', b'Date,Payee,Amount,Category\n05/02/2024,ATM,50,\n')
+        claim_next_job()
+        ImportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=2))
+        call_command('process_imports', '--once', '--stale-after', '60', stdout=StringIO())
+        data = self.client.get(reverse('import_status', args=[job.id])).json()
+        self.assertEqual(data['status'], 'failed')
+
+    def test_missing_column_fails_the_job(self):
+        job = self.upload('bank.csv', b'When,Payee,Amount\n01/02/2024,Lunch,1\n')
+        process_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn("'Date'", job.errors)
+        self.assertIsNone(claim_next_job())
+
+    def test_ofx_import_skips_credits(self):
+        ofx = (
+            'OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240205120000\n<TRNAMT>-25.00\n<NAME>UBER *TRIP\n</STMTTRN>\n'
+            '<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20240206\n<TRNAMT>1000.00\n<NAME>Salary\n</STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        job = self.upload('bank.ofx', ofx.encode(), format='ofx')
+        process_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.created_count), ('done', 1, 1))
+        expense = Expense.objects.get(description='UBER *TRIP')
+        self.assertEqual((expense.date, expense.amount, expense.category), (date(2024, 2, 5), Decimal('25.00'), self.transport))
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('nia', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.today = date.today()
+        Expense.objects.create(user=self.user, category=self.food, amount=Decimal('10.00'), description='Lunch', date=self.today)
+        self.client.force_login(self.user)
+
+    def spent(self):
+        return self.client.get(reverse('api_financial_data')).json()['budget']['spent']
+
+    def test_payload_is_cached_until_the_users_data_changes(self):
+        self.assertEqual(self.spent(), 10.0)
+        with self.assertNumQueries(3):  # session, user and profile only
+            self.assertEqual(self.spent(), 10.0)
+        self.assertEqual(dashboard_cache.stats()['financial_data'], {'hits': 1, 'misses': 1})
+
+        Expense.objects.create(user=self.user, category=self.food, amount=Decimal('5.00'), description='Tea', date=self.today)
+        self.assertEqual(self.spent(), 15.0)
+
+        Expense.objects.filter(user=self.user).update(amount=Decimal('1.00'))
+        self.assertEqual(self.spent(), 2.0)
+
+        IncomeSource.objects.create(user=self.user, name='Salary', amount=Decimal('100'), frequency='monthly')
+        response = self.client.get(reverse('api_financial_data')).json()
+        self.assertEqual(response['income']['sources'][0]['name'], 'Salary')
+
+        self.assertEqual(self.client.get(reverse('api_mobile_dashboard')).json()['totalExpenses'], 2.0)
+        self.assertEqual(dashboard_cache.stats()['mobile_dashboard'], {'hits': 0, 'misses': 1})
+
+    def test_other_months_and_users_keep_their_entries(self):
+        self.spent()
+        other = User.objects.create_user('omar', password='secret')
+        Expense.objects.create(user=other, amount=Decimal('3.00'), description='Bus', date=self.today)
+        Expense.objects.create(user=self.user, amount=Decimal('3.00'), description='Old', date=add_months(self.today, -3))
+        self.spent()
+        self.assertEqual(dashboard_cache.stats()['financial_data'], {'hits': 1, 'misses': 1})
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('api_dashboard_cache_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn('financial_data', self.client.get(reverse('api_dashboard_cache_stats')).json())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pia', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.expense = Expense.objects.create(user=self.user, category=self.food, amount=Decimal('4.00'),
+                                              description='Tea', date=date(2024, 1, 5))
+        self.client.force_login(self.user)
+
+    def test_unchanged_resources_answer_304_without_serializing(self):
+        for name in ('api_expenses', 'api_recent_expenses', 'api_categories', 'api_mobile_dashboard'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            with self.assertNumQueries(4):  # session, user, profile, data version
+                cached = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.content, b'')
+
+    def test_any_change_to_the_users_data_changes_the_etag(self):
+        url = reverse('api_expenses')
+        etags = [self.client.get(url)['ETag']]
+        self.assertNotEqual(self.client.get(url, {'page': 1})['ETag'], etags[0])
+
+        Expense.objects.filter(pk=self.expense.pk).update(notes='with milk')
+        etags.append(self.client.get(url)['ETag'])
+        self.food.name = 'Drinks'
+        self.food.save()
+        etags.append(self.client.get(url)['ETag'])
+        self.expense.delete()
+        etags.append(self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+        # Other users' writes leave this user's version alone
+        other = User.objects.create_user('quinn', password='secret')
+        Expense.objects.create(user=other, amount=Decimal('1.00'), description='Bus', date=date(2024, 1, 6))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1]).status_code, 304)
+
+    def test_last_modified_is_no_older_than_the_current_month(self):
+        url = reverse('api_mobile_dashboard')
+        last_month = timezone.now() - timedelta(days=40)
+        DataVersion.for_user(self.user)
+        DataVersion.objects.filter(user=self.user).update(updated_at=last_month)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(last_month.timestamp()))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+@mock.patch('expenses.sync.SETTLE_TIME', timedelta(0))
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rosa', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.travel = Category.objects.create(user=self.user, name='Travel')
+        self.expenses = [
+            Expense.objects.create(user=self.user, category=self.food, amount=Decimal(i + 1), description=f'E{i}',
+                                   date=date(2024, 1, i + 1))
+            for i in range(3)
+        ]
+        self.budget = Budget.objects.create(user=self.user, category=self.travel, limit=Decimal('50'), month=date(2024, 1, 1))
+        self.recurring = RecurringExpense.objects.create(user=self.user, category=self.travel, amount=Decimal('9'),
+                                                         description='Gym', start_date=date(2024, 1, 1),
+                                                         next_date=date(2024, 2, 1))
+        self.client.force_login(self.user)
+
+    def sync(self, token=None, limit=2):
+        """Follow has_more to the end of a pass, merging the pages"""
+        merged = defaultdict(lambda: defaultdict(list))
+        while True:
+            params = {'limit': limit, **({'token': token} if token else {})}
+            page = self.client.get(reverse('api_sync'), params).json()
+            for kind in ('categories', 'expenses', 'budgets', 'recurring'):
+                for change, rows in page[kind].items():
+                    merged[kind][change] += [row if change == 'deleted' else row['id'] for row in rows]
+            token = page['token']
+            if not page['has_more']:
+                return merged, token
+
+    def test_full_then_delta_sync(self):
+        changes, token = self.sync()
+        self.assertEqual(sorted(changes['expenses']['created']), sorted(e.id for e in self.expenses))
+        self.assertEqual(len(changes['categories']['created']), 2)
+        self.assertEqual(changes['budgets']['created'], [self.budget.id])
+        self.assertEqual(changes['recurring']['created'], [self.recurring.id])
+
+        changes, token = self.sync(token)
+        self.assertEqual(sum(len(rows) for kind in changes.values() for rows in kind.values()), 0)
+
+        self.expenses[0].description = 'Edited'
+        self.expenses[0].save()
+        Expense.objects.filter(pk=self.expenses[1].pk).update(notes='bulk edit')
+        deleted_expense_id, travel_id, budget_id = self.expenses[2].id, self.travel.id, self.budget.id
+        self.expenses[2].delete()
+        self.travel.delete()  # cascades to the budget and nulls the recurring template's category
+        new = Budget.objects.create(user=self.user, category=self.food, limit=Decimal('10'), month=date(2024, 2, 1))
+
+        changes, token = self.sync(token)
+        self.assertEqual(sorted(changes['expenses']['updated']), [self.expenses[0].id, self.expenses[1].id])
+        self.assertEqual(changes['expenses']['deleted'], [deleted_expense_id])
+        self.assertEqual(changes['categories']['deleted'], [travel_id])
+        self.assertEqual(changes['budgets'], {'created': [new.id], 'updated': [], 'deleted': [budget_id]})
+        self.assertEqual(changes['recurring']['updated'], [self.recurring.id])
+
+    def test_rejects_foreign_or_tampered_tokens(self):
+        token = self.client.get(reverse('api_sync')).json()['token']
+        self.assertEqual(self.client.get(reverse('api_sync'), {'token': token + 'x'}).status_code, 400)
+        self.client.force_login(User.objects.create_user('sam', password='secret'))
+        self.assertEqual(self.client.get(reverse('api_sync'), {'token': token}).status_code, 400)
+
+    def test_deleting_a_user_drops_their_tombstones(self):
+        self.user.delete()
+        self.assertFalse(SyncTombstone.objects.exists())
+
+    def test_tombstones_are_pruned_once_no_token_can_reach_them(self):
+        token = self.sync()[1]
+        self.expenses[0].delete()
+        SyncTombstone.objects.update(deleted_at=timezone.now() - sync.TOKEN_MAX_AGE - timedelta(days=1))
+        call_command('prune_sync_tombstones', stdout=StringIO())
+        self.assertFalse(SyncTombstone.objects.exists())
+
+        later = timezone.now() + sync.TOKEN_MAX_AGE + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=later), self.assertRaises(sync.SyncTokenError):
+            sync.decode_token(self.user, token)
+
+
+class ExpenseBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tess', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.other_category = Category.objects.create(user=User.objects.create_user('uma'), name='Theirs')
+        self.lunch = Expense.objects.create(user=self.user, category=self.food, amount=Decimal('10.00'),
+                                            description='Lunch', date=date(2024, 3, 1))
+        self.taxi = Expense.objects.create(user=self.user, amount=Decimal('7.00'), description='Taxi', date=date(2024, 3, 2))
+        self.client.force_login(self.user)
+
+    def post(self, operations):
+        return self.client.post(reverse('api_expenses_batch'), json.dumps(operations), content_type='application/json')
+
+    def test_applies_all_operations_in_one_transaction(self):
+        operations = [
+            {'op': 'create', 'client_id': 'a', 'data': {'description': 'Tea', 'amount': '2.50', 'date': '2024-03-03',
+                                                        'category': self.food.id}},
+            {'op': 'create', 'client_id': 'b', 'data': {'description': 'Bus', 'amount': '1.00', 'date': '2024-03-03'}},
+            {'op': 'update', 'id': self.lunch.id, 'data': {'amount': '12.00'}},
+            {'op': 'delete', 'id': self.taxi.id},
+        ]
+        operations += [
+            {'op': 'create', 'data': {'description': f'Snack {i}', 'amount': '1.00', 'date': '2024-03-04'}}
+            for i in range(50)
+        ]
+        # Creates and updates cost no queries per item
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(queries), 40)
+
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results[:4]], ['created', 'created', 'updated', 'deleted'])
+        self.assertEqual(results[0]['client_id'], 'a')
+        self.assertEqual(results[0]['data']['category_details']['name'], 'Food')
+        self.assertEqual(Expense.objects.get(pk=results[1]['id']).user, self.user)
+        self.assertEqual(Expense.objects.get(pk=self.lunch.pk).amount, Decimal('12.00'))
+        self.assertFalse(Expense.objects.filter(pk=self.taxi.pk).exists())
+        self.assertEqual(
+            MonthlyCategoryRollup.objects.get(user=self.user, category=self.food, month=date(2024, 3, 1)).total,
+            Decimal('14.50'),
+        )
+
+    def test_nothing_is_written_when_any_operation_is_invalid(self):
+        foreign = Expense.objects.create(user=self.other_category.user, amount=Decimal('1.00'), description='X',
+                                         date=date(2024, 3, 1))
+        response = self.post([
+            {'op': 'create', 'data': {'description': 'Tea', 'amount': '2.50', 'date': '2024-03-03'}},
+            {'op': 'create', 'data': {'description': 'Bad', 'amount': 'abc', 'date': '2024-03-03'}},
+            {'op': 'create', 'data': {'description': 'Theirs', 'amount': '1', 'date': '2024-03-03',
+                                      'category': self.other_category.id}},
+            {'op': 'delete', 'id': foreign.id},
+            {'op': 'rename', 'id': self.lunch.id},
+            {'op': 'delete', 'id': True},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['skipped', 'error', 'error', 'error', 'error', 'error'])
+        self.assertEqual(results[5]['errors'], {'id': ['Expense not found']})
+        self.assertIn('category', results[2]['errors'])
+        self.assertIn('amount', results[1]['errors'])
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(Expense.objects.filter(pk=foreign.pk).exists())
+
+
+class ExpenseAPIListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('vera', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.rent = Category.objects.create(user=self.user, name='Rent')
+        for i in range(7):
+            Expense.objects.create(user=self.user, category=self.food if i % 2 else self.rent, amount=Decimal(i + 1),
+                                   description=f'E{i}', date=date(2024, 5, 1 + i))
+        DataVersion.for_user(self.user)
+        self.client.force_login(self.user)
+
+    def test_cursor_pages_in_constant_queries(self):
+        url = reverse('api_expenses')
+        seen = []
+        params = {'limit': 3}
+        while True:
+            with self.assertNumQueries(5):  # session, user, profile, data version, page with categories
+                data = self.client.get(url, params).json()
+            seen += [row['description'] for row in data['results']]
+            self.assertEqual(data['results'][0]['category_details']['name'] in ('Food', 'Rent'), True)
+            if not data['next_cursor']:
+                break
+            self.assertIn('cursor=', data['next'])
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, [f'E{i}' for i in reversed(range(7))])
+
+    def test_filters_and_sparse_fields(self):
+        data = self.client.get(reverse('api_expenses'), {
+            'category': self.food.id, 'start_date': '2024-05-03', 'fields': 'id,amount',
+        }).json()
+        self.assertEqual([row['amount'] for row in data['results']], ['6.00', '4.00'])
+        self.assertEqual(set(data['results'][0]), {'id', 'amount'})
+
+        self.assertEqual(self.client.get(reverse('api_expenses'), {'fields': 'id,user'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_expenses'), {'start_date': 'soon'}).status_code, 400)
+
+    def test_create_still_returns_full_expense(self):
+        response = self.client.post(reverse('api_expenses') + '?fields=id', {
+            'description': 'Tea', 'amount': '2.00', 'date': '2024-05-09', 'category': self.food.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['category_details']['name'], 'Food')
+
+
+class MobileDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('wren', password='secret')
+        DataVersion.for_user(self.user)
+        self.client.force_login(self.user)
+
+    def dashboard(self):
+        cache.clear()
+        return self.client.get(reverse('api_mobile_dashboard')).json()
+
+    def add_categories(self, count, day):
+        for i in range(count):
+            category = Category.objects.create(user=self.user, name=f'C{Category.objects.count()}')
+            Expense.objects.create(user=self.user, category=category, amount=Decimal(i + 1), description='x', date=day)
+
+    def test_query_count_does_not_grow_with_categories(self):
+        today = date.today()
+        self.add_categories(3, today)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(len(self.dashboard()['categoryExpenses']), 3)
+        self.add_categories(30, today)
+        with CaptureQueriesContext(connection) as many:
+            data = self.dashboard()
+        self.assertEqual(len(data['categoryExpenses']), 33)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(data['categoryExpenses'][0], {'name': 'C32', 'amount': 30.0})
+
+    def test_month_follows_the_users_time_zone(self):
+        Expense.objects.create(user=self.user, amount=Decimal('5.00'), description='x', date=date(2024, 6, 1))
+        Expense.objects.create(user=self.user, amount=Decimal('2.00'), description='y', date=date(2024, 5, 31))
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2024, 5, 31, 12, 0, tzinfo=dt_timezone.utc)):
+            self.assertEqual(self.dashboard()['totalExpenses'], 2.0)
+            self.user.profile.time_zone = 'Pacific/Kiritimati'  # UTC+14: already June 1st
+            self.user.profile.save()
+            self.assertEqual(self.dashboard()['totalExpenses'], 5.0)
+
+
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('xena', password='secret')
+        for day, amount in [(date(2024, 1, 31), 1), (date(2024, 3, 1), 2), (date(2024, 3, 31), 4), (date(2024, 7, 1), 8)]:
+            Expense.objects.create(user=self.user, amount=Decimal(amount), description='x', date=day)
+        for created, amount, active in [('2023-12-15', 100, True), ('2024-02-10', 50, True), ('2024-03-05', 999, False)]:
+            source = IncomeSource.objects.create(user=self.user, name='S', amount=Decimal(amount), frequency='monthly',
+                                                 is_active=active)
+            IncomeSource.objects.filter(pk=source.pk).update(
+                created_at=datetime.fromisoformat(created + 'T12:00:00+00:00'))
+
+    def test_months_are_calendar_months(self):
+        with self.assertNumQueries(2):
+            data = timeseries.series(self.user, date(2024, 3, 31), count=4)
+        self.assertEqual(data['labels'], ['Dec', 'Jan', 'Feb', 'Mar'])
+        self.assertEqual(data['expenses'], [0, Decimal(1), 0, Decimal(6)])
+        self.assertEqual(data['income'], [Decimal(100), Decimal(100), Decimal(150), Decimal(150)])
+
+    def test_weeks_and_quarters(self):
+        weeks = timeseries.series(self.user, date(2024, 3, 31), count=5, period='week')
+        self.assertEqual(weeks['starts'][-1], date(2024, 3, 25))  # Monday
+        self.assertEqual(weeks['starts'][0], date(2024, 2, 26))
+        self.assertEqual(weeks['expenses'], [Decimal(2), 0, 0, 0, Decimal(4)])
+
+        quarters = timeseries.series(self.user, date(2024, 7, 1), count=3, period='quarter')
+        self.assertEqual(quarters['labels'], ['Q1 2024', 'Q2 2024', 'Q3 2024'])
+        self.assertEqual(quarters['expenses'], [Decimal(7), 0, Decimal(8)])
+        self.assertEqual(quarters['income'], [Decimal(150)] * 3)
+
+    def test_reports_dashboard_uses_the_series(self):
+        self.client.force_login(self.user)
+        for period in ('week', 'month', 'quarter'):
+            response = self.client.get(reverse('reports_dashboard'), {'period': period})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.context['monthly_expenses'])), 6)
+
+
+class CategoryMergeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kai', password='secret')
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.groceries = Category.objects.create(user=self.user, name='Groceries')
+        self.dining = Category.objects.create(user=self.user, name='Dining')
+        for category, amount in [(self.food, 10), (self.groceries, 20), (self.dining, 30)]:
+            Expense.objects.create(user=self.user, category=category, amount=Decimal(amount), description='x',
+                                   date=date(2024, 3, 5))
+        CategoryRule.objects.create(user=self.user, category=self.groceries, pattern='market')
+        self.rent = RecurringExpense.objects.create(
+            user=self.user, category=self.dining, amount=Decimal('5.00'), description='Lunch club',
+            frequency='monthly', start_date=date(2024, 1, 5), next_date=date(2024, 4, 5),
+        )
+        self.march = Budget.objects.create(user=self.user, category=self.food, limit=Decimal('100'),
+                                           month=date(2024, 3, 1))
+        Budget.objects.create(user=self.user, category=self.groceries, limit=Decimal('50'), month=date(2024, 3, 1))
+        Budget.objects.create(user=self.user, category=self.dining, limit=Decimal('30'), month=date(2024, 4, 1))
+
+    def test_merge_moves_everything_and_sums_budgets(self):
+        version = DataVersion.for_user(self.user).version
+        self.assertEqual(merge_categories(self.food, [self.groceries, self.dining]), 2)
+        self.assertGreater(DataVersion.for_user(self.user).version, version)
+
+        self.assertEqual(list(Category.objects.filter(user=self.user)), [self.food])
+        self.assertEqual(set(Expense.objects.values_list('category', flat=True)), {self.food.pk})
+        self.assertEqual(CategoryRule.objects.get().category, self.food)
+        self.rent.refresh_from_db()
+        self.assertEqual(self.rent.category, self.food)
+        self.assertEqual(
+            list(Budget.objects.order_by('month').values_list('pk', 'category', 'limit')),
+            [(self.march.pk, self.food.pk, Decimal('150')), (Budget.objects.get(month=date(2024, 4, 1)).pk,
+                                                             self.food.pk, Decimal('30'))],
+        )
+        rows = list(rollups.category_totals(self.user, date(2024, 3, 1)))
+        self.assertEqual([(row['category_id'], row['category_total']) for row in rows], [(self.food.pk, Decimal('60'))])
+
+    def test_query_count_does_not_grow_with_expenses(self):
+        def merge(name):
+            primary = Category.objects.create(user=self.user, name=f'{name} primary')
+            other = Category.objects.create(user=self.user, name=name)
+            return primary, other
+
+        primary, other = merge('Small')
+        Expense.objects.create(user=self.user, category=other, amount=Decimal('1'), description='x',
+                               date=date(2024, 3, 5))
+        with CaptureQueriesContext(connection) as small:
+            merge_categories(primary, [other])
+
+        primary, other = merge('Large')
+        Expense.objects.bulk_create([
+            Expense(user=self.user, category=other, amount=Decimal('1'), description='x', date=date(2024, 3, 5))
+            for _ in range(50)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            merge_categories(primary, [other])
+        self.assertEqual(len(small), len(large))
+
+    def test_admin_action_refuses_categories_of_different_users(self):
+        other_user = User.objects.create_user('lea', password='secret')
+        theirs = Category.objects.create(user=other_user, name='Food')
+        with self.assertRaises(MergeError):
+            merge_categories(self.food, [theirs])
+
+        admin = User.objects.create_superuser('root', 'root@example.com', 'secret')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:expenses_category_changelist'), {
+            'action': 'merge_categories', '_selected_action': [self.food.pk, theirs.pk],
+        }, follow=True)
+        self.assertContains(response, 'Only categories of the same user can be merged')
+        self.assertTrue(Category.objects.filter(pk=theirs.pk).exists())
@@ -0,0 +1,112 @@
+"""Income and expense series bucketed by calendar week, month or quarter.
+
+Buckets are real calendar periods (weeks start on Monday), so no month is
+skipped or counted twice however long the range. Each series is one grouped
+query: monthly spending is read from the MonthlyCategoryRollup table, weekly
+and quarterly spending is truncated from the expenses themselves, and income
+is grouped by the period each active IncomeSource was created in.
+"""
+from datetime import date, timedelta
+
+from django.db.models import DateField, Sum
+from django.db.models.functions import Trunc
+
+from users.models import IncomeSource
+from . import rollups
+from .models import Expense
+
+PERIODS = ('week', 'month', 'quarter')
+
+
+def add_months(day, months):
+    """Return the first day of the month `months` away from `day`'s month"""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def period_start(day, period='month'):
+    """Return the first day of the period containing `day`"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'quarter':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def shift(start, period='month', steps=1):
+    """Return the start of the period `steps` periods away from the one starting at `start`"""
+    if period == 'week':
+        return start + timedelta(weeks=steps)
+    return add_months(start, steps * (3 if period == 'quarter' else 1))
+
+
+def periods(end, count, period='month'):
+    """Return the starts of the `count` periods ending with the one containing `end`, oldest first"""
+    last = period_start(end, period)
+    return [shift(last, period, -i) for i in range(count - 1, -1, -1)]
+
+
+def label(start, period='month'):
+    if period == 'week':
+        return start.strftime('%d %b')
+    if period == 'quarter':
+        return f'Q{(start.month - 1) // 3 + 1} {start.year}'
+    return start.strftime('%b')
+
+
+def expense_totals(user, starts, period='month'):
+    """Return the amount spent in each period of `starts`"""
+    if period == 'month':
+        totals = rollups.monthly_totals(user, starts[0], starts[-1])
+    else:
+        rows = (
+            Expense.objects.filter(user=user, date__gte=starts[0], date__lt=shift(starts[-1], period))
+            .annotate(bucket=Trunc('date', period, output_field=DateField()))
+            .values('bucket')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        totals = {row['bucket']: row['total'] for row in rows}
+    return [totals.get(start, 0) for start in starts]
+
+
+def income_totals(user, starts, period='month'):
+    """Return the active income in place at the end of each period of `starts`.
+
+    A source counts from the period it was created in onwards, so the series
+    is the running total of amounts grouped by creation period.
+    """
+    rows = (
+        IncomeSource.objects.filter(user=user, is_active=True, created_at__date__lt=shift(starts[-1], period))
+        .annotate(bucket=Trunc('created_at', period, output_field=DateField()))
+        .values('bucket')
+        .annotate(total=Sum('amount'))
+        .order_by('bucket')
+    )
+    added = {}
+    running = 0
+    for row in rows:
+        if row['bucket'] < starts[0]:
+            running += row['total']
+        else:
+            added[row['bucket']] = row['total']
+
+    totals = []
+    for start in starts:
+        running += added.get(start, 0)
+        totals.append(running)
+    return totals
+
+
+def series(user, end, count=6, period='month'):
+    """Return {'period', 'starts', 'labels', 'income', 'expenses'} for the `count` periods up to `end`"""
+    if period not in PERIODS:
+        raise ValueError(f'Unknown period: {period}')
+    starts = periods(end, count, period)
+    return {
+        'period': period,
+        'starts': starts,
+        'labels': [label(start, period) for start in starts],
+        'income': income_totals(user, starts, period),
+        'expenses': expense_totals(user, starts, period),
+    }
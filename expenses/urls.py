@@ -4,6 +4,10 @@ from . import views
 urlpatterns = [
     path('', views.expense_dashboard, name='expense_dashboard'),
     path('list/', views.expense_list, name='expense_list'),
+    path('list/data/', views.expense_list_data, name='expense_list_data'),
+    path('export/', views.export_expenses, name='export_expenses'),
+    path('import/', views.import_expenses, name='import_expenses'),
+    path('import/status/<int:job_id>/', views.import_status, name='import_status'),
     path('add/', views.expense_add, name='expense_add'),
     path('edit/<int:pk>/', views.expense_edit, name='expense_edit'),
     path('delete/<int:pk>/', views.expense_delete, name='expense_delete'),
@@ -32,4 +36,5 @@ urlpatterns = [
     # Receipt handling
     path('receipts/upload/', views.upload_receipt, name='upload_receipt'),
     path('receipts/process/<int:receipt_id>/', views.process_receipt, name='process_receipt'),
+    path('receipts/status/<int:receipt_id>/', views.receipt_status, name='receipt_status'),
 ]
\ No newline at end of file
@@ -4,54 +4,51 @@ from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from django.http import JsonResponse
+from django.urls import reverse
+from django.db import transaction
 from django.db.models import Sum
 from django.contrib.auth.models import User
 from datetime import datetime, date, timedelta
-import calendar
 import json
-import random
 import logging
-from .models import Expense, Category, SharedExpense, Receipt, CategoryRule, RecurringExpense
+from .models import (
+    Expense, Category, SharedExpense, Receipt, CategoryRule, RecurringExpense, ReceiptOCRJob, ImportJob,
+    DEFAULT_TAG_COLOR
+)
+from .aggregation import dashboard_summary
+from .matching import suggest_category_id
+from .ocr_queue import enqueue_receipt
+from .schedule import monthly_forecast, occurrences
+from .filters import MAX_PAGE_SIZE, PAGE_SIZE, filter_expenses, paginate
+from .exports import ExportError, export_response, parquet_available, parse_columns
 from budgets.models import Budget
+from users import balances
 from users.models import InAppNotification, IncomeSource
 from .forms import (
     ExpenseForm, CategoryForm, BulkCategoryUpdateForm, 
     ShareExpenseForm, ReceiptUploadForm, RecurringExpenseForm,
-    CategoryRuleForm
+    CategoryRuleForm, ExpenseFilterForm, ImportJobForm
 )
-from django.conf import settings
 from django.core.management.base import BaseCommand
-import pytesseract
-import cv2
-import numpy as np
-from PIL import Image
-import re
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Configure Tesseract path
-pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
-
 # Create your views here.
 
 @login_required
 def expense_dashboard(request):
-    # Add logic to check and generate recurring expenses
-    check_recurring_expenses(request.user)
-    
     today = timezone.now().date()
-    first_day = date(today.year, today.month, 1)
-    last_day = date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
     
     # Get all expenses for filtering
     expenses = Expense.objects.filter(user=request.user).select_related('category')
     
     # Get recent expenses, ordered by date
-    recent_expenses = expenses.order_by('-date')[:20]
+    recent_expenses = expenses.prefetch_related('expense_tags__tag').order_by('-date')[:20]
     
-    # Calculate current month's financial summary
-    total_spent = expenses.filter(date__range=[first_day, last_day]).aggregate(total=Sum('amount'))['total'] or 0
+    # Category totals, monthly trend and tags in a fixed number of grouped queries
+    summary = dashboard_summary(request.user, today)
+    total_spent = summary['total_spent']
     
     # Get total income from IncomeSource
     income_sources = IncomeSource.objects.filter(
@@ -75,10 +72,7 @@ def expense_dashboard(request):
     savings_rate = (savings / total_income * 100) if total_income > 0 else 0
     
     # Calculate month-over-month changes
-    prev_month_start = (first_day - timedelta(days=1)).replace(day=1)
-    prev_month_end = first_day - timedelta(days=1)
-    
-    prev_month_spent = expenses.filter(date__range=[prev_month_start, prev_month_end]).aggregate(total=Sum('amount'))['total'] or 0
+    prev_month_spent = summary['prev_month_spent']
     
     expense_change = ((total_spent - prev_month_spent) / prev_month_spent * 100) if prev_month_spent > 0 else 0
     income_change = 0  # Since we're using active income sources, we'll skip the change calculation
@@ -92,97 +86,59 @@ def expense_dashboard(request):
     
     budget_status = (total_spent / monthly_budget * 100) if monthly_budget > 0 else 0
     
-    # Calculate spending by category for charts
-    categories = Category.objects.filter(user=request.user)
-    category_spending = []
-    for cat in categories:
-        amount = expenses.filter(category=cat, date__range=[first_day, last_day]).aggregate(total=Sum('amount'))['total'] or 0
-        if amount > 0:
-            category_spending.append({
-                'name': cat.name,
-                'amount': float(amount),
-                'color': cat.color or '#' + ''.join([random.choice('0123456789ABCDEF') for _ in range(6)])
-            })
-    
-    # Sort categories by amount (highest first)
-    category_spending = sorted(category_spending, key=lambda x: x['amount'], reverse=True)
-    
-    # Find top category
-    top_category = None
-    if category_spending:
-        top_category = categories.filter(name=category_spending[0]['name']).first()
-    
-    # Monthly spending trend data for chart
-    months = []
-    spending_data = []
-    
-    for i in range(5, -1, -1):  # Last 6 months
-        month_date = today - timedelta(days=30*i)
-        month_start = date(month_date.year, month_date.month, 1)
-        month_end = date(month_date.year, month_date.month, calendar.monthrange(month_date.year, month_date.month)[1])
-        
-        month_expenses = expenses.filter(
-            date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        months.append(month_date.strftime('%b'))
-        spending_data.append(float(month_expenses))
+    # Spending by category for charts, sorted by amount (highest first)
+    category_spending = summary['category_spending']
     
     # Prepare data for charts
     chart_data = {
         'categories': [cat['name'] for cat in category_spending[:7]],  # Top 7 categories
         'amounts': [cat['amount'] for cat in category_spending[:7]],
         'colors': [cat['color'] for cat in category_spending[:7]],
-        'months': months,
-        'spending_trend': spending_data
+        'months': summary['months'],
+        'spending_trend': summary['spending_trend']
     }
     
-    # Get all tags for filtering
-    all_tags = set()
-    for expense in expenses:
-        all_tags.update(expense.tags)
-    all_tags = sorted(list(all_tags))
-    
     # Get recurring expenses and prepare calendar data
-    recurring_expenses = RecurringExpense.objects.filter(user=request.user, status='active')
+    recurring_expenses = RecurringExpense.objects.filter(user=request.user, status='active').select_related('category')
     upcoming_recurring_expenses = []
     recurring_expenses_json = []
     
-    for expense in recurring_expenses:
-        next_date = expense.get_next_date()
-        if next_date and next_date <= today + timedelta(days=30):
-            upcoming_recurring_expenses.append({
-                'description': expense.description,
-                'amount': expense.amount,
-                'category': expense.category,
-                'next_date': next_date
-            })
-            
-            # Add to calendar events
-            recurring_expenses_json.append({
-                'title': expense.description,
-                'start': next_date.strftime('%Y-%m-%d'),
-                'backgroundColor': expense.category.color if expense.category else '#667eea',
-                'borderColor': expense.category.color if expense.category else '#667eea',
-                'extendedProps': {
-                    'amount': str(expense.amount),
-                    'category': expense.category.name if expense.category else 'Uncategorized',
-                    'frequency': expense.get_frequency_display()
-                }
-            })
-    
+    # Every occurrence due in the next 30 days, not just each template's next date
+    for next_date, expense in occurrences(recurring_expenses, today, today + timedelta(days=30)):
+        upcoming_recurring_expenses.append({
+            'description': expense.description,
+            'amount': expense.amount,
+            'category': expense.category,
+            'next_date': next_date
+        })
+
+        # Add to calendar events
+        recurring_expenses_json.append({
+            'title': expense.description,
+            'start': next_date.strftime('%Y-%m-%d'),
+            'backgroundColor': expense.category.color if expense.category else '#667eea',
+            'borderColor': expense.category.color if expense.category else '#667eea',
+            'extendedProps': {
+                'amount': str(expense.amount),
+                'category': expense.category.name if expense.category else 'Uncategorized',
+                'frequency': expense.get_frequency_display()
+            }
+        })
+
     context = {
         'expenses': recent_expenses,
         'total_spent': total_spent,
         'total_income': total_income,
         'savings': savings,
         'savings_rate': savings_rate,
+        # Running balance, read from today's balance snapshot
+        'balance': balances.balance(request.user.profile),
         'income_change': income_change,
         'expense_change': expense_change,
         'budget_status': budget_status,
-        'categories': categories,
-        'top_category': top_category,
-        'all_tags': all_tags,
+        'categories': summary['categories'],
+        'top_category': summary['top_category'],
+        'all_tags': summary['all_tags'],
         'recurring_expenses_json': json.dumps(recurring_expenses_json),
         'upcoming_recurring_expenses': upcoming_recurring_expenses,
         'chart_data': chart_data,
@@ -196,8 +152,75 @@ def expense_dashboard(request):
 
 @login_required
 def expense_list(request):
-    expenses = Expense.objects.filter(user=request.user).select_related('category').order_by('-date')
-    return render(request, 'expenses/expense_list.html', {'expenses': expenses})
+    filter_form, expenses = filtered_expenses(request)
+    page, next_cursor = paginate(expenses, request.GET.get('cursor'))
+
+    # Filters without the cursor, for the "load more" requests
+    params = request.GET.copy()
+    params.pop('cursor', None)
+
+    context = {
+        'expenses': page,
+        'filter_form': filter_form,
+        'next_cursor': next_cursor,
+        'filter_query': params.urlencode(),
+        'parquet_export': parquet_available(),
+    }
+    return render(request, 'expenses/expense_list.html', context)
+
+@login_required
+def expense_list_data(request):
+    """JSON pages of expense_list for infinite scroll"""
+    filter_form, expenses = filtered_expenses(request)
+    if filter_form.errors:
+        return JsonResponse({'errors': filter_form.errors}, status=400)
+
+    try:
+        limit = min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    page, next_cursor = paginate(expenses, request.GET.get('cursor'), max(limit, 1))
+
+    results = [{
+        'id': expense.id,
+        'date': expense.date.isoformat(),
+        'description': expense.description,
+        'amount': str(expense.amount),
+        'category': {
+            'name': expense.category.name,
+            'color': expense.category.color,
+            'icon': expense.category.icon,
+        } if expense.category else None,
+        'edit_url': reverse('expense_edit', args=[expense.id]),
+        'delete_url': reverse('expense_delete', args=[expense.id]),
+        'share_url': reverse('share_expense', args=[expense.id]),
+    } for expense in page]
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+@login_required
+def export_expenses(request):
+    """Stream the user's expenses, narrowed by the expense_list filters"""
+    filter_form, expenses = filtered_expenses(request)
+    if filter_form.errors:
+        return JsonResponse({'errors': filter_form.errors}, status=400)
+
+    try:
+        columns = parse_columns(request.GET.getlist('columns'))
+        return export_response(expenses, request.GET.get('format', 'csv'), columns)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+def filtered_expenses(request):
+    """Return the bound filter form and the user's expenses narrowed by its valid fields"""
+    filter_form = ExpenseFilterForm(request.user, request.GET or None)
+    expenses = Expense.objects.filter(user=request.user).select_related('category')
+    if filter_form.is_bound:
+        # An invalid field (e.g. a bad amount) is left out rather than dropping every filter
+        filter_form.is_valid()
+        expenses = filter_expenses(expenses, {
+            name: value for name, value in filter_form.cleaned_data.items() if name not in filter_form.errors
+        })
+    return filter_form, expenses
 
 @login_required
 def expense_add(request):
@@ -293,16 +316,10 @@ def add_category_rule(request):
 @login_required
 def suggest_category(request):
     if 'description' in request.GET:
-        description = request.GET['description']
-        # Find matching rule with highest priority
-        rule = CategoryRule.objects.filter(
-            user=request.user,
-            is_active=True,
-            pattern__iregex=description
-        ).order_by('-priority').first()
-        
-        if rule:
-            return JsonResponse({'category': rule.category.id})
+        # Match against the user's compiled rules and category keywords
+        category_id = suggest_category_id(request.user, request.GET['description'])
+        if category_id:
+            return JsonResponse({'category': category_id})
     return JsonResponse({'category': None})
 
 @login_required
@@ -315,78 +332,11 @@ def upload_receipt(request):
             
             # Save the receipt first
             receipt.save()
-            
-            try:
-                # Process the image
-                image = Image.open(receipt.image)
-                # Convert to numpy array for OpenCV
-                image_np = np.array(image)
-                
-                # Convert to grayscale
-                gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-                # Thresholding
-                thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-                
-                # Extract text using pytesseract
-                extracted_text = pytesseract.image_to_string(thresh)
-                receipt.extracted_text = extracted_text
-                
-                # Try to extract amount
-                amount_pattern = r'\$?\d+\,?\d*\.\d{2}'
-                amounts = re.findall(amount_pattern, extracted_text)
-                if amounts:
-                    receipt.extracted_amount = max([float(a.replace('$', '').replace(',', '')) for a in amounts])
-                
-                # Try to extract date
-                date_patterns = [
-                    r'\d{2}/\d{2}/\d{4}',
-                    r'\d{2}-\d{2}-\d{4}',
-                    r'\d{4}-\d{2}-\d{2}'
-                ]
-                for pattern in date_patterns:
-                    dates = re.findall(pattern, extracted_text)
-                    if dates:
-                        try:
-                            receipt.extracted_date = datetime.strptime(dates[0], pattern.replace('\\d', '%d').replace('\\', '%'))
-                            break
-                        except ValueError:
-                            continue
-                
-                # Try to extract merchant name (first line that's not a date or amount)
-                lines = extracted_text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line and not re.search(amount_pattern, line) and not any(re.search(p, line) for p in date_patterns):
-                        receipt.extracted_merchant = line[:200]  # Limit to model field size
-                        break
-                
-                receipt.is_processed = True
-                receipt.save()
-                
-                # Create expense if we have an amount
-                if receipt.extracted_amount:
-                    expense = Expense(
-                        user=request.user,
-                        amount=receipt.extracted_amount,
-                        date=receipt.extracted_date or datetime.now().date(),
-                        description=receipt.extracted_merchant or 'Receipt expense',
-                        receipt=receipt
-                    )
-                    expense.save()
-                    messages.success(request, 'Receipt processed and expense created successfully!')
-                    return redirect('expense_edit', pk=expense.pk)
-                
-                messages.success(request, 'Receipt processed successfully!')
-                return redirect('expense_list')
-                
-            except IOError as e:
-                messages.error(request, f'Error reading receipt image: {str(e)}')
-            except pytesseract.TesseractError as e:
-                messages.error(request, f'Error processing receipt text: {str(e)}')
-            except Exception as e:
-                messages.error(request, f'Unexpected error processing receipt: {str(e)}')
-                logger.exception('Error processing receipt')
-            return redirect('expense_list')
+
+            # OCR runs in the process_receipts worker; the process page polls for the result
+            enqueue_receipt(receipt)
+            messages.success(request, 'Receipt uploaded. We are reading it now.')
+            return redirect('process_receipt', receipt_id=receipt.id)
     else:
         form = ReceiptUploadForm()
     
@@ -427,12 +377,64 @@ def process_receipt(request, receipt_id):
         messages.success(request, 'Receipt processed and expense updated successfully!')
         return redirect('expense_edit', pk=expense.id)
     
+    ocr_job = ReceiptOCRJob.objects.filter(receipt=receipt).first()
     context = {
         'receipt': receipt,
-        'extracted_text': receipt.extracted_text
+        'extracted_text': receipt.extracted_text,
+        'ocr_job': ocr_job,
+        'ocr_pending': ocr_job is not None and ocr_job.status in ('pending', 'running'),
     }
     return render(request, 'expenses/process_receipt.html', context)
 
+@login_required
+def receipt_status(request, receipt_id):
+    receipt = get_object_or_404(Receipt, id=receipt_id, user=request.user)
+    ocr_job = ReceiptOCRJob.objects.filter(receipt=receipt).first()
+
+    expense_url = None
+    if ocr_job and ocr_job.expense_id:
+        expense_url = reverse('expense_edit', args=[ocr_job.expense_id])
+
+    return JsonResponse({
+        'status': ocr_job.status if ocr_job else ('done' if receipt.is_processed else 'pending'),
+        'is_processed': receipt.is_processed,
+        'error': ocr_job.error if ocr_job else '',
+        'amount': str(receipt.extracted_amount) if receipt.extracted_amount is not None else None,
+        'date': receipt.extracted_date.isoformat() if receipt.extracted_date else None,
+        'merchant': receipt.extracted_merchant or '',
+        'expense_url': expense_url,
+    })
+
+@login_required
+def import_expenses(request):
+    if request.method == 'POST':
+        form = ImportJobForm(request.POST, request.FILES)
+        if form.is_valid():
+            job = form.save(commit=False)
+            job.user = request.user
+            job.mapping = form.get_mapping() if job.format == 'csv' else {}
+            job.save()
+            # Rows are imported by the process_imports worker; the page polls for progress
+            messages.success(request, 'File uploaded. Your expenses are being imported.')
+            return redirect('import_expenses')
+    else:
+        form = ImportJobForm()
+
+    jobs = ImportJob.objects.filter(user=request.user).order_by('-created_at')[:10]
+    return render(request, 'expenses/import_expenses.html', {'form': form, 'jobs': jobs})
+
+@login_required
+def import_status(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'status': job.status,
+        'processed_rows': job.processed_rows,
+        'created_count': job.created_count,
+        'duplicate_count': job.duplicate_count,
+        'error_count': job.error_count,
+        'errors': job.errors.splitlines(),
+    })
+
 @login_required
 def share_expense(request, expense_id):
     expense = get_object_or_404(Expense, id=expense_id, user=request.user)
@@ -491,19 +493,15 @@ def ajax_update_notes_tags(request, expense_id):
         # Update notes
         expense.notes = notes
         
-        # Store tags and colors as JSON in a custom field
-        # Since we don't have a separate tags model, we'll save them as a JSON field in the database
-        # This will be handled in the save method of the expense model
-        
         # Create a dictionary of tags and their colors
         tags_data = {}
         for i, tag in enumerate(tags):
             if tag.strip():  # Only add non-empty tags
-                tags_data[tag.strip()] = tag_colors[i] if i < len(tag_colors) else '#8888ff'
-        
-        # Store the tags_data as JSON in a field (we'll add this field to the model)
-        expense.tags_json = json.dumps(tags_data)
-        expense.save()
+                tags_data[tag.strip()] = tag_colors[i] if i < len(tag_colors) else DEFAULT_TAG_COLOR
+
+        with transaction.atomic():
+            expense.save()
+            expense.set_tags(tags_data)
         
         return JsonResponse({'success': True})
     except Exception as e:
@@ -546,9 +544,6 @@ def recurring_expense_list(request):
         elif expense.frequency == 'annual':
             monthly_equivalent += expense.amount / 12
     
-    # Check for any recurring expenses that need to be generated
-    check_recurring_expenses(request.user)
-    
     # Get next upcoming generated expenses
     upcoming_expenses = []
     for expense in active_expenses:
@@ -726,21 +721,6 @@ def generate_now(request, pk):
     messages.success(request, 'Expense generated successfully!')
     return redirect('recurring_expense_list')
 
-def check_recurring_expenses(user):
-    """Automatically generate due recurring expenses"""
-    today = timezone.now().date()
-    
-    # Find recurring expenses that are due
-    due_expenses = RecurringExpense.objects.filter(
-        user=user,
-        status='active',
-        next_date__lte=today
-    )
-    
-    # Generate expenses for each due recurring expense
-    for recurring_expense in due_expenses:
-        recurring_expense.generate_expense()
-
 @login_required
 def recurring_expense_dashboard(request):
     """Dashboard view showing an overview of recurring expenses"""
@@ -774,7 +754,12 @@ def recurring_expense_dashboard(request):
                 'display': dict(RecurringExpense.FREQUENCY_CHOICES)[freq]
             }
     
+    # Projected recurring spend for the next 12 months
+    forecast = monthly_forecast(recurring_expenses, timezone.now().date())
+
     context = {
+        'forecast_labels': json.dumps([row['month'].strftime('%b %Y') for row in forecast]),
+        'forecast_totals': json.dumps([float(row['total']) for row in forecast]),
         'expenses_by_category': expenses_by_category,
         'expenses_by_frequency': expenses_by_frequency,
         'total_recurring': total_recurring,
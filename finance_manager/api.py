@@ -2,12 +2,13 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 import json
 from datetime import datetime, timedelta
 from django.db.models import Sum
 import random
 
-from expenses.models import Expense, Category
+from expenses import dashboard_cache, rollups
 from budgets.models import Budget
 from users.models import Profile, IncomeSource, RecurringBill
 
@@ -17,57 +18,63 @@ def financial_data(request):
     """API endpoint to get financial data for the dashboard."""
     user = request.user
     
-    # Get current month data
-    now = datetime.now()
-    month_start = datetime(now.year, now.month, 1)
-    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    # Get current month data, in the user's time zone
+    today = user.profile.local_today()
+    month_start = datetime(today.year, today.month, 1)
     
+    # Served from the per-user dashboard cache until the user's data changes
+    payload = dashboard_cache.get_payload(
+        'financial_data', user.pk, month_start.date(),
+        lambda: _build_financial_data(user, month_start),
+    )
+    return JsonResponse(payload)
+
+@staff_member_required
+def dashboard_cache_stats(request):
+    """API endpoint reporting dashboard cache hits and misses."""
+    return JsonResponse(dashboard_cache.stats())
+
+def _build_financial_data(user, month_start):
     # Get user profile
     profile = user.profile
     
-    # Get expense data from database
-    expenses = Expense.objects.filter(user=user, date__gte=month_start, date__lte=month_end)
-    total_expenses = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    
     # Get budget data from database
-    budgets = Budget.objects.filter(user=user, is_active=True)
-    total_budget = budgets.aggregate(Sum('amount'))['amount__sum'] or 0
+    budgets = Budget.objects.filter(
+        user=user,
+        active=True,
+        month__year=month_start.year,
+        month__month=month_start.month
+    )
+    total_budget = budgets.aggregate(Sum('limit'))['limit__sum'] or 0
     
-    # Get categories with amounts from database
-    categories = Category.objects.filter(expense__user=user, expense__date__gte=month_start, expense__date__lte=month_end).distinct()
+    # Get categories with amounts from the monthly spending rollup
     category_expenses = []
     top_category = None
     top_amount = 0
+    total_expenses = 0
     
-    for category in categories:
-        amount = Expense.objects.filter(
-            user=user, 
-            category=category,
-            date__gte=month_start, 
-            date__lte=month_end
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+    for row in rollups.category_totals(user, month_start.date()):
+        if row['category_id'] is None:
+            total_expenses += row['category_total']
+            continue
+        amount = row['category_total']
+        total_expenses += amount
         
         category_expenses.append({
-            'name': category.name,
+            'name': row['category__name'],
             'amount': float(amount),
             'spent': float(amount),
-            'color': category.color,
-            'icon': category.icon
+            'color': row['category__color'],
+            'icon': row['category__icon']
         })
         
         if amount > top_amount:
             top_amount = amount
-            top_category = category.name
-    
-    # Get last month data for comparison from database
-    last_month_start = month_start - timedelta(days=month_start.day)
-    last_month_end = month_start - timedelta(days=1)
+            top_category = row['category__name']
     
-    last_month_expenses = Expense.objects.filter(
-        user=user, 
-        date__gte=last_month_start, 
-        date__lte=last_month_end
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    # Get last month data for comparison
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    last_month_expenses = rollups.month_total(user, last_month_start.date())
     
     # Calculate month-over-month change
     if last_month_expenses > 0:
@@ -123,7 +130,7 @@ def financial_data(request):
         'bills': bills_list
     }
     
-    return JsonResponse(financial_data)
+    return financial_data
 
 @login_required
 @require_http_methods(["POST"])
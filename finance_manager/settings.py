@@ -153,4 +153,28 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Tesseract configuration
-TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
\ No newline at end of file
+TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Receipt OCR worker processes (see the process_receipts management command)
+RECEIPT_OCR_WORKERS = int(os.environ.get('RECEIPT_OCR_WORKERS', 2))
+
+# Cache for compiled category matchers and dashboard payloads. Local memory is
+# per process; set CACHE_DIR to share one file cache between worker processes
+# so signal-driven invalidation reaches all of them.
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'finance-manager',
+        }
+    }
+
+# Seconds a cached dashboard payload may be served (see expenses.dashboard_cache)
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 300))
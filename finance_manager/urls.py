@@ -35,6 +35,7 @@ urlpatterns = [
     
     # API endpoints (Legacy / Web)
     path('api/financial-data/', api.financial_data, name='api_financial_data'),
+    path('api/financial-data/cache-stats/', api.dashboard_cache_stats, name='api_dashboard_cache_stats'),
     path('api/financial-data/update/', api.update_financial_data, name='api_update_financial_data'),
     path('api/income-source/add/', api.add_income_source, name='api_add_income_source'),
     path('api/create-sample-data/', api.create_sample_data, name='api_create_sample_data'),
@@ -43,9 +44,11 @@ urlpatterns = [
     path('api/auth/login/', user_api_views.LoginView.as_view(), name='api_login'),
     path('api/auth/register/', user_api_views.RegisterView.as_view(), name='api_register'),
     path('api/expenses/', expense_api_views.ExpenseListCreateView.as_view(), name='api_expenses'),
+    path('api/expenses/batch/', expense_api_views.ExpenseBatchView.as_view(), name='api_expenses_batch'),
     path('api/expenses/recent/', expense_api_views.RecentExpenseListView.as_view(), name='api_recent_expenses'),
     path('api/categories/', expense_api_views.CategoryListCreateView.as_view(), name='api_categories'),
     path('api/dashboard/', expense_api_views.FinancialDataView.as_view(), name='api_mobile_dashboard'),
+    path('api/sync/', expense_api_views.SyncView.as_view(), name='api_sync'),
 
     # PWA files
     path('sw.js', TemplateView.as_view(template_name='sw.js', content_type='application/javascript'), name='sw'),
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# No models to register for reports app.
+from .models import ReportArtifact
+
+
+@admin.register(ReportArtifact)
+class ReportArtifactAdmin(admin.ModelAdmin):
+    list_display = ('user', 'start', 'end', 'data_version', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('data_version', 'file', 'error', 'created_at', 'started_at', 'finished_at')
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reports.rendering import STALE_AFTER, claim_next_job, fail_stale_jobs, process_job
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF financial reports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Render the reports currently queued and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=int(STALE_AFTER.total_seconds() // 60),
+                            metavar='MINUTES',
+                            help='Fail running reports that started more than this many minutes ago.')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_after'])
+        while True:
+            fail_stale_jobs(stale_after)
+            artifact = claim_next_job()
+            if artifact is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            try:
+                process_job(artifact)
+            except Exception as e:
+                artifact.status = 'failed'
+                artifact.error = str(e)
+                artifact.finished_at = timezone.now()
+                artifact.save(update_fields=['status', 'error', 'finished_at'])
+                self.stderr.write(f'Report {artifact.pk} failed: {e}')
+                continue
+
+            self.stdout.write(f'Report {artifact.pk} rendered in {time.monotonic() - started:.1f}s')
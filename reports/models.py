@@ -1,5 +1,50 @@
-"""No models needed for reports app; it will use data from other apps for generating reports and exports."""
-
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+def report_upload_path(instance, filename):
+    return (f'reports/{instance.user_id}/'
+            f'{instance.start:%Y-%m}_{instance.end:%Y-%m}_v{instance.data_version}.pdf')
+
+
+class ReportArtifact(models.Model):
+    """A PDF report for a range of months, rendered by the render_reports worker.
+
+    Artifacts are keyed by the user's DataVersion, so a finished PDF is served
+    as-is until the user's data changes.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_artifacts')
+    # First days of the first and last month covered
+    start = models.DateField()
+    end = models.DateField()
+    data_version = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to=report_upload_path, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'start', 'end', 'data_version'], name='unique_report_artifact'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_artifact_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Report {self.start:%Y-%m}..{self.end:%Y-%m} - {self.user.username} ({self.status})"
+
+    @property
+    def filename(self):
+        if self.start == self.end:
+            return f'financial_report_{self.start:%Y_%m}.pdf'
+        return f'financial_report_{self.start:%Y_%m}-{self.end:%Y_%m}.pdf'
@@ -0,0 +1,193 @@
+"""PDF financial reports rendered in the background.
+
+`export_pdf` only looks up or queues a ReportArtifact for the requested months
+and the user's current DataVersion; the render_reports worker builds the PDF
+and stores it under MEDIA_ROOT. Aggregates are read from the monthly category
+rollups, so an annual report costs the same handful of queries as a monthly
+one. Once a newer version of a report is rendered the older files are removed.
+A report left running longer than STALE_AFTER (e.g. its worker died) counts as
+failed, so the pending page stops waiting and the next export queues it again.
+"""
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from expenses import rollups, timeseries
+from expenses.models import Expense
+from users.models import DataVersion
+from .models import ReportArtifact
+
+LARGEST_EXPENSES = 10
+STALE_AFTER = timedelta(minutes=10)
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+
+def request_report(user, start, end):
+    """Return the artifact for `user`'s report on months start..end at their current data version.
+
+    A missing artifact is queued for the worker; a failed or stale one, or one
+    whose file has gone from storage, is queued again.
+    """
+    version = DataVersion.for_user(user).version
+    lookup = {'user': user, 'start': start, 'end': end, 'data_version': version}
+    try:
+        with transaction.atomic():
+            artifact, created = ReportArtifact.objects.get_or_create(**lookup)
+    except IntegrityError:
+        # Queued by a concurrent request
+        artifact = ReportArtifact.objects.get(**lookup)
+    lost = artifact.status == 'done' and not artifact.file.storage.exists(artifact.file.name)
+    stale = artifact.status == 'running' and artifact.started_at < timezone.now() - STALE_AFTER
+    if artifact.status == 'failed' or lost or stale:
+        artifact.status = 'pending'
+        artifact.error = ''
+        artifact.save(update_fields=['status', 'error'])
+    return artifact
+
+
+def fail_stale_jobs(older_than=STALE_AFTER):
+    """Fail reports stuck in 'running' (e.g. after a worker crash); return how many there were"""
+    now = timezone.now()
+    return ReportArtifact.objects.filter(status='running', started_at__lt=now - older_than).update(
+        status='failed', error='Rendering timed out', finished_at=now
+    )
+
+
+def claim_next_job():
+    """Mark the oldest pending report as running and return it, or None"""
+    for pk in ReportArtifact.objects.filter(status='pending').order_by('created_at').values_list('pk', flat=True)[:10]:
+        if ReportArtifact.objects.filter(pk=pk, status='pending').update(status='running', started_at=timezone.now()):
+            return ReportArtifact.objects.select_related('user').get(pk=pk)
+    return None
+
+
+def process_job(artifact):
+    """Render the PDF for a claimed artifact and drop the superseded versions of the same report"""
+    artifact.file.save(artifact.filename, ContentFile(render_pdf(artifact.user, artifact.start, artifact.end)),
+                       save=False)
+    artifact.status = 'done'
+    artifact.finished_at = timezone.now()
+    artifact.save(update_fields=['file', 'status', 'finished_at'])
+
+    stale = ReportArtifact.objects.filter(
+        user=artifact.user, start=artifact.start, end=artifact.end, data_version__lt=artifact.data_version
+    )
+    for old in stale:
+        old.file.delete(save=False)
+    stale.delete()
+    return artifact
+
+
+def _table(data, col_widths):
+    table = Table(data, colWidths=[width * inch for width in col_widths])
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def _trend_chart(labels, income, expenses):
+    drawing = Drawing(6.5 * inch, 2.8 * inch)
+    chart = VerticalBarChart()
+    chart.x, chart.y = 0.6 * inch, 0.4 * inch
+    chart.width, chart.height = 5.6 * inch, 2.2 * inch
+    chart.data = [[float(value) for value in income], [float(value) for value in expenses]]
+    chart.categoryAxis.categoryNames = labels
+    chart.categoryAxis.labels.fontSize = 8
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labels.fontSize = 8
+    chart.bars[0].fillColor = colors.HexColor('#48bb78')
+    chart.bars[1].fillColor = colors.HexColor('#f56565')
+    drawing.add(chart)
+    return drawing
+
+
+def render_pdf(user, start, end):
+    """Return the PDF bytes of `user`'s financial report for the months start..end"""
+    months = timeseries.periods(end, (end.year - start.year) * 12 + end.month - start.month + 1)
+    income = timeseries.income_totals(user, months)
+    expenses = timeseries.expense_totals(user, months)
+    total_income, total_expenses = sum(income), sum(expenses)
+    multi_month = len(months) > 1
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24, spaceAfter=30)
+    heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'], fontSize=16, spaceAfter=12)
+
+    if not multi_month:
+        period = start.strftime('%B %Y')
+    elif start.month == 1 and end.month == 12 and start.year == end.year:
+        period = str(start.year)
+    else:
+        period = f"{start:%B %Y} - {end:%B %Y}"
+
+    elements = [
+        Paragraph(f"Financial Report: {period}", title_style),
+        Paragraph(f"Generated on: {user.profile.local_today():%B %d, %Y}", styles['Normal']),
+        Spacer(1, 20),
+        Paragraph("Summary", heading_style),
+        _table([
+            ["Category", "Amount (UGX)"],
+            ["Total Income", f"{total_income:,.0f}"],
+            ["Total Expenses", f"{total_expenses:,.0f}"],
+            ["Net Savings", f"{(total_income - total_expenses):,.0f}"],
+        ], [3, 2]),
+        Spacer(1, 20),
+    ]
+
+    if multi_month:
+        elements.append(Paragraph("Monthly Trend", heading_style))
+        elements.append(_trend_chart([timeseries.label(month) for month in months], income, expenses))
+        month_rows = [["Month", "Income", "Expenses", "Net"]]
+        for month, month_income, month_expenses in zip(months, income, expenses):
+            month_rows.append([month.strftime('%b %Y'), f"{month_income:,.0f}", f"{month_expenses:,.0f}",
+                               f"{(month_income - month_expenses):,.0f}"])
+        elements.append(_table(month_rows, [1.5, 1.6, 1.6, 1.6]))
+        elements.append(Spacer(1, 20))
+
+    elements.append(Paragraph("Expense Categories", heading_style))
+    category_rows = [["Category", "Amount (UGX)", "Percentage"]]
+    for row in rollups.category_totals(user, start, end):
+        percentage = (row['category_total'] / total_expenses * 100) if total_expenses else 0
+        category_rows.append([row['category__name'] or 'Uncategorized', f"{row['category_total']:,.0f}",
+                              f"{percentage:.1f}%"])
+    elements.append(_table(category_rows, [2, 2, 1]))
+    elements.append(Spacer(1, 20))
+
+    elements.append(Paragraph("Largest Expenses", heading_style))
+    expense_rows = [["Date", "Description", "Category", "Amount (UGX)"]]
+    largest = (
+        Expense.objects.filter(user=user, date__gte=start, date__lt=timeseries.add_months(end, 1))
+        .select_related('category')
+        .order_by('-amount', '-date')[:LARGEST_EXPENSES]
+    )
+    for expense in largest:
+        expense_rows.append([expense.date.strftime('%Y-%m-%d'), expense.description[:30],
+                             expense.category.name if expense.category else 'Uncategorized',
+                             f"{expense.amount:,.0f}"])
+    elements.append(_table(expense_rows, [1.5, 2, 1.5, 1.5]))
+
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter).build(elements)
+    return buffer.getvalue()
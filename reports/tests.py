@@ -1,3 +1,91 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from expenses.models import Category, Expense
+from users.models import IncomeSource
+from .models import ReportArtifact
+from .rendering import claim_next_job, process_job, render_pdf
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('nina', password='secret')
+        food = Category.objects.create(user=self.user, name='Food')
+        IncomeSource.objects.create(user=self.user, name='Salary', amount=Decimal('1000'), frequency='monthly')
+        Expense.objects.create(user=self.user, amount=Decimal('40'), description='Lunch', date=date(2024, 3, 4),
+                               category=food)
+        Expense.objects.create(user=self.user, amount=Decimal('25'), description='Taxi', date=date(2024, 11, 20))
+        self.client.force_login(self.user)
+
+    def test_export_queues_renders_and_serves_cached_copy(self):
+        response = self.client.get(reverse('export_pdf'), {'year': '2024'})
+        self.assertTemplateUsed(response, 'reports/report_pending.html')
+        artifact = ReportArtifact.objects.get()
+        self.assertEqual((artifact.start, artifact.end, artifact.status), (date(2024, 1, 1), date(2024, 12, 1), 'pending'))
+
+        # Asking again while it is queued does not queue a second copy
+        self.client.get(reverse('export_pdf'), {'year': '2024'})
+        self.assertEqual(ReportArtifact.objects.count(), 1)
+
+        call_command('render_reports', once=True, stdout=StringIO())
+        artifact.refresh_from_db()
+        self.assertEqual(artifact.status, 'done')
+        status = self.client.get(reverse('report_status', args=[artifact.id])).json()
+        self.assertEqual(status['download_url'], reverse('download_report', args=[artifact.id]))
+
+        response = self.client.get(reverse('export_pdf'), {'year': '2024'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('financial_report_2024_01-2024_12.pdf', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_data_change_requeues_and_drops_stale_file(self):
+        self.client.get(reverse('export_pdf'), {'month': '2024-03'})
+        old = process_job(claim_next_job())
+
+        Expense.objects.create(user=self.user, amount=Decimal('5'), description='Tea', date=date(2024, 3, 5))
+        self.client.get(reverse('export_pdf'), {'month': '2024-03'})
+        new = ReportArtifact.objects.get(status='pending')
+        self.assertGreater(new.data_version, old.data_version)
+
+        process_job(claim_next_job())
+        self.assertEqual(list(ReportArtifact.objects.values_list('pk', flat=True)), [new.pk])
+        self.assertFalse(old.file.storage.exists(old.file.name))
+
+    def test_reports_abandoned_by_a_dead_worker_are_failed_and_requeued(self):
+        self.client.get(reverse('export_pdf'), {'month': '2024-03'})
+        artifact = claim_next_job()
+        ReportArtifact.objects.filter(pk=artifact.pk).update(started_at=timezone.now() - timedelta(hours=1))
+
+        call_command('render_reports', once=True, stdout=StringIO())
+        status = self.client.get(reverse('report_status', args=[artifact.id])).json()
+        self.assertEqual(status['status'], 'failed')
+
+        self.client.get(reverse('export_pdf'), {'month': '2024-03'})
+        artifact.refresh_from_db()
+        self.assertEqual(artifact.status, 'pending')
+
+    def test_reports_are_private(self):
+        self.client.get(reverse('export_pdf'))
+        artifact = process_job(claim_next_job())
+        other = User.objects.create_user('otto', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('report_status', args=[artifact.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('download_report', args=[artifact.id])).status_code, 404)
+
+    def test_annual_report_queries_do_not_grow_with_months(self):
+        with self.assertNumQueries(4):
+            render_pdf(self.user, date(2024, 1, 1), date(2024, 12, 1))
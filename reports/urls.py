@@ -5,4 +5,6 @@ urlpatterns = [
     path('', views.reports_dashboard, name='reports_dashboard'),
     path('chart/', views.reports_chart, name='reports_chart'),
     path('export/pdf/', views.export_pdf, name='export_pdf'),
+    path('export/pdf/<int:artifact_id>/status/', views.report_status, name='report_status'),
+    path('export/pdf/<int:artifact_id>/download/', views.download_report, name='download_report'),
 ] 
\ No newline at end of file
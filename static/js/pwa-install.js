@@ -81,11 +81,36 @@ if ('serviceWorker' in navigator) {
     navigator.serviceWorker.register('/static/js/sw.js')
       .then(registration => {
         console.log('SW registered: ', registration);
+        return navigator.serviceWorker.ready;
       })
+      .then(requestLedgerSync)
       .catch(registrationError => {
         console.log('SW registration failed: ', registrationError);
       });
   });
+
+  // Catch up on changes made elsewhere once the connection is back
+  window.addEventListener('online', () => {
+    navigator.serviceWorker.ready.then(requestLedgerSync);
+  });
+}
+
+// Ask the service worker to refresh the offline copy of the ledger (signed-in pages only)
+function requestLedgerSync(registration) {
+  if (!document.querySelector('meta[name="ledger-sync"]')) {
+    return;
+  }
+  if ('sync' in registration) {
+    registration.sync.register('ledger-sync').catch(() => postLedgerSync(registration));
+  } else {
+    postLedgerSync(registration);
+  }
+}
+
+function postLedgerSync(registration) {
+  if (registration.active) {
+    registration.active.postMessage({ type: 'ledger-sync' });
+  }
 }
 
 // Hide install button if already installed
@@ -52,4 +52,83 @@ self.addEventListener('activate', event => {
       );
     })
   );
-});
\ No newline at end of file
+});
+// Incremental ledger sync: pulls /api/sync/ pages into IndexedDB, keeping
+// the server-issued token so later syncs only fetch what changed.
+const SYNC_DB_NAME = 'expense-tracker-sync';
+const SYNC_KINDS = ['categories', 'expenses', 'budgets', 'recurring'];
+
+function openSyncDb() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(SYNC_DB_NAME, 1);
+    request.onupgradeneeded = () => {
+      SYNC_KINDS.forEach(kind => request.result.createObjectStore(kind, { keyPath: 'id' }));
+      request.result.createObjectStore('meta');
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function runTransaction(db, stores, work) {
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(stores, 'readwrite');
+    const result = work(tx);
+    tx.oncomplete = () => resolve(result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+function readToken(db) {
+  return new Promise((resolve, reject) => {
+    const request = db.transaction('meta').objectStore('meta').get('token');
+    request.onsuccess = () => resolve(request.result || '');
+    request.onerror = () => reject(request.error);
+  });
+}
+
+async function syncLedger() {
+  const db = await openSyncDb();
+  let token = await readToken(db);
+  let hasMore = true;
+  while (hasMore) {
+    const response = await fetch('/api/sync/?token=' + encodeURIComponent(token), { credentials: 'same-origin' });
+    if (response.status === 400) {
+      // Token no longer valid (e.g. another account): start over with a full sync
+      await runTransaction(db, [...SYNC_KINDS, 'meta'], tx => {
+        SYNC_KINDS.forEach(kind => tx.objectStore(kind).clear());
+        tx.objectStore('meta').delete('token');
+      });
+      token = '';
+      continue;
+    }
+    if (!response.ok) {
+      throw new Error('Sync failed with status ' + response.status);
+    }
+    const page = await response.json();
+    // Each page and its token are stored together so an interrupted sync resumes where it stopped
+    await runTransaction(db, [...SYNC_KINDS, 'meta'], tx => {
+      SYNC_KINDS.forEach(kind => {
+        const store = tx.objectStore(kind);
+        page[kind].created.concat(page[kind].updated).forEach(row => store.put(row));
+        page[kind].deleted.forEach(id => store.delete(id));
+      });
+      tx.objectStore('meta').put(page.token, 'token');
+    });
+    token = page.token;
+    hasMore = page.has_more;
+  }
+}
+
+// Background Sync (where supported) and explicit requests from the page
+self.addEventListener('sync', event => {
+  if (event.tag === 'ledger-sync') {
+    event.waitUntil(syncLedger());
+  }
+});
+
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'ledger-sync') {
+    event.waitUntil(syncLedger());
+  }
+});
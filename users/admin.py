@@ -6,6 +6,7 @@ from django.db.models import Sum
 from django.utils import timezone
 from django.urls import reverse
 from django.apps import apps
+from . import health
 from .models import (
     Profile, RecurringBill, InAppNotification, FinanceGoal, 
     FamilyMember, ActivityLog
@@ -149,35 +150,10 @@ class ProfileAdmin(admin.ModelAdmin):
     user_activity.short_description = 'Recent Activity'
 
     def recalculate_health_scores(self, request, queryset):
-        for profile in queryset:
-            score = self._calculate_financial_health(profile)
-            profile.financial_health_score = score
-            profile.save()
-        self.message_user(request, f'Recalculated health scores for {queryset.count()} profiles')
+        scored = health.recalculate(queryset)
+        self.message_user(request, f'Recalculated health scores for {scored} profiles')
     recalculate_health_scores.short_description = "Recalculate health scores"
 
-    def _calculate_financial_health(self, profile):
-        # Basic score starts at 50
-        score = 50
-        
-        # Savings ratio (up to +30 points)
-        if profile.monthly_savings_target > 0:
-            savings_ratio = profile.savings_amount / profile.monthly_savings_target
-            score += min(30, savings_ratio * 30)
-        
-        # Regular expense tracking (+10 points)
-        month_ago = timezone.now() - timezone.timedelta(days=30)
-        Expense = apps.get_model('expenses', 'Expense')
-        if Expense.objects.filter(user=profile.user, created_at__gte=month_ago).exists():
-            score += 10
-        
-        # Active budget management (+10 points)
-        Budget = apps.get_model('budgets', 'Budget')
-        if Budget.objects.filter(user=profile.user, active=True).exists():
-            score += 10
-
-        return min(100, int(score))
-
 @admin.register(RecurringBill)
 class RecurringBillAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'amount_display', 'due_date', 'frequency', 'status_display', 'is_active')
@@ -0,0 +1,98 @@
+"""Detection of unusually high category spending, stored as ExpenseAnomaly rows.
+
+The detect_anomalies command runs nightly over all users in chunks. Each chunk
+reads the monthly category rollups with one query and lays them out as a NumPy
+matrix of (user, category) rows by month. The median and median absolute
+deviation of the preceding months are then computed for every row at once. A
+category is flagged when this month's spending is both well above its median
+and an outlier by robust z-score. Results are upserted with one bulk_create, so
+acknowledged anomalies stay acknowledged across runs.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import Sum
+
+from expenses.models import MonthlyCategoryRollup
+from expenses.timeseries import add_months, periods
+from .models import ExpenseAnomaly, Profile
+
+BATCH_SIZE = 500
+# Months of history each month is compared with, and how many of them need spending
+WINDOW = 6
+MIN_HISTORY = 3
+# Spending must be this many times the median...
+MIN_RATIO = 1.5
+# ...and this far out by robust z-score (0.6745 * deviation / MAD)
+MIN_Z = 3.5
+
+
+def detect_for_profiles(profiles, window=WINDOW):
+    """Detect anomalies in each profile's current local month; return how many were flagged"""
+    months = {profile.user_id: profile.local_today().replace(day=1) for profile in profiles}
+    first = add_months(min(months.values()), -window)
+    last = max(months.values())
+
+    totals = defaultdict(dict)
+    for row in (
+        MonthlyCategoryRollup.objects.filter(user_id__in=months, month__gte=first, month__lte=last)
+        .values('user_id', 'category__name', 'month')
+        .annotate(month_total=Sum('total'))
+        .order_by()
+    ):
+        totals[row['user_id'], row['category__name'] or 'Uncategorized'][row['month']] = row['month_total']
+
+    # Only categories with spending this month can be anomalous
+    keys = [key for key, by_month in totals.items() if by_month.get(months[key[0]])]
+    matrix = np.zeros((len(keys), window + 1))
+    for i, (user_id, category) in enumerate(keys):
+        by_month = totals[user_id, category]
+        matrix[i] = [float(by_month.get(month, 0)) for month in periods(months[user_id], window + 1)]
+
+    # Months without spending are left out of the statistics
+    history = np.where(matrix[:, :-1] > 0, matrix[:, :-1], np.nan)
+    rows = np.flatnonzero(np.sum(~np.isnan(history), axis=1) >= MIN_HISTORY)
+    history, current = history[rows], matrix[rows, -1]
+    median = np.nanmedian(history, axis=1)
+    mad = np.nanmedian(np.abs(history - median[:, None]), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(mad > 0, 0.6745 * (current - median) / mad, np.inf)
+    flagged = np.flatnonzero((current > median * MIN_RATIO) & (z > MIN_Z))
+
+    anomalies = []
+    for i in flagged:
+        user_id, category = keys[rows[i]]
+        amount = totals[user_id, category][months[user_id]]
+        usual = Decimal(str(round(median[i], 2)))
+        anomalies.append(ExpenseAnomaly(
+            user_id=user_id, category=category, month=months[user_id], amount=amount, usual_amount=usual,
+            percentage_change=round((amount - usual) / usual * 100, 2),
+        ))
+    ExpenseAnomaly.objects.bulk_create(
+        anomalies, update_conflicts=True, unique_fields=['user', 'category', 'month'],
+        update_fields=['amount', 'usual_amount', 'percentage_change'],
+    )
+
+    # Spending that has since been corrected is no longer an anomaly
+    kept = {(anomaly.user_id, anomaly.category) for anomaly in anomalies}
+    existing = ExpenseAnomaly.objects.filter(
+        user_id__in=months, month__in=set(months.values()), is_acknowledged=False
+    ).values_list('pk', 'user_id', 'category', 'month')
+    ExpenseAnomaly.objects.filter(pk__in=[
+        pk for pk, user_id, category, month in existing
+        if month == months[user_id] and (user_id, category) not in kept
+    ]).delete()
+    return len(anomalies)
+
+
+def detect(profiles=None, window=WINDOW, batch_size=BATCH_SIZE):
+    """Detect anomalies for the given profiles (all by default) in chunks; return how many were flagged"""
+    profiles = (Profile.objects.all() if profiles is None else profiles).order_by('pk')
+    flagged, last_pk = 0, 0
+    while True:
+        chunk = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+        if not chunk:
+            return flagged
+        flagged += detect_for_profiles(chunk, window)
+        last_pk = chunk[-1].pk
@@ -0,0 +1,156 @@
+"""Running balance of each user's ledger, kept as daily BalanceSnapshot rows.
+
+A user's balance is their savings plus everything received from active income
+sources (one payment per daily, weekly, monthly, ... period since the source
+was created) less every expense dated up to today. Reading it is a single
+snapshot lookup:
+
+* the snapshot_balances command writes today's row for every user each night,
+  carrying the previous snapshot forward with only the days in between;
+* expense writes adjust `spent` on the snapshots on or after their date in
+  place (see expenses.signals), and bulk expense changes or income source
+  changes drop the snapshots they make stale;
+* a read that finds no snapshot for today writes one, so the next read is a
+  lookup again.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from expenses.models import Expense
+from expenses.schedule import DAY_STEPS, MONTH_STEPS as SCHEDULE_MONTH_STEPS
+from .models import BalanceSnapshot, IncomeSource, Profile
+
+BATCH_SIZE = 500
+# Snapshots are cumulative, so only the latest is read; older ones are kept this long
+KEEP_DAYS = 35
+MONTH_STEPS = {**SCHEDULE_MONTH_STEPS, 'yearly': 12}
+
+
+def payments(frequency, start, day):
+    """Return how many times a source paying every `frequency` since `start` has paid by `day`"""
+    if day < start:
+        return 0
+    if frequency in DAY_STEPS:
+        return (day - start).days // DAY_STEPS[frequency] + 1
+    months = (day.year - start.year) * 12 + day.month - start.month
+    # Month-based payments fall on the start day, clamped to the length of the month
+    if day.day < min(start.day, calendar.monthrange(day.year, day.month)[1]):
+        months -= 1
+    return months // MONTH_STEPS.get(frequency, 1) + 1
+
+
+def snapshot(profiles):
+    """Return {user_id: BalanceSnapshot} for each profile's local today, writing the missing ones.
+
+    Users with an earlier snapshot only add the spending dated since it; the
+    others are summed over their whole history.
+    """
+    days = {profile.user_id: profile.local_today() for profile in profiles}
+    # Users only differ in local date across time zones, so this is a query or two
+    users_by_day = defaultdict(list)
+    for user_id, day in days.items():
+        users_by_day[day].append(user_id)
+
+    # Anchor on the latest snapshot up to each user's day, ignoring any dated after it
+    previous = {}
+    for day, user_ids in users_by_day.items():
+        latest = Subquery(
+            BalanceSnapshot.objects.filter(user=OuterRef('user'), date__lte=day).order_by('-date').values('date')[:1]
+        )
+        previous.update((row.user_id, row) for row in BalanceSnapshot.objects.filter(user_id__in=user_ids, date=latest))
+    current = {user_id: row for user_id, row in previous.items() if row.date == days[user_id]}
+    stale = [user_id for user_id in days if user_id not in current]
+    if not stale:
+        return current
+
+    spent = defaultdict(Decimal)
+    carried = [user_id for user_id in stale if user_id in previous]
+    if carried:
+        for row in (
+            Expense.objects.filter(user_id__in=carried, date__gt=min(previous[user_id].date for user_id in carried),
+                                   date__lte=max(days[user_id] for user_id in carried))
+            .values('user_id', 'date')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        ):
+            if previous[row['user_id']].date < row['date'] <= days[row['user_id']]:
+                spent[row['user_id']] += row['total']
+        for user_id in carried:
+            spent[user_id] += previous[user_id].spent
+
+    fresh_by_day = defaultdict(list)
+    for user_id in stale:
+        if user_id not in carried:
+            fresh_by_day[days[user_id]].append(user_id)
+    for day, user_ids in fresh_by_day.items():
+        for row in (
+            Expense.objects.filter(user_id__in=user_ids, date__lte=day)
+            .values('user_id')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        ):
+            spent[row['user_id']] = row['total']
+
+    income = defaultdict(Decimal)
+    for source in IncomeSource.objects.filter(user_id__in=stale, is_active=True):
+        income[source.user_id] += source.amount * payments(source.frequency, source.created_at.date(),
+                                                           days[source.user_id])
+
+    rows = [
+        BalanceSnapshot(user_id=user_id, date=days[user_id], income=income[user_id], spent=spent[user_id])
+        for user_id in stale
+    ]
+    BalanceSnapshot.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user', 'date'],
+                                        update_fields=['income', 'spent'])
+    current.update((row.user_id, row) for row in rows)
+    return current
+
+
+def balances(profiles):
+    """Return {user_id: current balance} for the given profiles"""
+    snapshots = snapshot(profiles)
+    return {
+        profile.user_id: snapshots[profile.user_id].income - snapshots[profile.user_id].spent
+        + profile.savings_amount
+        for profile in profiles
+    }
+
+
+def balance(profile):
+    """Return one user's current balance"""
+    return balances([profile])[profile.user_id]
+
+
+def snapshot_all(batch_size=BATCH_SIZE):
+    """Write today's snapshot for every user and prune old ones; return how many users were snapshotted"""
+    profiles = Profile.objects.order_by('pk')
+    done, last_pk = 0, 0
+    while True:
+        chunk = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+        if not chunk:
+            break
+        snapshot(chunk)
+        done += len(chunk)
+        last_pk = chunk[-1].pk
+
+    # Every user now has a snapshot for today, so older ones are never read
+    BalanceSnapshot.objects.filter(date__lt=timezone.localdate() - timedelta(days=KEEP_DAYS)).delete()
+    return done
+
+
+def apply_expense_delta(user_id, day, amount):
+    """Add `amount` to the spending of every snapshot of `user_id` on or after `day`"""
+    BalanceSnapshot.objects.filter(user_id=user_id, date__gte=day).update(spent=F('spent') + amount)
+
+
+def invalidate(user_ids, since=None):
+    """Drop the snapshots of the given users, optionally only those from `since` on"""
+    rows = BalanceSnapshot.objects.filter(user_id__in=set(user_ids))
+    if since is not None:
+        rows = rows.filter(date__gte=since)
+    rows.delete()
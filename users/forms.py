@@ -1,3 +1,5 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -114,7 +116,7 @@ class ProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ['profile_picture', 'monthly_savings_target', 'preferred_currency', 
-                 'dark_mode', 'email_notifications', 'low_balance_threshold']
+                 'dark_mode', 'email_notifications', 'low_balance_threshold', 'time_zone']
         widgets = {
             'preferred_currency': forms.Select(attrs={'class': 'form-select'}),
             'dark_mode': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
@@ -123,9 +125,18 @@ class ProfileUpdateForm(forms.ModelForm):
                 'class': 'form-control',
                 'min': '0',
                 'step': '1000'
-            })
+            }),
+            'time_zone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Africa/Kampala'}),
         }
 
+    def clean_time_zone(self):
+        name = self.cleaned_data['time_zone'].strip()
+        try:
+            ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValidationError('Unknown time zone')
+        return name
+
     def clean_low_balance_threshold(self):
         threshold = self.cleaned_data['low_balance_threshold']
         if threshold < 0:
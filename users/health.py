@@ -0,0 +1,138 @@
+"""Financial health scores, precomputed in batches.
+
+The recalculate_health_scores command scores every profile in chunks. Each
+chunk costs a fixed number of grouped queries (budgets, spending from the
+monthly rollups, data versions) and is written back with a single
+bulk_update. The stored factors record the DataVersion and month they were
+computed for, so the profile page can reuse them until the user's data
+changes or a new month starts.
+"""
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from budgets.models import Budget
+from expenses.models import MonthlyCategoryRollup
+from expenses.timeseries import add_months
+from .models import DataVersion, Profile
+
+BATCH_SIZE = 500
+
+
+def score(profile, total_budget, total_spent):
+    """Return (total score, factors) for a profile given its budget and spending this month"""
+    total_score = 0
+    factors = []
+
+    # 1. Savings Rate (30 points)
+    if profile.monthly_income > 0:
+        savings_rate = (profile.savings_amount / profile.monthly_income) * Decimal('100')
+        savings_points = min(30, int(savings_rate * Decimal('1.5')))  # 20% savings = full points
+        factors.append({
+            'name': 'Savings Rate',
+            'score': savings_points,
+            'max': 30,
+            'description': 'Percentage of income being saved'
+        })
+        total_score += savings_points
+
+    # 2. Budget Adherence (25 points)
+    if total_budget > 0:
+        budget_ratio = (total_spent / total_budget) * 100
+        if budget_ratio <= 100:
+            budget_points = 25
+        else:
+            budget_points = max(0, 25 - int((budget_ratio - 100) / 4))
+    else:
+        budget_points = 0
+    factors.append({
+        'name': 'Budget Adherence',
+        'score': budget_points,
+        'max': 25,
+        'description': 'How well you stick to your budget'
+    })
+    total_score += budget_points
+
+    # 3. Bill Payment History (25 points)
+    bill_points = min(25, profile.bill_payment_streak)
+    factors.append({
+        'name': 'Bill Payment History',
+        'score': bill_points,
+        'max': 25,
+        'description': 'Consistent bill payment streak'
+    })
+    total_score += bill_points
+
+    return total_score, factors
+
+
+def _score_batch(profiles):
+    """Score a list of profiles with one grouped query per input and save them with bulk_update"""
+    user_ids = [profile.user_id for profile in profiles]
+    months = {profile.user_id: profile.local_today().replace(day=1) for profile in profiles}
+    first, last = min(months.values()), max(months.values())
+
+    budgets = {
+        (row['user_id'], row['month_start']): row['total']
+        for row in Budget.objects.filter(user_id__in=user_ids, month__gte=first, month__lt=add_months(last, 1))
+        .annotate(month_start=TruncMonth('month'))
+        .values('user_id', 'month_start')
+        .annotate(total=Sum('limit'))
+        .order_by()
+    }
+    spent = {
+        (row['user_id'], row['month']): row['total']
+        for row in MonthlyCategoryRollup.objects.filter(user_id__in=user_ids, month__gte=first, month__lte=last)
+        .values('user_id', 'month')
+        .annotate(total=Sum('total'))
+        .order_by()
+    }
+
+    # Users who have never had a version get one now, so later changes bump it
+    versions = dict(DataVersion.objects.filter(user_id__in=user_ids).values_list('user_id', 'version'))
+    missing = [user_id for user_id in user_ids if user_id not in versions]
+    if missing:
+        DataVersion.objects.bulk_create([DataVersion(user_id=user_id) for user_id in missing],
+                                        ignore_conflicts=True)
+        versions.update(DataVersion.objects.filter(user_id__in=missing).values_list('user_id', 'version'))
+
+    now = timezone.now().isoformat()
+    for profile in profiles:
+        month = months[profile.user_id]
+        total_score, factors = score(profile, budgets.get((profile.user_id, month), 0),
+                                     spent.get((profile.user_id, month), 0))
+        profile.financial_health_score = total_score
+        profile.financial_health_factors = {
+            'score': total_score,
+            'factors': factors,
+            'last_updated': now,
+            'month': f'{month:%Y-%m}',
+            'data_version': versions[profile.user_id],
+        }
+    # bulk_update skips post_save, so storing the score does not bump the data version
+    Profile.objects.bulk_update(profiles, ['financial_health_score', 'financial_health_factors'])
+
+
+def recalculate(profiles=None, batch_size=BATCH_SIZE):
+    """Rescore the given profiles (all by default) in chunks; return how many were scored"""
+    profiles = (Profile.objects.all() if profiles is None else profiles).order_by('pk')
+    scored, last_pk = 0, 0
+    while True:
+        chunk = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+        if not chunk:
+            return scored
+        _score_batch(chunk)
+        scored += len(chunk)
+        last_pk = chunk[-1].pk
+
+
+def current(profile):
+    """Return the profile's (score, factors), rescoring it only if its data or month has changed"""
+    stored = profile.financial_health_factors or {}
+    version = DataVersion.for_user(profile.user).version
+    if stored.get('data_version') != version or stored.get('month') != f'{profile.local_today():%Y-%m}':
+        _score_batch([profile])
+        stored = profile.financial_health_factors
+    return stored['score'], stored['factors']
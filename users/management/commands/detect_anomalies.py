@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.anomalies import BATCH_SIZE, WINDOW, detect
+
+
+class Command(BaseCommand):
+    help = "Flag unusually high category spending in each user's current month."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=WINDOW,
+                            help='Months of history each category is compared with.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Users processed per batch.')
+
+    def handle(self, *args, **options):
+        flagged = detect(window=options['months'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Flagged {flagged} spending anomalies'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.health import BATCH_SIZE, recalculate
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the financial health score of every user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Profiles scored and written per batch.')
+
+    def handle(self, *args, **options):
+        scored = recalculate(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recalculated {scored} health scores'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.balances import BATCH_SIZE, snapshot_all
+
+
+class Command(BaseCommand):
+    help = "Record today's running balance of every user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Users snapshotted per batch.')
+
+    def handle(self, *args, **options):
+        done = snapshot_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recorded balances for {done} users'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='time_zone',
+            field=models.CharField(default='UTC', help_text="IANA time zone name used for the user's days and months", max_length=64),
+        ),
+    ]
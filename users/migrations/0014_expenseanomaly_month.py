@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_profile_time_zone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenseanomaly',
+            name='month',
+            field=models.DateField(blank=True, help_text='First day of the month the spending fell in', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='expenseanomaly',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'month'), name='unique_expense_anomaly'),
+        ),
+    ]
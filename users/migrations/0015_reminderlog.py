@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_expenseanomaly_month'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bill', 'Bill due'), ('goal', 'Goal deadline'), ('low_balance', 'Low balance')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('key', models.CharField(max_length=20)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id', 'key'), name='unique_reminder_log')],
+            },
+        ),
+    ]
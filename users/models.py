@@ -1,3 +1,6 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models.signals import post_save
@@ -17,6 +20,8 @@ class Profile(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     low_balance_threshold = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    time_zone = models.CharField(max_length=64, default=settings.TIME_ZONE,
+                                help_text="IANA time zone name used for the user's days and months")
     
     # Financial Status Fields
     savings_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -39,6 +44,17 @@ class Profile(models.Model):
     expense_anomaly_alerts = models.BooleanField(default=True)
     weekly_report_enabled = models.BooleanField(default=True)
     
+    def local_zone(self):
+        """Return the user's time zone, or the site's if it is not a valid one"""
+        try:
+            return ZoneInfo(self.time_zone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return timezone.get_default_timezone()
+
+    def local_today(self):
+        """Return today's date in the user's time zone"""
+        return timezone.localdate(timezone=self.local_zone())
+    
     def calculate_savings_progress(self):
         if self.savings_target > 0:
             return (self.savings_amount / self.savings_target) * 100
@@ -196,13 +212,88 @@ class SavingsGoal(models.Model):
         return f"{self.user.username}'s {self.name} Goal"
 
 class ExpenseAnomaly(models.Model):
+    """Unusually high spending in a category for one month, found by the detect_anomalies command"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.CharField(max_length=100)
+    month = models.DateField(null=True, blank=True, help_text="First day of the month the spending fell in")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     usual_amount = models.DecimalField(max_digits=10, decimal_places=2)
     percentage_change = models.DecimalField(max_digits=10, decimal_places=2)
     date_detected = models.DateTimeField(auto_now_add=True)
     is_acknowledged = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'month'], name='unique_expense_anomaly'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s anomaly in {self.category}"
+
+class ReminderLog(models.Model):
+    """A reminder email that has been sent, so send_reminders never sends it twice"""
+    KIND_CHOICES = [
+        ('bill', 'Bill due'),
+        ('goal', 'Goal deadline'),
+        ('low_balance', 'Low balance'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # The bill, goal or (for low balance alerts) user the reminder was about
+    object_id = models.PositiveIntegerField()
+    # What the reminder was for: the due date, the deadline or the month
+    key = models.CharField(max_length=20)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'key'], name='unique_reminder_log'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for {self.user.username} ({self.key})"
+
+class BalanceSnapshot(models.Model):
+    """A user's running balance at the end of a day, maintained by users.balances.
+
+    `income` is everything received from income sources up to the day and
+    `spent` every expense dated up to it; the profile's savings are added when
+    the balance is read.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots')
+    date = models.DateField()
+    income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_balance_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} on {self.date}: {self.income - self.spent}"
+
+class DataVersion(models.Model):
+    """Counter bumped whenever any of a user's financial data changes.
+
+    The REST API derives ETag and Last-Modified headers from it, so unchanged
+    resources are answered with 304 Not Modified without being serialized.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='data_version')
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.username}: v{self.version}"
+
+    @classmethod
+    def for_user(cls, user):
+        return cls.objects.get_or_create(user=user)[0]
+
+    @classmethod
+    def bump(cls, user_ids):
+        # Users without a row have never been served a version, so there is nothing to bump
+        cls.objects.filter(user_id__in=set(user_ids)).update(
+            version=models.F('version') + 1, updated_at=timezone.now()
+        )
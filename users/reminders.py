@@ -0,0 +1,121 @@
+"""Reminder emails for bills, goal deadlines and low balances (send_reminders).
+
+Candidates are read in primary-key chunks with their users selected in the
+same query. Every reminder is recorded in ReminderLog, keyed by what it was
+about (the bill's due date, the goal's deadline or the month), so rerunning
+the command never repeats one. Each chunk's emails go out with a single
+send_mass_mail call over one SMTP connection that is shared by the whole run.
+Low-balance alerts read the running balances kept by users.balances.
+"""
+from datetime import timedelta
+
+from django.core.mail import get_connection, send_mass_mail
+from django.utils import timezone
+
+from . import balances
+from .models import FinanceGoal, Profile, RecurringBill, ReminderLog
+
+FROM_EMAIL = 'noreply@yourapp.com'
+BATCH_SIZE = 500
+GOAL_NOTICE_DAYS = 3
+# Bills are reminded `reminder_days` before they are due, up to this many
+MAX_REMINDER_DAYS = 31
+
+
+def _chunks(queryset, batch_size):
+    queryset = queryset.order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def _send(connection, kind, reminders):
+    """Send the (user, object_id, key, subject, message) reminders not sent before; return how many went out"""
+    sent = set(ReminderLog.objects.filter(
+        kind=kind, object_id__in={object_id for user, object_id, key, subject, message in reminders}
+    ).values_list('object_id', 'key'))
+    reminders = [reminder for reminder in reminders if (reminder[1], reminder[2]) not in sent]
+    if not reminders:
+        return 0
+
+    send_mass_mail(
+        [(subject, message, FROM_EMAIL, [user.email]) for user, object_id, key, subject, message in reminders],
+        connection=connection,
+    )
+    ReminderLog.objects.bulk_create([
+        ReminderLog(user=user, kind=kind, object_id=object_id, key=key)
+        for user, object_id, key, subject, message in reminders
+    ], ignore_conflicts=True)
+    return len(reminders)
+
+
+def bill_reminders(today, batch_size=BATCH_SIZE):
+    bills = (
+        RecurringBill.objects.filter(
+            is_active=True, due_date__range=[today, today + timedelta(days=MAX_REMINDER_DAYS)],
+            user__profile__email_notifications=True, user__profile__bills_notification_enabled=True,
+        )
+        .exclude(payment_status='paid')
+        .exclude(user__email='')
+        .select_related('user')
+    )
+    for chunk in _chunks(bills, batch_size):
+        yield [
+            (bill.user, bill.pk, bill.due_date.isoformat(), f"Upcoming Bill: {bill.name}",
+             f"Hi {bill.user.username},\n\nYour bill '{bill.name}' of UGX {bill.amount} is due on {bill.due_date}.")
+            for bill in chunk
+            if (bill.due_date - today).days <= bill.reminder_days
+        ]
+
+
+def goal_reminders(today, batch_size=BATCH_SIZE):
+    goals = (
+        FinanceGoal.objects.filter(
+            is_completed=False, deadline__range=[today, today + timedelta(days=GOAL_NOTICE_DAYS)],
+            user__profile__email_notifications=True,
+        )
+        .exclude(user__email='')
+        .select_related('user')
+    )
+    for chunk in _chunks(goals, batch_size):
+        yield [
+            (goal.user, goal.pk, goal.deadline.isoformat(), f"Goal Deadline Approaching: {goal.title}",
+             f"Hi {goal.user.username},\n\nYour goal '{goal.title}' deadline is on {goal.deadline}.")
+            for goal in chunk
+        ]
+
+
+def low_balance_reminders(batch_size=BATCH_SIZE):
+    profiles = (
+        Profile.objects.filter(low_balance_threshold__gt=0, email_notifications=True)
+        .exclude(user__email='')
+        .select_related('user')
+    )
+    for chunk in _chunks(profiles, batch_size):
+        current = balances.balances(chunk)
+        yield [
+            (profile.user, profile.user_id, f'{profile.local_today():%Y-%m}', "Low Balance Alert",
+             f"Hi {profile.user.username},\n\nYour balance is UGX {current[profile.user_id]:,.2f}, below your "
+             f"threshold of UGX {profile.low_balance_threshold}.")
+            for profile in chunk
+            if current[profile.user_id] < profile.low_balance_threshold
+        ]
+
+
+def send_reminders(today=None, batch_size=BATCH_SIZE, connection=None):
+    """Send every reminder that is due and not yet sent; return {kind: number sent}"""
+    today = today or timezone.localdate()
+    batches = {
+        'bill': bill_reminders(today, batch_size),
+        'goal': goal_reminders(today, batch_size),
+        'low_balance': low_balance_reminders(batch_size),
+    }
+    counts = {}
+    with connection or get_connection() as connection:
+        for kind, chunks in batches.items():
+            counts[kind] = sum(_send(connection, kind, reminders) for reminders in chunks)
+    return counts
@@ -1,3 +1,248 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from budgets.models import Budget
+from expenses.models import Category, Expense
+from expenses.timeseries import add_months
+from . import anomalies, balances, health, reminders
+from .models import (
+    BalanceSnapshot, ExpenseAnomaly, FinanceGoal, IncomeSource, Profile, RecurringBill, ReminderLog,
+)
+
+
+class FinancialHealthTests(TestCase):
+    def make_user(self, name, spent, limit):
+        user = User.objects.create_user(name, password='secret')
+        profile = user.profile
+        profile.monthly_income, profile.savings_amount, profile.bill_payment_streak = Decimal('1000'), Decimal('100'), 4
+        profile.save()
+        month = timezone.localdate().replace(day=1)
+        housing = Category.objects.create(user=user, name='Housing')
+        Budget.objects.create(user=user, category=housing, limit=Decimal(limit), month=month)
+        Expense.objects.create(user=user, category=housing, amount=Decimal(spent), description='Rent', date=month)
+        return user
+
+    def test_batch_scores_every_user_with_constant_queries(self):
+        self.make_user('ann', 80, 100)
+        self.make_user('ben', 140, 100)
+        with CaptureQueriesContext(connection) as small:
+            call_command('recalculate_health_scores', stdout=StringIO())
+
+        for name in ('cal', 'dee', 'eve'):
+            self.make_user(name, 50, 100)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(health.recalculate(), 5)
+        self.assertEqual(len(small), len(large))
+
+        scores = dict(Profile.objects.values_list('user__username', 'financial_health_score'))
+        # 15 savings + 4 bill streak, plus 25 within budget or 15 at 140% of budget
+        self.assertEqual(scores, {'ann': 44, 'ben': 34, 'cal': 44, 'dee': 44, 'eve': 44})
+
+    def test_profile_reuses_stored_score_until_data_changes(self):
+        user = self.make_user('fay', 80, 100)
+        # Logging in saves the profile, which counts as a data change
+        self.client.force_login(user)
+        health.recalculate()
+
+        with mock.patch.object(health, '_score_batch', wraps=health._score_batch) as rescore:
+            response = self.client.get(reverse('profile'))
+            self.assertEqual(response.context['financial_health']['total_score'], 44)
+            rescore.assert_not_called()
+
+            Expense.objects.create(user=user, amount=Decimal('60'), description='Food',
+                                   date=timezone.localdate().replace(day=1))
+            response = self.client.get(reverse('profile'))
+            rescore.assert_called_once()
+        # 140% of budget
+        self.assertEqual(response.context['health_score'], 34)
+        self.assertEqual(Profile.objects.get(user=user).financial_health_score, 34)
+
+    def test_new_month_rescores(self):
+        user = self.make_user('gus', 80, 100)
+        health.recalculate()
+        profile = Profile.objects.get(user=user)
+        with mock.patch.object(Profile, 'local_today', return_value=date(2099, 1, 15)):
+            score, factors = health.current(profile)
+        # No budget in that month
+        self.assertEqual(score, 19)
+        self.assertEqual(profile.financial_health_factors['month'], '2099-01')
+
+
+class AnomalyDetectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('hal', password='secret')
+        self.month = timezone.localdate().replace(day=1)
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.transport = Category.objects.create(user=self.user, name='Transport')
+        for months_ago, food, transport in [(4, 100, 50), (3, 110, 55), (2, 90, 45), (1, 105, 50), (0, 400, 60)]:
+            day = add_months(self.month, -months_ago)
+            Expense.objects.create(user=self.user, category=self.food, amount=Decimal(food), description='Food', date=day)
+            Expense.objects.create(user=self.user, category=self.transport, amount=Decimal(transport),
+                                   description='Bus', date=day)
+        # Too little history to judge
+        Expense.objects.create(user=self.user, amount=Decimal('500'), description='Gift', date=self.month)
+
+    def test_flags_outliers_against_median_history(self):
+        self.assertEqual(anomalies.detect(), 1)
+        anomaly = ExpenseAnomaly.objects.get()
+        self.assertEqual((anomaly.category, anomaly.month), ('Food', self.month))
+        self.assertEqual((anomaly.amount, anomaly.usual_amount), (Decimal('400'), Decimal('102.50')))
+
+    def test_rerun_keeps_acknowledged_and_drops_corrected(self):
+        anomalies.detect()
+        ExpenseAnomaly.objects.update(is_acknowledged=True)
+        anomalies.detect()
+        self.assertTrue(ExpenseAnomaly.objects.get().is_acknowledged)
+
+        ExpenseAnomaly.objects.update(is_acknowledged=False)
+        Expense.objects.filter(user=self.user, amount=Decimal('400')).update(amount=Decimal('120'))
+        self.assertEqual(anomalies.detect(), 0)
+        self.assertFalse(ExpenseAnomaly.objects.exists())
+
+    def test_queries_do_not_grow_with_users(self):
+        with CaptureQueriesContext(connection) as one:
+            anomalies.detect()
+        for name in ('ida', 'jon', 'kim'):
+            user = User.objects.create_user(name, password='secret')
+            Expense.objects.create(user=user, amount=Decimal('10'), description='Tea', date=self.month)
+        ExpenseAnomaly.objects.all().delete()
+        with CaptureQueriesContext(connection) as many:
+            anomalies.detect()
+        self.assertEqual(len(one), len(many))
+
+    def test_views_read_unacknowledged_anomalies(self):
+        anomalies.detect()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual([anomaly.category for anomaly in response.context['anomalies']], ['Food'])
+        response = self.client.get(reverse('budget_list'))
+        self.assertTrue(any('Unusual spending in Food' in alert['message']
+                            for alert in response.context['spending_alerts']))
+
+        anomaly = ExpenseAnomaly.objects.get()
+        response = self.client.post(reverse('acknowledge_anomaly', args=[anomaly.id]),
+                                    {'next': 'https://evil.example.com/'})
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(list(response.context['anomalies']), [])
+
+        response = self.client.post(reverse('acknowledge_anomaly', args=[anomaly.id]),
+                                    {'next': reverse('budget_list')})
+        self.assertRedirects(response, reverse('budget_list'), fetch_redirect_response=False)
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.user = User.objects.create_user('ivy', email='ivy@example.com', password='secret')
+        profile = self.user.profile
+        profile.low_balance_threshold = Decimal('10')
+        profile.save()
+        IncomeSource.objects.create(user=self.user, name='Job', amount=Decimal('100'), frequency='monthly')
+        Expense.objects.create(user=self.user, amount=Decimal('150'), description='Rent', date=self.today)
+
+        self.due = RecurringBill.objects.create(user=self.user, name='Power', amount=Decimal('30'),
+                                                due_date=self.today + timedelta(days=2), frequency='monthly')
+        RecurringBill.objects.create(user=self.user, name='Water', amount=Decimal('20'), frequency='monthly',
+                                     due_date=self.today + timedelta(days=10))
+        RecurringBill.objects.create(user=self.user, name='Rent', amount=Decimal('90'), frequency='monthly',
+                                     due_date=self.today + timedelta(days=1), payment_status='paid')
+        FinanceGoal.objects.create(user=self.user, title='Laptop', target_amount=Decimal('500'),
+                                   deadline=self.today + timedelta(days=1))
+
+    def test_sends_each_reminder_once(self):
+        counts = reminders.send_reminders()
+        self.assertEqual(counts, {'bill': 1, 'goal': 1, 'low_balance': 1})
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['Goal Deadline Approaching: Laptop', 'Low Balance Alert', 'Upcoming Bill: Power'])
+        low_balance = next(message for message in mail.outbox if message.subject == 'Low Balance Alert')
+        self.assertIn('UGX -50.00', low_balance.body)
+
+        call_command('send_reminders', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+        # A bill's next due date is a new reminder
+        self.due.due_date += timedelta(days=1)
+        self.due.save()
+        self.assertEqual(reminders.send_reminders()['bill'], 1)
+
+    def test_queries_do_not_grow_with_reminders(self):
+        balances.snapshot_all()
+        with CaptureQueriesContext(connection) as few:
+            reminders.send_reminders(today=self.today - timedelta(days=1))
+        for i in range(5):
+            RecurringBill.objects.create(user=self.user, name=f'Bill {i}', amount=Decimal('5'), frequency='monthly',
+                                         due_date=self.today + timedelta(days=1))
+        ReminderLog.objects.all().delete()
+        with CaptureQueriesContext(connection) as many:
+            reminders.send_reminders(today=self.today - timedelta(days=1))
+        self.assertEqual(len(few), len(many))
+
+
+class BalanceLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jay', password='secret')
+        self.profile = self.user.profile
+        self.profile.savings_amount = Decimal('20')
+        self.profile.save()
+        self.today = self.profile.local_today()
+        source = IncomeSource.objects.create(user=self.user, name='Job', amount=Decimal('100'), frequency='weekly')
+        # Paid weekly for the last three weeks, today included
+        IncomeSource.objects.filter(pk=source.pk).update(created_at=timezone.now() - timedelta(days=14))
+        Expense.objects.create(user=self.user, amount=Decimal('50'), description='Rent',
+                               date=self.today - timedelta(days=3))
+
+    def test_payments_follow_the_frequency(self):
+        self.assertEqual(balances.payments('monthly', date(2023, 1, 31), date(2023, 2, 28)), 2)
+        self.assertEqual(balances.payments('monthly', date(2024, 1, 31), date(2024, 2, 28)), 1)
+        self.assertEqual(balances.payments('weekly', date(2024, 1, 1), date(2024, 1, 14)), 2)
+        self.assertEqual(balances.payments('yearly', date(2023, 3, 1), date(2024, 3, 1)), 2)
+        self.assertEqual(balances.payments('daily', date(2024, 1, 2), date(2024, 1, 1)), 0)
+
+    def test_balance_is_a_snapshot_read_kept_current_by_expense_writes(self):
+        self.assertEqual(balances.balance(self.profile), Decimal('270'))
+        with self.assertNumQueries(1):
+            self.assertEqual(balances.balance(self.profile), Decimal('270'))
+
+        expense = Expense.objects.create(user=self.user, amount=Decimal('30'), description='Food', date=self.today)
+        expense.amount = Decimal('40')
+        expense.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(balances.balance(self.profile), Decimal('230'))
+        expense.delete()
+        self.assertEqual(balances.balance(self.profile), Decimal('270'))
+
+    def test_snapshot_carries_forward_from_an_older_one(self):
+        BalanceSnapshot.objects.create(user=self.user, date=self.today - timedelta(days=2), income=Decimal('0'),
+                                       spent=Decimal('50'))
+        Expense.objects.create(user=self.user, amount=Decimal('5'), description='Tea', date=self.today)
+        call_command('snapshot_balances', stdout=StringIO())
+        row = BalanceSnapshot.objects.get(user=self.user, date=self.today)
+        self.assertEqual((row.income, row.spent), (Decimal('300'), Decimal('55')))
+
+    def test_snapshot_after_the_day_is_not_the_anchor(self):
+        # Spending is carried from the anchor, so a recompute from history would give 50
+        BalanceSnapshot.objects.create(user=self.user, date=self.today - timedelta(days=1), income=Decimal('0'),
+                                       spent=Decimal('40'))
+        BalanceSnapshot.objects.create(user=self.user, date=self.today + timedelta(days=2), income=Decimal('0'),
+                                       spent=Decimal('70'))
+        self.assertEqual(balances.snapshot([self.profile])[self.user.pk].spent, Decimal('40'))
+
+    def test_income_and_bulk_changes_drop_stale_snapshots(self):
+        balances.balance(self.profile)
+        IncomeSource.objects.create(user=self.user, name='Gift', amount=Decimal('10'), frequency='monthly')
+        self.assertEqual(balances.balance(self.profile), Decimal('280'))
 
-# Create your tests here.
+        Expense.objects.filter(user=self.user).update(amount=Decimal('80'))
+        self.assertEqual(balances.balance(self.profile), Decimal('250'))
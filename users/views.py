@@ -2,11 +2,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.contrib.auth.models import User
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.db.models import Sum
 from django.utils import timezone
-import calendar
+from django.utils.http import url_has_allowed_host_and_scheme
 import datetime
 from decimal import Decimal
 from .forms import (
@@ -15,11 +14,12 @@ from .forms import (
     SavingsForm
 )
 from .models import (
-    Profile, IncomeSource, FinanceGoal, FamilyMember, ActivityLog,
-    RecurringBill, SavingsGoal, ExpenseAnomaly, InAppNotification
+    IncomeSource, FinanceGoal, FamilyMember, ActivityLog,
+    RecurringBill, SavingsGoal, ExpenseAnomaly
 )
 from budgets.models import Budget
-from expenses.models import Expense, Category
+from expenses import rollups
+from . import health
 
 # Create your views here.
 
@@ -34,78 +34,6 @@ def signup(request):
         form = UserCreationForm()
     return render(request, 'users/signup.html', {'form': form})
 
-def calculate_financial_health(user):
-    """Calculate financial health score and factors"""
-    profile = user.profile
-    total_score = 0
-    factors = []
-    
-    # 1. Savings Rate (30 points)
-    if profile.monthly_income > 0:
-        savings_rate = (profile.savings_amount / profile.monthly_income) * Decimal('100')
-        savings_points = min(30, int(savings_rate * Decimal('1.5')))  # 20% savings = full points
-        factors.append({
-            'name': 'Savings Rate',
-            'score': savings_points,
-            'max': 30,
-            'description': 'Percentage of income being saved'
-        })
-        total_score += savings_points
-
-    # 2. Budget Adherence (25 points)    
-    today = timezone.now()
-    _, last_day = calendar.monthrange(today.year, today.month)
-    month_start = today.replace(day=1)
-    month_end = today.replace(day=last_day)
-    
-    total_budget = Budget.objects.filter(
-        user=user,
-        month__year=today.year,
-        month__month=today.month
-    ).aggregate(Sum('limit'))['limit__sum'] or 0
-    
-    total_spent = Expense.objects.filter(
-        user=user,
-        date__range=[month_start, month_end]
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    if total_budget > 0:
-        budget_ratio = (total_spent / total_budget) * 100
-        if budget_ratio <= 100:
-            budget_points = 25
-        else:
-            budget_points = max(0, 25 - int((budget_ratio - 100) / 4))
-    else:
-        budget_points = 0
-    
-    factors.append({
-        'name': 'Budget Adherence',
-        'score': budget_points,
-        'max': 25,
-        'description': 'How well you stick to your budget'
-    })
-    total_score += budget_points
-
-    # 3. Bill Payment History (25 points)
-    bill_points = min(25, profile.bill_payment_streak)
-    factors.append({
-        'name': 'Bill Payment History',
-        'score': bill_points,
-        'max': 25,
-        'description': 'Consistent bill payment streak'
-    })
-    total_score += bill_points
-
-    # Update profile with new score and factors
-    profile.financial_health_score = total_score
-    profile.financial_health_factors = {
-        'score': total_score,
-        'factors': factors,
-        'last_updated': timezone.now().isoformat()    }
-    profile.save()
-
-    return total_score, factors
-
 @login_required
 def profile(request):
     image_form = ProfileImageForm(instance=request.user.profile)
@@ -159,21 +87,12 @@ def profile(request):
     monthly_target = request.user.profile.monthly_savings_target
     savings_progress = (total_savings / monthly_target * 100) if monthly_target > 0 else 0
     
-    # Import necessary models for budget and expense data
-    from budgets.models import Budget
-    from expenses.models import Expense, Category
-    from django.db.models import Sum
-    from django.utils import timezone
-    import datetime
-    
     # Get current month's data
     today = timezone.now().date()
     first_day_current_month = today.replace(day=1)
-    last_day_current_month = (today.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
     
     # Get previous month's data for comparison
     first_day_prev_month = (first_day_current_month - datetime.timedelta(days=1)).replace(day=1)
-    last_day_prev_month = first_day_current_month - datetime.timedelta(days=1)
     
     # Budget data
     current_month_budgets = Budget.objects.filter(
@@ -184,25 +103,17 @@ def profile(request):
     total_budget = current_month_budgets.aggregate(Sum('limit'))['limit__sum'] or 0
     
     # Expense data
-    current_month_expenses = Expense.objects.filter(
-        user=request.user,
-        date__range=[first_day_current_month, last_day_current_month]
-    )
-    prev_month_expenses = Expense.objects.filter(
-        user=request.user,
-        date__range=[first_day_prev_month, last_day_prev_month]
-    )
-    
-    total_spent = current_month_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    prev_month_spent = prev_month_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
+    total_spent = rollups.month_total(request.user, first_day_current_month)
+    prev_month_spent = rollups.month_total(request.user, first_day_prev_month)
     
     # Calculate budget utilization
     budget_utilization = (total_spent / total_budget * 100) if total_budget > 0 else 0
     
     # Calculate top spending category
-    category_spending = current_month_expenses.values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')
+    category_spending = [
+        {'category__name': row['category__name'], 'total': row['category_total']}
+        for row in rollups.category_totals(request.user, first_day_current_month)
+    ]
     
     top_category = category_spending[0]['category__name'] if category_spending else "None"
     monthly_spending = total_spent
@@ -231,49 +142,13 @@ def profile(request):
                 'days_left': days_until_due
             })
 
-    # Detect expense anomalies
-    anomalies = []
-    if category_spending and len(category_spending) > 0:
-        # Get average spending per category over last 3 months
-        three_months_ago = first_day_prev_month - datetime.timedelta(days=60)
-        
-        hist_expenses = Expense.objects.filter(
-            user=request.user,
-            date__range=[three_months_ago, last_day_prev_month]
-        )
-        
-        hist_category_spending = hist_expenses.values('category__name').annotate(
-            total=Sum('amount')
-        )
-        
-        # Convert to dictionary for easy lookup
-        avg_spending = {}
-        for item in hist_category_spending:
-            avg_spending[item['category__name']] = item['total'] / 3  # 3 months
-        
-        # Find anomalies (spending 50% more than average)
-        for item in category_spending:
-            category = item['category__name']
-            current_amount = item['total']
-            if category in avg_spending and avg_spending[category] > 0:
-                avg_amount = avg_spending[category]
-                if current_amount > (avg_amount * 1.5):  # 50% increase threshold
-                    pct_change = ((current_amount - avg_amount) / avg_amount) * 100
-                    anomalies.append({
-                        'category': category,
-                        'current': current_amount,
-                        'usual': avg_amount,
-                        'percent': pct_change
-                    })
-    
-    # Calculate financial health score
-    health_score, health_factors = calculate_financial_health(request.user)
+    # Spending anomalies, flagged nightly by detect_anomalies
+    anomalies = ExpenseAnomaly.objects.filter(
+        user=request.user, is_acknowledged=False
+    ).order_by('-month', '-percentage_change')[:5]
     
-    # Update profile with health score
-    profile = request.user.profile
-    profile.financial_health_score = health_score
-    profile.last_score_update = timezone.now()
-    profile.save()
+    # Financial health score, precomputed by recalculate_health_scores
+    health_score, health_factors = health.current(request.user.profile)
     
     # Get active savings goals for simulator
     savings_goals = SavingsGoal.objects.filter(user=request.user)
@@ -315,7 +190,8 @@ def profile(request):
         'anomalies': anomalies,
         'savings_goals': savings_goals,
         'health_score': health_score,
-        'health_factors': health_factors
+        'health_factors': health_factors,
+        'financial_health': {'total_score': health_score, 'factors': health_factors},
     }
     
     return render(request, 'users/profile.html', context)
@@ -460,6 +336,16 @@ def mark_bill_paid(request, bill_id):
     messages.success(request, 'Bill marked as paid!')
     return redirect('profile')
 
+@login_required
+def acknowledge_anomaly(request, anomaly_id):
+    if request.method == 'POST':
+        ExpenseAnomaly.objects.filter(id=anomaly_id, user=request.user).update(is_acknowledged=True)
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()},
+                                                    require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect('profile')
+
 @login_required
 def add_savings_goal(request):
     if request.method == 'POST':